@@ -4,11 +4,39 @@ from __future__ import annotations
 import logging
 import os
 import sys
+from functools import partial
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
-from twilio.rest import Client
+from twilio.twiml.messaging_response import MessagingResponse
 import google.generativeai as genai
 
+from config import (
+    DEADLINE_SEND_RESERVE,
+    GEMINI_CALL_TIMEOUT,
+    WEBHOOK_ASYNC,
+    WEBHOOK_ASYNC_DEADLINE,
+    WEBHOOK_DEADLINE,
+)
+from model.assistant import gemini_breaker, gemini_limiter, model_registry, response_cache, semantic_cache
+from services import (
+    CircuitOpen,
+    Deadline,
+    DeadlineExceeded,
+    RateLimited,
+    current_status_buffer,
+    deadline_scope,
+    get_messenger,
+    get_tramite_status,
+    get_webhook_dedup,
+    get_webhook_pool,
+    remaining_timeout,
+    reserving,
+    run_with_deadline,
+    twilio_signature_valid,
+)
+from services.dedup import IN_FLIGHT, NEW
+from services.resilience import call_with_deadline
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -24,12 +52,16 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
 
+# Servicio de envío compartido (pool HTTP keep-alive y cola acotada)
 try:
-    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-    logger.info("✅ Twilio inicializado correctamente")
+    messenger = get_messenger()
+    if messenger:
+        logger.info("✅ Twilio inicializado correctamente")
+    else:
+        logger.error("❌ Twilio sin credenciales")
 except Exception as e:
     logger.error(f"❌ Error al inicializar Twilio: {e}")
-    twilio_client = None
+    messenger = None
 
 # Google Gemini setup
 try:
@@ -41,6 +73,43 @@ except Exception as e:
     model = None
 
 
+def _procesar_webhook(sender, incoming_msg, message_sid='', firmado=False):
+    """Genera la respuesta con Gemini y la envía por WhatsApp. Retorna el SID.
+
+    Respeta el plazo activo: Gemini dispone de él menos la reserva para el envío.
+    El SID enviado queda registrado para responder a los reintentos de Twilio.
+    El estado de trámites solo se consulta si la petición venía firmada por Twilio.
+    """
+    dedup = get_webhook_dedup()
+    consulta_estado = get_tramite_status() if firmado else None
+    try:
+        # "¿Cómo va mi trámite?" se responde desde MySQL, sin pasar por Gemini
+        reply_text = consulta_estado.answer(sender, incoming_msg) if consulta_estado else None
+        if reply_text is None:
+            with reserving(DEADLINE_SEND_RESERVE):
+                timeout = remaining_timeout(GEMINI_CALL_TIMEOUT, "llamar a Gemini")
+                # El turno del limitador se mantiene hasta que la llamada termina de verdad;
+                # el circuito se consulta ya con turno para no contar la cola local como fallo
+                response = call_with_deadline(
+                    lambda: model.generate_content(incoming_msg), timeout,
+                    limiter=gemini_limiter,
+                    queue_timeout=remaining_timeout(None, "esperar turno de Gemini"),
+                    breaker=gemini_breaker,
+                )
+            reply_text = response.text[:160]
+
+            logger.info(f"🤖 Respuesta Gemini: {reply_text}")
+
+        twilio_msg = messenger.send(sender, reply_text, from_=f"whatsapp:{TWILIO_PHONE_NUMBER}")
+    except Exception:
+        dedup.fail(message_sid)
+        raise
+    dedup.complete(message_sid, twilio_msg.sid)
+
+    logger.info(f"✅ Mensaje enviado: {twilio_msg.sid}")
+    return twilio_msg.sid
+
+
 def create_app():
     """Crear y configurar la aplicación Flask."""
     app = Flask(__name__)
@@ -57,6 +126,12 @@ def create_app():
         try:
             incoming_msg = request.values.get('Body', '').strip()
             sender = request.values.get('From')
+            message_sid = request.values.get('MessageSid', '')
+            # Sin firma válida no se consulta MySQL por ``From`` (cualquiera puede enviarlo)
+            firmado = twilio_signature_valid(
+                request.url, request.form, request.headers.get('X-Twilio-Signature'),
+                request.headers.get('X-Forwarded-Proto'),
+            )
             
             logger.info(f"📨 Mensaje recibido de {sender}: {incoming_msg}")
             
@@ -66,36 +141,79 @@ def create_app():
             if not model:
                 return jsonify({'error': 'Gemini no configurado'}), 500
             
-            # Generar respuesta con Gemini
-            response = model.generate_content(incoming_msg)
-            reply_text = response.text[:160]
+            if not messenger:
+                return jsonify({'error': 'Twilio no configurado'}), 500
             
-            logger.info(f"🤖 Respuesta Gemini: {reply_text}")
+            # Reintentos de Twilio del mismo MessageSid: no regenerar ni reenviar
+            dedup = get_webhook_dedup()
+            state, sid = dedup.begin(message_sid)
             
-            if not twilio_client:
-                return jsonify({'error': 'Twilio no configurado'}), 500
+            if WEBHOOK_ASYNC:
+                if state != NEW:
+                    logger.info(f"🔁 Reintento de {message_sid} ({state}), se ignora")
+                    return str(MessagingResponse()), 200, {'Content-Type': 'application/xml'}
+                # Responder a Twilio de inmediato; el pool genera y envía
+                deadline = Deadline(WEBHOOK_ASYNC_DEADLINE)
+                # Si vence en cola se libera el MessageSid para que el reintento de Twilio se procese
+                trabajo = partial(run_with_deadline, on_expire=partial(dedup.fail, message_sid))
+                if not get_webhook_pool().submit(trabajo, deadline, _procesar_webhook,
+                                                 sender, incoming_msg, message_sid, firmado):
+                    dedup.fail(message_sid)
+                    logger.warning("⚠️ Cola de webhooks llena, mensaje rechazado")
+                    return jsonify({'error': 'Servicio saturado'}), 503, {'Retry-After': '5'}
+                return str(MessagingResponse()), 200, {'Content-Type': 'application/xml'}
             
-            # Enviar respuesta por WhatsApp
-            twilio_msg = twilio_client.messages.create(
-                body=reply_text,
-                from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
-                to=sender
-            )
+            if state == IN_FLIGHT:
+                sid = dedup.wait_for(message_sid, WEBHOOK_DEADLINE)
+            if state != NEW:
+                logger.info(f"🔁 Reintento de {message_sid}, SID {sid or 'pendiente'}")
+                return jsonify({'status': 'duplicado' if sid else 'en_curso', 'sid': sid}), 200
             
-            logger.info(f"✅ Mensaje enviado: {twilio_msg.sid}")
-            return jsonify({'status': 'sent', 'sid': twilio_msg.sid}), 200
+            # Generar respuesta con Gemini y enviarla por WhatsApp
+            with deadline_scope(Deadline(WEBHOOK_DEADLINE)):
+                sid = _procesar_webhook(sender, incoming_msg, message_sid, firmado)
+            return jsonify({'status': 'sent', 'sid': sid}), 200
             
+        except (RateLimited, CircuitOpen, DeadlineExceeded) as e:
+            logger.warning(f"⚠️ Gemini no disponible: {e}")
+            return jsonify({'error': 'Servicio saturado'}), 503, {'Retry-After': '5'}
         except Exception as e:
             logger.error(f"❌ Error en webhook: {e}")
             return jsonify({'error': str(e)}), 500
 
     @app.route('/test', methods=['GET'])
     def test():
+        # Solo lectura: no crea el buffer de estados (ni su archivo SQLite) si aún no existe
+        status_buffer = current_status_buffer()
         return jsonify({
             'twilio': 'configurado' if TWILIO_ACCOUNT_SID else 'falta',
             'gemini': 'configurado' if os.getenv('GOOGLE_GEMINI_API_KEY') else 'falta',
+            'gemini_models': model_registry.stats(),
+            'response_cache': response_cache.stats(),
+            'semantic_cache': semantic_cache.stats(),
+            'gemini_limiter': gemini_limiter.stats(),
+            'gemini_breaker': gemini_breaker.stats(),
+            'twilio_sender': messenger.stats() if messenger else 'falta',
+            'webhook_queue': get_webhook_pool().stats() if WEBHOOK_ASYNC else 'sincrono',
+            'webhook_dedup': get_webhook_dedup().stats(),
+            'status_callbacks': status_buffer.stats() if status_buffer else 'sin uso',
+            'tramite_status': get_tramite_status().stats() if get_tramite_status() else 'desactivado',
             'mensaje': 'Sistema listo'
         }), 200
+
+    @app.route('/metrics/db', methods=['GET'])
+    def db_metrics():
+        """Latencia de MySQL por sentencia (conexión, ejecución, lectura) y estado de los pools."""
+        from config.mysqlconnections import estadisticas_db
+        return jsonify(estadisticas_db()), 200
+
+    # Rutas de WhatsApp y del chat web (no requieren MySQL)
+    try:
+        from routes import chat_bp, whatsapp_bp
+        app.register_blueprint(chat_bp)
+        app.register_blueprint(whatsapp_bp)
+    except Exception as e:
+        logger.error(f"❌ Error registrando rutas de WhatsApp y chat: {e}")
     
     # ❌ COMENTADO: No usar MySQL en Render (sin base de datos)
     # try:
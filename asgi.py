@@ -0,0 +1,107 @@
+"""Punto de entrada ASGI para ChaBox.
+
+``POST /api/chat`` se atiende de forma nativa asíncrona: la llamada a Gemini se
+espera con ``generate_response_async`` y no ocupa un hilo mientras tanto, así que
+un solo proceso mantiene cientos de chats en vuelo. El resto de rutas se delega
+a la aplicación Flask mediante ``asgiref.wsgi.WsgiToAsgi``.
+
+Uso:
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app
+from model.assistant import generate_response_async
+from routes.chat import _extender_historial, _historial
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo del cuerpo JSON aceptado por /api/chat (bytes)
+MAX_BODY_BYTES = 256 * 1024
+
+flask_app = WsgiToAsgi(app)
+
+
+async def _leer_cuerpo(receive):
+    """Lee el cuerpo completo de la petición respetando MAX_BODY_BYTES."""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            return None
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def _responder_json(send, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json; charset=utf-8'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def chat(scope, receive, send):
+    """Versión asíncrona de ``routes.chat.chat`` con el mismo contrato JSON."""
+    body = await _leer_cuerpo(receive)
+    if body is None:
+        return await _responder_json(send, 413, {'success': False, 'error': 'Mensaje demasiado grande'})
+
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+
+    message = str(data.get('message') or '').strip()
+    history = _historial(data)
+    if not message:
+        return await _responder_json(send, 400, {'success': False, 'error': 'Mensaje vacío'})
+
+    try:
+        response_text = await generate_response_async(message, history)
+    except Exception as e:
+        logger.error(f"Error en chat asíncrono: {e}")
+        return await _responder_json(send, 500, {'success': False, 'error': 'No pude procesar tu solicitud.'})
+
+    await _responder_json(send, 200, {
+        'success': True,
+        'response': response_text,
+        'history': _extender_historial(history, message, response_text),
+    })
+
+
+async def _lifespan(receive, send):
+    """Protocolo lifespan: no hay recursos asíncronos que abrir ni cerrar."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """Aplicación ASGI: /api/chat asíncrono, todo lo demás va a Flask."""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if (scope['type'] == 'http' and scope['method'] == 'POST'
+            and scope['path'].rstrip('/') == '/api/chat'):
+        return await chat(scope, receive, send)
+    return await flask_app(scope, receive, send)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks de la capa de trámites (no requiere MySQL).
+
+    python benchmark_tramites.py [filas]
+
+- Serialización del listado: compara el camino anterior (fila dict del
+  DictCursor -> Tramite -> to_dict -> json.dumps) con el actual (tupla del
+  cursor -> serializar_tramites a un buffer de bytes). Mide filas por segundo
+  y el pico de memoria con tracemalloc (medido en una pasada aparte).
+- Sobrecosto de query_db: tiempo por llamada sobre una conexión simulada (sin
+  red), antes (clasificar con find() y print por consulta, aquí a /dev/null)
+  y ahora (registro de sentencias, sin prints).
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+# Agregar ruta del proyecto
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config.mysqlconnections import ConnectionPool, MySQLConnection, _limitar_ejecucion
+from models.tramite import COLUMNAS, Tramite, serializar_tramites
+
+
+def generar_tuplas(cantidad):
+    """Filas como las entrega un cursor de tuplas"""
+    base = datetime(2024, 1, 1)
+    return [
+        (i, f'Trámite {i}', f'Descripción del trámite número {i}', 'pendiente', f'+57300{i:07d}',
+         base + timedelta(seconds=i), base + timedelta(seconds=i, milliseconds=123))
+        for i in range(cantidad)
+    ]
+
+
+def anterior(tuplas):
+    """DictCursor + Tramite + to_dict con str() + json.dumps (como antes)"""
+    filas = [dict(zip(COLUMNAS, t)) for t in tuplas]
+    tramites = []
+    for fila in filas:
+        t = Tramite(fila)
+        tramites.append({
+            'id': t.id, 'nombre': t.nombre, 'descripcion': t.descripcion, 'estado': t.estado,
+            'usuario_whatsapp': t.usuario_whatsapp,
+            'fecha_creacion': str(t.fecha_creacion), 'fecha_actualizacion': str(t.fecha_actualizacion),
+        })
+    return json.dumps({'success': True, 'tramites': tramites, 'total': len(tramites)}).encode()
+
+
+def actual(tuplas):
+    """Tuplas del cursor escritas directo al buffer JSON"""
+    cuerpo = serializar_tramites(tuplas, COLUMNAS, bytearray(b'{"success":true,"tramites":'))
+    cuerpo += f',"total":{len(tuplas)}}}'.encode()
+    return bytes(cuerpo)
+
+
+def medir(funcion, argumento):
+    inicio = time.perf_counter()
+    resultado = funcion(argumento)
+    segundos = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    funcion(argumento)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return segundos, pico, len(resultado)
+
+
+def benchmark_serializacion(cantidad):
+    print(f"\nSerialización de {cantidad} trámites")
+    print(f"{'camino':<10}{'filas/s':>14}{'pico MB':>10}{'bytes':>12}")
+    tuplas = generar_tuplas(cantidad)
+    for nombre, funcion in (('anterior', anterior), ('actual', actual)):
+        segundos, pico, tamano = medir(funcion, tuplas)
+        print(f"{nombre:<10}{cantidad / segundos:>14,.0f}{pico / 1024 / 1024:>10.1f}{tamano:>12,}")
+
+
+class _Cursor:
+    lastrowid = 1
+
+    def __init__(self, filas):
+        self._filas = filas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, data=None):
+        pass
+
+    def fetchall(self):
+        return self._filas
+
+
+class _Conexion:
+    """Conexión sin red: mide solo el trabajo de query_db en Python"""
+    open = True
+
+    def __init__(self):
+        self.filas = [{'id': 1, 'nombre': 'Licencia'}]
+
+    def cursor(self, cursorclass=None):
+        return _Cursor(self.filas)
+
+    def commit(self):
+        pass
+
+    def ping(self, reconnect=False):
+        pass
+
+
+def _query_db_anterior(db, query, data=None):
+    """query_db como era antes: find() sobre el texto y print en cada consulta"""
+    query = _limitar_ejecucion(query, None)
+    with db.pool.connection(None) as connection, connection.cursor() as cursor:
+        if data:
+            print(f"🔍 Query: {query}")
+            print(f"📊 Data: {data}")
+        cursor.execute(query, data)
+        if query.lower().find("insert") >= 0:
+            connection.commit()
+            return cursor.lastrowid
+        elif query.lower().find("select") >= 0:
+            result = cursor.fetchall()
+            return result if result else []
+        else:
+            connection.commit()
+            return True
+
+
+def benchmark_query_db(llamadas):
+    print(f"\nSobrecosto de query_db ({llamadas} llamadas, conexión simulada)")
+    db = MySQLConnection.__new__(MySQLConnection)
+    db.database = 'benchmark'
+    db.pool = ConnectionPool(_Conexion, min_size=0, max_size=1)
+    consultas = [
+        ("SELECT * FROM tramites WHERE id = %s", (7,)),
+        ("UPDATE tramites SET estado = %s WHERE id = %s", ('listo', 7)),
+        ("INSERT INTO tramites (nombre, descripcion, usuario_whatsapp, estado) VALUES (%s, %s, %s, %s)",
+         ('Licencia', None, '+57300', 'pendiente')),
+    ]
+    print(f"{'camino':<10}{'us/llamada':>12}")
+    with open(os.devnull, 'w') as nulo, redirect_stdout(nulo):
+        caminos = (('anterior', lambda q, d: _query_db_anterior(db, q, d)), ('actual', db.query_db))
+        resultados = []
+        for nombre, funcion in caminos:
+            inicio = time.perf_counter()
+            for i in range(llamadas):
+                funcion(*consultas[i % len(consultas)])
+            resultados.append((nombre, (time.perf_counter() - inicio) / llamadas * 1e6))
+    for nombre, microsegundos in resultados:
+        print(f"{nombre:<10}{microsegundos:>12.2f}")
+
+
+if __name__ == '__main__':
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    benchmark_serializacion(cantidad)
+    benchmark_query_db(cantidad)
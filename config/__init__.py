@@ -14,10 +14,188 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID', '')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN', '')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER', '')
 
+# Envío saliente por Twilio (pool HTTP keep-alive y cola acotada)
+TWILIO_SEND_PARALLELISM = int(os.getenv('TWILIO_SEND_PARALLELISM', 8))
+TWILIO_SEND_QUEUE_SIZE = int(os.getenv('TWILIO_SEND_QUEUE_SIZE', 1000))
+TWILIO_HTTP_TIMEOUT = float(os.getenv('TWILIO_HTTP_TIMEOUT', 10))
+TWILIO_HTTP_RETRIES = int(os.getenv('TWILIO_HTTP_RETRIES', 2))
+
+# Difusión masiva: tope de mensajes por segundo y de destinatarios por trabajo
+BROADCAST_RATE_PER_SEC = float(os.getenv('BROADCAST_RATE_PER_SEC', 20))
+BROADCAST_MAX_RECIPIENTS = int(os.getenv('BROADCAST_MAX_RECIPIENTS', 50000))
+# Mensajes de difusión que pueden ocupar a la vez la cola compartida de envío;
+# el resto de la cola queda libre para las respuestas de los webhooks
+BROADCAST_MAX_QUEUED = int(os.getenv('BROADCAST_MAX_QUEUED', TWILIO_SEND_QUEUE_SIZE // 2))
+
+# Límite de llamadas a Gemini: tasa, ráfaga, concurrencia y espera máxima en cola.
+# Con GEMINI_LIMITER_PATH la tasa se comparte entre workers mediante un archivo SQLite.
+GEMINI_RATE_PER_SEC = float(os.getenv('GEMINI_RATE_PER_SEC', 2))
+GEMINI_BURST = float(os.getenv('GEMINI_BURST', 5))
+GEMINI_MAX_CONCURRENT = int(os.getenv('GEMINI_MAX_CONCURRENT', 4))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv('GEMINI_QUEUE_TIMEOUT', 5))
+GEMINI_LIMITER_PATH = os.getenv('GEMINI_LIMITER_PATH', '')
+
+# Plazo por llamada a Gemini (0 = sin plazo) e intentos paralelos/reintentos dentro de él.
+# GEMINI_HEDGE_AFTER > 0 lanza otro intento si el primero tarda más de esos segundos.
+GEMINI_CALL_TIMEOUT = float(os.getenv('GEMINI_CALL_TIMEOUT', 12))
+GEMINI_HEDGE_AFTER = float(os.getenv('GEMINI_HEDGE_AFTER', 0))
+GEMINI_MAX_ATTEMPTS = int(os.getenv('GEMINI_MAX_ATTEMPTS', 1))
+
+# Circuit breaker de Gemini: se abre si en la ventana hay demasiados errores o llamadas lentas
+GEMINI_BREAKER_WINDOW = int(os.getenv('GEMINI_BREAKER_WINDOW', 20))
+GEMINI_BREAKER_MIN_CALLS = int(os.getenv('GEMINI_BREAKER_MIN_CALLS', 5))
+GEMINI_BREAKER_ERROR_RATE = float(os.getenv('GEMINI_BREAKER_ERROR_RATE', 0.5))
+GEMINI_BREAKER_SLOW_SECONDS = float(os.getenv('GEMINI_BREAKER_SLOW_SECONDS', 8))
+GEMINI_BREAKER_SLOW_RATE = float(os.getenv('GEMINI_BREAKER_SLOW_RATE', 0.5))
+GEMINI_BREAKER_OPEN_SECONDS = float(os.getenv('GEMINI_BREAKER_OPEN_SECONDS', 30))
+
+# Procesamiento asíncrono de webhooks (responde a Twilio y genera en segundo plano)
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 100))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', 10))
+
+# Plazo por mensaje entrante: Twilio abandona el webhook a los ~15 s. En modo
+# asíncrono el plazo cuenta desde que llega el mensaje (incluye la espera en cola).
+# DEADLINE_SEND_RESERVE son los segundos del plazo que se reservan para el envío.
+WEBHOOK_DEADLINE = float(os.getenv('WEBHOOK_DEADLINE', 14))
+WEBHOOK_ASYNC_DEADLINE = float(os.getenv('WEBHOOK_ASYNC_DEADLINE', 60))
+DEADLINE_SEND_RESERVE = float(os.getenv('DEADLINE_SEND_RESERVE', 2))
+
+# Cache de respuestas del asistente (0 lo desactiva)
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+RESPONSE_CACHE_WITH_HISTORY = os.getenv('RESPONSE_CACHE_WITH_HISTORY', 'true').lower() in ('1', 'true', 'yes')
+
+# Cache semántico (preguntas parecidas por similitud coseno; 0 lo desactiva)
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', 256))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.85))
+
+# Intenciones que se responden sin LLM cuando la confianza supera el umbral
+INTENT_ROUTER_INTENTS = [
+    i.strip() for i in os.getenv('INTENT_ROUTER_INTENTS', 'horario,garantia,devolucion,envio').split(',') if i.strip()
+]
+INTENT_ROUTER_THRESHOLD = float(os.getenv('INTENT_ROUTER_THRESHOLD', 0.75))
+
+# Historial por remitente de WhatsApp: memory | sqlite | mysql
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+SESSION_MAX_TURNS = int(os.getenv('SESSION_MAX_TURNS', 6))
+SESSION_TTL = float(os.getenv('SESSION_TTL', 1800))
+SESSION_MAX_SENDERS = int(os.getenv('SESSION_MAX_SENDERS', 10000))
+SESSION_SQLITE_PATH = os.getenv('SESSION_SQLITE_PATH', 'sesiones.db')
+
+# Deduplicación de webhooks por MessageSid: memory | sqlite | mysql
+DEDUP_STORE = os.getenv('DEDUP_STORE', 'memory')
+DEDUP_TTL = float(os.getenv('DEDUP_TTL', 3600))
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', 50000))
+DEDUP_INFLIGHT_TIMEOUT = float(os.getenv('DEDUP_INFLIGHT_TIMEOUT', 30))
+DEDUP_SQLITE_PATH = os.getenv('DEDUP_SQLITE_PATH', SESSION_SQLITE_PATH)
+
+# Callbacks de estado de Twilio: sqlite | mysql | none, escritos por lotes
+STATUS_STORE = os.getenv('STATUS_STORE', 'sqlite')
+STATUS_SQLITE_PATH = os.getenv('STATUS_SQLITE_PATH', SESSION_SQLITE_PATH)
+STATUS_BATCH_SIZE = int(os.getenv('STATUS_BATCH_SIZE', 200))
+STATUS_FLUSH_INTERVAL = float(os.getenv('STATUS_FLUSH_INTERVAL', 2))
+STATUS_MAX_BUFFER = int(os.getenv('STATUS_MAX_BUFFER', 10000))
+
+# Listado de trámites (GET /api/tramites): tamaño de página y exportación NDJSON
+TRAMITES_PAGE_SIZE = int(os.getenv('TRAMITES_PAGE_SIZE', 50))
+TRAMITES_MAX_PAGE_SIZE = int(os.getenv('TRAMITES_MAX_PAGE_SIZE', 500))
+TRAMITES_EXPORT_FETCH = int(os.getenv('TRAMITES_EXPORT_FETCH', 1000))
+
+# Cache de lecturas de trámites por id (GET /api/tramites/<id>; 0 lo desactiva)
+TRAMITE_CACHE_SIZE = int(os.getenv('TRAMITE_CACHE_SIZE', 1024))
+TRAMITE_CACHE_TTL = float(os.getenv('TRAMITE_CACHE_TTL', 30))
+
+# Ruta rápida de WhatsApp: "¿cómo va mi trámite?" se responde desde MySQL sin LLM
+TRAMITE_STATUS_LOOKUP = os.getenv('TRAMITE_STATUS_LOOKUP', 'false').lower() in ('1', 'true', 'yes')
+TRAMITE_STATUS_LIMIT = int(os.getenv('TRAMITE_STATUS_LIMIT', 3))
+TRAMITE_STATUS_CACHE_SIZE = int(os.getenv('TRAMITE_STATUS_CACHE_SIZE', 5000))
+TRAMITE_STATUS_CACHE_TTL = float(os.getenv('TRAMITE_STATUS_CACHE_TTL', 60))
+
+# Carga masiva de trámites (POST /api/tramites/lote): filas por petición y por INSERT
+TRAMITES_BULK_MAX_ROWS = int(os.getenv('TRAMITES_BULK_MAX_ROWS', 10000))
+TRAMITES_BULK_CHUNK = int(os.getenv('TRAMITES_BULK_CHUNK', 500))
+
+# Latencia de consultas MySQL (GET /metrics/db); DB_SLOW_QUERY_MS=0 desactiva el log de lentas
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 500))
+DB_METRICS_MAX_STATEMENTS = int(os.getenv('DB_METRICS_MAX_STATEMENTS', 200))
+
+# Presupuesto de historial enviado al modelo (tokens aproximados)
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 1200))
+HISTORY_KEEP_TURNS = int(os.getenv('HISTORY_KEEP_TURNS', 4))
+HISTORY_SUMMARY_TOKENS = int(os.getenv('HISTORY_SUMMARY_TOKENS', 200))
+
 __all__ = [
     'GEMINI_API_KEY',
     'DEFAULT_MODEL_NAME',
     'TWILIO_ACCOUNT_SID',
     'TWILIO_AUTH_TOKEN',
-    'TWILIO_PHONE_NUMBER'
+    'TWILIO_PHONE_NUMBER',
+    'TWILIO_SEND_PARALLELISM',
+    'TWILIO_SEND_QUEUE_SIZE',
+    'TWILIO_HTTP_TIMEOUT',
+    'TWILIO_HTTP_RETRIES',
+    'BROADCAST_RATE_PER_SEC',
+    'BROADCAST_MAX_RECIPIENTS',
+    'BROADCAST_MAX_QUEUED',
+    'GEMINI_RATE_PER_SEC',
+    'GEMINI_BURST',
+    'GEMINI_MAX_CONCURRENT',
+    'GEMINI_QUEUE_TIMEOUT',
+    'GEMINI_LIMITER_PATH',
+    'GEMINI_CALL_TIMEOUT',
+    'GEMINI_HEDGE_AFTER',
+    'GEMINI_MAX_ATTEMPTS',
+    'GEMINI_BREAKER_WINDOW',
+    'GEMINI_BREAKER_MIN_CALLS',
+    'GEMINI_BREAKER_ERROR_RATE',
+    'GEMINI_BREAKER_SLOW_SECONDS',
+    'GEMINI_BREAKER_SLOW_RATE',
+    'GEMINI_BREAKER_OPEN_SECONDS',
+    'WEBHOOK_ASYNC',
+    'WEBHOOK_WORKERS',
+    'WEBHOOK_QUEUE_SIZE',
+    'WEBHOOK_DRAIN_TIMEOUT',
+    'WEBHOOK_DEADLINE',
+    'WEBHOOK_ASYNC_DEADLINE',
+    'DEADLINE_SEND_RESERVE',
+    'RESPONSE_CACHE_SIZE',
+    'RESPONSE_CACHE_TTL',
+    'RESPONSE_CACHE_WITH_HISTORY',
+    'SEMANTIC_CACHE_SIZE',
+    'SEMANTIC_CACHE_THRESHOLD',
+    'INTENT_ROUTER_INTENTS',
+    'INTENT_ROUTER_THRESHOLD',
+    'SESSION_STORE',
+    'SESSION_MAX_TURNS',
+    'SESSION_TTL',
+    'SESSION_MAX_SENDERS',
+    'SESSION_SQLITE_PATH',
+    'DEDUP_STORE',
+    'DEDUP_TTL',
+    'DEDUP_MAX_ENTRIES',
+    'DEDUP_INFLIGHT_TIMEOUT',
+    'DEDUP_SQLITE_PATH',
+    'STATUS_STORE',
+    'STATUS_SQLITE_PATH',
+    'STATUS_BATCH_SIZE',
+    'STATUS_FLUSH_INTERVAL',
+    'STATUS_MAX_BUFFER',
+    'TRAMITES_PAGE_SIZE',
+    'TRAMITES_MAX_PAGE_SIZE',
+    'TRAMITES_EXPORT_FETCH',
+    'TRAMITE_CACHE_SIZE',
+    'TRAMITE_CACHE_TTL',
+    'TRAMITE_STATUS_LOOKUP',
+    'TRAMITE_STATUS_LIMIT',
+    'TRAMITE_STATUS_CACHE_SIZE',
+    'TRAMITE_STATUS_CACHE_TTL',
+    'TRAMITES_BULK_MAX_ROWS',
+    'TRAMITES_BULK_CHUNK',
+    'DB_SLOW_QUERY_MS',
+    'DB_METRICS_MAX_STATEMENTS',
+    'HISTORY_TOKEN_BUDGET',
+    'HISTORY_KEEP_TURNS',
+    'HISTORY_SUMMARY_TOKENS',
 ]
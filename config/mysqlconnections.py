@@ -1,107 +1,623 @@
 # Importamos la librería pymysql para interactuar con MySQL
 import pymysql.cursors
+import logging
 import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import NamedTuple
 from dotenv import load_dotenv
+from services.db_metrics import get_query_metrics, normalizar_sql
+from services.deadline import remaining_timeout
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Parámetros del pool de conexiones
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 3600))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 1))
+# Sentencias distintas cuyo análisis se recuerda (ver ``clasificar_sentencia``)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 512))
+
+
+class PoolTimeout(pymysql.err.OperationalError):
+    """No se liberó ninguna conexión del pool dentro del tiempo de espera"""
+
+
+class ConnectionPool:
+    """Pool de conexiones acotado y seguro entre hilos"""
+
+    def __init__(self, connect, min_size=1, max_size=10, idle_timeout=300.0,
+                 max_lifetime=3600.0, timeout=10.0, ping_after=1.0):
+        """
+        Args:
+            connect (callable): Función que abre una conexión nueva
+            min_size (int): Conexiones ociosas que se conservan aunque expiren
+            max_size (int): Máximo de conexiones abiertas (ociosas + en uso)
+            idle_timeout (float): Segundos ociosa antes de cerrarla
+            max_lifetime (float): Segundos de vida máxima de una conexión
+            timeout (float): Segundos de espera por una conexión libre
+            ping_after (float): Segundos ociosa a partir de los cuales se hace ping
+        """
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        # Conexiones ociosas: (conexion, creada_en, usada_en); se reutiliza la más reciente
+        self._idle = deque()
+        self._created_at = {}
+        self._size = 0
+        self.stats_counters = {'created': 0, 'reused': 0, 'discarded': 0, 'waits': 0, 'timeouts': 0}
+
+    def _open(self):
+        connection = self._connect()
+        with self._cond:
+            self._created_at[id(connection)] = time.monotonic()
+            self.stats_counters['created'] += 1
+        return connection
+
+    def _discard(self, connection):
+        """Cierra una conexión y libera su lugar en el pool"""
+        with self._cond:
+            self._created_at.pop(id(connection), None)
+            self._size -= 1
+            self.stats_counters['discarded'] += 1
+            self._cond.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def fill(self):
+        """Abre conexiones hasta tener ``min_size`` ociosas"""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((connection, time.monotonic()))
+                self._cond.notify()
+
+    def acquire(self, timeout=None):
+        """
+        Obtiene una conexión sana del pool, abriendo una nueva si hay cupo
+
+        Args:
+            timeout (float, optional): Espera máxima; nunca supera ``self.timeout``
+        """
+        wait = self.timeout if timeout is None else min(timeout, self.timeout)
+        deadline = time.monotonic() + wait
+        while True:
+            with self._cond:
+                candidate = None
+                while candidate is None:
+                    if self._idle:
+                        candidate = self._idle.pop()
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.stats_counters['timeouts'] += 1
+                            raise PoolTimeout(f"Sin conexiones libres tras {wait:.1f}s")
+                        self.stats_counters['waits'] += 1
+                        self._cond.wait(remaining)
+
+            if candidate is None:
+                try:
+                    return self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            connection, last_used = candidate
+            now = time.monotonic()
+            created_at = self._created_at.get(id(connection), now)
+            if now - created_at > self.max_lifetime or (
+                    now - last_used > self.idle_timeout and self._size > self.min_size):
+                self._discard(connection)
+                continue
+
+            if now - last_used > self.ping_after:
+                try:
+                    connection.ping(reconnect=False)
+                except Exception:
+                    self._discard(connection)
+                    continue
+
+            with self._cond:
+                self.stats_counters['reused'] += 1
+            return connection
+
+    def release(self, connection):
+        """Devuelve la conexión al pool (o la descarta si quedó inservible)"""
+        if not getattr(connection, 'open', True):
+            self._discard(connection)
+            return
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager que toma y devuelve una conexión"""
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        except BaseException:
+            self._discard(connection)
+            raise
+        else:
+            self.release(connection)
+
+    def close_all(self):
+        """Cierra las conexiones ociosas (las que están en uso se cierran al liberarse)"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        """Estado del pool para diagnóstico"""
+        with self._cond:
+            return dict(self.stats_counters, size=self._size, idle=len(self._idle),
+                        in_use=self._size - len(self._idle), max_size=self.max_size)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+_SELECT_RE = re.compile(r'^\s*select\b', re.IGNORECASE)
+# Primera palabra de la sentencia, saltando comentarios y paréntesis iniciales
+_VERBO_RE = re.compile(r'^(?:\s+|/\*.*?\*/|--[^\n]*(?:\n|$)|#[^\n]*(?:\n|$)|\()*(\w+)', re.DOTALL)
+
+# Sentencias que devuelven filas
+_VERBOS_LECTURA = frozenset(('select', 'show', 'describe', 'desc', 'explain', 'with', 'values', 'table'))
+_VERBOS_INSERCION = frozenset(('insert', 'replace'))
+
+
+class Sentencia(NamedTuple):
+    """Resultado del análisis de una sentencia SQL"""
+    tipo: str        # 'lectura' | 'insercion' | 'escritura'
+    fin_select: int  # posición tras el SELECT inicial (para el hint), 0 si no hay
+    normalizada: str  # clave de las métricas de latencia (``normalizar_sql``)
+
+
+@lru_cache(maxsize=DB_STATEMENT_CACHE_SIZE)
+def clasificar_sentencia(query):
+    """
+    Clasifica una sentencia por su verbo inicial; se analiza una vez por texto
+
+    Las consultas del código son textos fijos con marcadores %s, así que el
+    registro (un LRU por texto de la sentencia) evita repetir el análisis en
+    cada llamada. A diferencia de buscar "insert"/"select" en todo el texto,
+    un SELECT sobre una columna ``insertado`` o un UPDATE con la palabra
+    "select" en un literal se clasifican bien.
+    """
+    match = _VERBO_RE.match(query)
+    verbo = match.group(1).lower() if match else ''
+    if verbo in _VERBOS_LECTURA:
+        tipo = 'lectura'
+    elif verbo in _VERBOS_INSERCION:
+        tipo = 'insercion'
+    else:
+        tipo = 'escritura'
+    select = _SELECT_RE.match(query)
+    return Sentencia(tipo, select.end() if select else 0, normalizar_sql(query))
+
+
+def estadisticas_sentencias():
+    """Aciertos y tamaño del registro de sentencias"""
+    info = clasificar_sentencia.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
+
+
+def _limitar_ejecucion(query, seconds, sentencia=None):
+    """
+    Agrega el hint MAX_EXECUTION_TIME a un SELECT para que MySQL lo corte al
+    vencer el plazo de la petición (otros motores lo ignoran como comentario)
+    """
+    if seconds is None:
+        return query
+    fin = (sentencia or clasificar_sentencia(query)).fin_select
+    if not fin:
+        return query
+    return f"{query[:fin]} /*+ MAX_EXECUTION_TIME({max(1, int(seconds * 1000))}) */{query[fin:]}"
+
+
+def _registrar(sentencia, inicio, conectado, ejecutado=None, error=False):
+    """Registra las fases de una sentencia medidas con ``time.perf_counter``"""
+    fin = time.perf_counter()
+    ejecutado = fin if ejecutado is None else ejecutado
+    get_query_metrics().record(sentencia.normalizada, conectado - inicio, ejecutado - conectado,
+                               fin - ejecutado, error)
+
+
+def _medir_llamada(nombre, funcion):
+    """Ejecuta y registra un viaje sin texto SQL propio (BEGIN, COMMIT)"""
+    inicio = time.perf_counter()
+    try:
+        funcion()
+    except BaseException:
+        get_query_metrics().record(nombre, 0.0, time.perf_counter() - inicio, 0.0, True)
+        raise
+    get_query_metrics().record(nombre, 0.0, time.perf_counter() - inicio)
+
+
+class _CursorMedido:
+    """
+    Cursor que registra la latencia de cada sentencia ejecutada en él
+
+    Las lecturas (fetch*) se suman a la última sentencia, que se registra al
+    ejecutar la siguiente o al cerrar el bloque. La espera por la conexión se
+    atribuye a la primera sentencia.
+    """
+
+    def __init__(self, cursor, conectar):
+        self._cursor = cursor
+        self._conectar = conectar
+        self._medicion = None  # [sentencia, conectar, ejecutar, leer]
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def _ejecutar(self, metodo, query, args):
+        self.terminar()
+        normalizada = clasificar_sentencia(query).normalizada
+        conectar, self._conectar = self._conectar, 0.0
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(query, args)
+        except BaseException:
+            get_query_metrics().record(normalizada, conectar, time.perf_counter() - inicio, 0.0, True)
+            raise
+        self._medicion = [normalizada, conectar, time.perf_counter() - inicio, 0.0]
+        return resultado
+
+    def _leer(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            if self._medicion:
+                self._medicion[3] += time.perf_counter() - inicio
+
+    def execute(self, query, args=None):
+        return self._ejecutar(self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self._ejecutar(self._cursor.executemany, query, args)
+
+    def fetchone(self):
+        return self._leer(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._leer(self._cursor.fetchmany, *(() if size is None else (size,)))
+
+    def fetchall(self):
+        return self._leer(self._cursor.fetchall)
+
+    def terminar(self):
+        """Registra la sentencia pendiente (con sus lecturas)"""
+        if self._medicion:
+            get_query_metrics().record(*self._medicion)
+            self._medicion = None
+
+
+def estadisticas_db():
+    """Latencias por sentencia, registro de sentencias y estado de los pools"""
+    return {
+        'queries': get_query_metrics().stats(),
+        'statement_registry': estadisticas_sentencias(),
+        'pools': {db: pool.stats() for db, pool in list(_pools.items())},
+    }
+
+
+def get_pool(db):
+    """
+    Retorna el pool de conexiones de la base de datos, creándolo la primera vez
+
+    Args:
+        db (str): Nombre de la base de datos
+
+    Returns:
+        ConnectionPool: Pool compartido por el proceso
+    """
+    pool = _pools.get(db)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(db)
+        if pool is None:
+            host = os.getenv('DB_HOST', 'localhost')
+            port = int(os.getenv('DB_PORT', 3306))
+            user = os.getenv('DB_USER', 'root')
+            password = os.getenv('DB_PASSWORD', 'root')
+
+            def connect():
+                try:
+                    connection = pymysql.connect(
+                        host=host,
+                        port=port,
+                        user=user,
+                        password=password,
+                        db=db,
+                        charset='utf8mb4',
+                        cursorclass=pymysql.cursors.DictCursor,
+                        autocommit=True
+                    )
+                    logger.info(f"✅ Conectado a MySQL - Base de datos: {db}")
+                    return connection
+                except pymysql.Error as err:
+                    logger.error(f"❌ Error de conexión a MySQL: {err}")
+                    raise
+
+            pool = ConnectionPool(
+                connect,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                idle_timeout=DB_POOL_IDLE_TIMEOUT,
+                max_lifetime=DB_POOL_MAX_LIFETIME,
+                timeout=DB_POOL_TIMEOUT,
+                ping_after=DB_POOL_PING_AFTER,
+            )
+            try:
+                pool.fill()
+            except pymysql.Error:
+                # El pool se crea igual; las conexiones se reintentan al pedirlas
+                pass
+            _pools[db] = pool
+    return pool
+
+
 # Esta clase proporciona una instancia para conectarse a la base de datos MySQL
 class MySQLConnection:
     """Clase para gestionar conexiones a base de datos MySQL"""
-    
+
     def __init__(self, db):
         """
         Método constructor que recibe el nombre de la base de datos como parámetro
-        
+
         Args:
             db (str): Nombre de la base de datos
         """
-        # Configuración de la conexión desde variables de entorno
-        self.host = os.getenv('DB_HOST', 'localhost')
-        self.port = int(os.getenv('DB_PORT', 3306))
-        self.user = os.getenv('DB_USER', 'root')
-        self.password = os.getenv('DB_PASSWORD', 'root')
         self.database = db
-        
-        # Establecer conexión
-        try:
-            self.connection = pymysql.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                db=self.database,
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor,
-                autocommit=True
-            )
-            print(f"✅ Conectado a MySQL - Base de datos: {self.database}")
-        except pymysql.Error as err:
-            print(f"❌ Error de conexión a MySQL: {err}")
-            raise
+        # Las conexiones se toman del pool en cada consulta y se devuelven al terminar
+        self.pool = get_pool(db)
 
     def query_db(self, query, data=None):
         """
         Método para ejecutar consultas SQL en la base de datos
-        
+
         Args:
             query (str): Consulta SQL
             data (tuple/list, optional): Datos para consultas parametrizadas
-            
+
         Returns:
             - Para INSERT: ID de la última fila insertada
             - Para SELECT: Lista de diccionarios con los resultados
             - Para UPDATE/DELETE: None si fue exitoso, False si hubo error
+
+        Si la petición tiene un plazo activo (``services.deadline``), la espera por
+        una conexión y la duración de los SELECT se limitan a lo que queda; si ya
+        venció se lanza ``DeadlineExceeded`` sin tocar la base de datos.
+
+        El tipo de sentencia sale del registro ``clasificar_sentencia``: cada
+        texto de consulta distinto se analiza una sola vez por proceso.
+        Cada llamada registra su latencia (conexión, ejecución y lectura) en
+        ``services.db_metrics``.
         """
-        with self.connection.cursor() as cursor:
+        sentencia = clasificar_sentencia(query)
+        timeout = remaining_timeout(None, "consultar MySQL")
+        query = _limitar_ejecucion(query, timeout, sentencia)
+        inicio = time.perf_counter()
+        with self.pool.connection(timeout) as connection, connection.cursor() as cursor:
+            conectado = time.perf_counter()
             try:
-                # Si deseas depurar, imprime la consulta
-                if data:
-                    print(f"🔍 Query: {query}")
-                    print(f"📊 Data: {data}")
-
-                # Ejecutar la consulta
                 cursor.execute(query, data)
 
-                # Si la consulta es un INSERT, devolver el ID de la última fila
-                if query.lower().find("insert") >= 0:
-                    self.connection.commit()
-                    return cursor.lastrowid
-
                 # Si es una consulta SELECT, devolver el resultado
-                elif query.lower().find("select") >= 0:
+                if sentencia.tipo == 'lectura':
+                    ejecutado = time.perf_counter()
                     result = cursor.fetchall()
-                    return result if result else []
+                    resultado = result if result else []
+
+                # Si la consulta es un INSERT, devolver el ID de la última fila
+                elif sentencia.tipo == 'insercion':
+                    connection.commit()
+                    ejecutado = time.perf_counter()
+                    resultado = cursor.lastrowid
 
                 # Para consultas UPDATE o DELETE, confirmar la transacción
                 else:
-                    self.connection.commit()
-                    return True
-                    
+                    connection.commit()
+                    ejecutado = time.perf_counter()
+                    resultado = True
+
+                _registrar(sentencia, inicio, conectado, ejecutado)
+                return resultado
+
             except pymysql.Error as err:
-                print(f"❌ Error en query MySQL: {err}")
+                _registrar(sentencia, inicio, conectado, error=True)
+                logger.error(f"❌ Error en query MySQL: {err}")
                 return False
             except Exception as e:
-                print(f"❌ Error inesperado: {e}")
+                _registrar(sentencia, inicio, conectado, error=True)
+                logger.error(f"❌ Error inesperado: {e}")
                 return False
 
+    def query_rows(self, query, data=None):
+        """
+        Ejecuta un SELECT y retorna las filas como tuplas (sin un dict por fila)
+
+        Para listados grandes que se serializan directamente desde las tuplas;
+        aplica el mismo plazo que ``query_db``.
+
+        Returns:
+            list: Tuplas en el orden de las columnas del SELECT, o False si hubo error
+        """
+        sentencia = clasificar_sentencia(query)
+        timeout = remaining_timeout(None, "consultar MySQL")
+        query = _limitar_ejecucion(query, timeout, sentencia)
+        inicio = time.perf_counter()
+        with self.pool.connection(timeout) as connection, \
+                connection.cursor(pymysql.cursors.Cursor) as cursor:
+            conectado = time.perf_counter()
+            try:
+                cursor.execute(query, data)
+                ejecutado = time.perf_counter()
+                filas = list(cursor.fetchall())
+                _registrar(sentencia, inicio, conectado, ejecutado)
+                return filas
+            except pymysql.Error as err:
+                _registrar(sentencia, inicio, conectado, error=True)
+                logger.error(f"❌ Error en query MySQL: {err}")
+                return False
+
+    def execute_many(self, query, rows):
+        """
+        Ejecuta una sentencia parametrizada para varias filas en un solo viaje
+
+        Para ``INSERT ... VALUES`` pymysql arma un único INSERT de varias filas.
+
+        Args:
+            query (str): Consulta SQL con marcadores %s
+            rows (list): Tuplas con los datos de cada fila
+
+        Returns:
+            int: Filas afectadas, o False si hubo error
+        """
+        if not rows:
+            return 0
+        sentencia = clasificar_sentencia(query)
+        timeout = remaining_timeout(None, "escribir en MySQL")
+        inicio = time.perf_counter()
+        with self.pool.connection(timeout) as connection, connection.cursor() as cursor:
+            conectado = time.perf_counter()
+            try:
+                affected = cursor.executemany(query, rows)
+                connection.commit()
+                _registrar(sentencia, inicio, conectado)
+                return affected
+            except pymysql.Error as err:
+                _registrar(sentencia, inicio, conectado, error=True)
+                logger.error(f"❌ Error en executemany MySQL: {err}")
+                return False
+
+    @contextmanager
+    def cursor(self):
+        """
+        Cursor sobre una sola conexión del pool para varias sentencias seguidas
+
+        Las sentencias se confirman solas (autocommit), sin viajes extra de
+        BEGIN/COMMIT; ``cursor.rowcount`` da las filas afectadas por la última.
+        Los errores se propagan y la conexión se descarta. Cada sentencia
+        registra su latencia como en ``query_db``.
+        """
+        timeout = remaining_timeout(None, "consultar MySQL")
+        inicio = time.perf_counter()
+        with self.pool.connection(timeout) as connection, connection.cursor() as cursor:
+            medido = _CursorMedido(cursor, time.perf_counter() - inicio)
+            try:
+                yield medido
+            finally:
+                medido.terminar()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Cursor dentro de una transacción explícita sobre una conexión del pool
+
+        Confirma al salir del bloque; ante cualquier error hace ROLLBACK y
+        propaga la excepción (la conexión se descarta).
+        """
+        timeout = remaining_timeout(None, "escribir en MySQL")
+        inicio = time.perf_counter()
+        with self.pool.connection(timeout) as connection:
+            conectar = time.perf_counter() - inicio
+            _medir_llamada('BEGIN', connection.begin)
+            try:
+                with connection.cursor() as cursor:
+                    medido = _CursorMedido(cursor, conectar)
+                    try:
+                        yield medido
+                    finally:
+                        medido.terminar()
+            except BaseException:
+                connection.rollback()
+                raise
+            _medir_llamada('COMMIT', connection.commit)
+
+    def stream(self, query, data=None, fetch_size=1000):
+        """
+        Itera las filas de un SELECT sin cargar el resultado completo en memoria
+
+        Usa un cursor sin buffer (``SSCursor``): el servidor envía las filas a
+        medida que se leen, de a ``fetch_size``. La conexión queda ocupada hasta
+        terminar la iteración; si el consumidor la abandona (p. ej. el cliente
+        corta la descarga) la conexión se descarta en vez de leer el resto.
+
+        Args:
+            query (str): Consulta SELECT
+            data (tuple/list, optional): Datos para consultas parametrizadas
+            fetch_size (int): Filas pedidas al servidor en cada lectura
+
+        Yields:
+            tuple: Una fila por iteración, en el orden de las columnas del SELECT
+        """
+        timeout = remaining_timeout(None, "consultar MySQL")
+        inicio = time.perf_counter()
+        with self.pool.connection(timeout) as connection:
+            medido = _CursorMedido(connection.cursor(pymysql.cursors.SSCursor), time.perf_counter() - inicio)
+            try:
+                medido.execute(query, data)
+                while True:
+                    rows = medido.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    yield from rows
+            finally:
+                # También si el consumidor abandona la iteración: lo leído hasta ahí
+                medido.terminar()
+            medido.close()
+
     def close(self):
-        """Cerrar la conexión a MySQL"""
-        try:
-            if self.connection:
-                self.connection.close()
-                print("✅ Conexión cerrada")
-        except Exception as e:
-            print(f"Error al cerrar conexión: {e}")
+        """Compatibilidad: las conexiones ya vuelven al pool tras cada consulta"""
+        pass
 
 def connectToMySQL(db):
     """
     Función para crear una instancia de MySQLConnection
-    
+
     Args:
         db (str): Nombre de la base de datos
-        
+
     Returns:
         MySQLConnection: Instancia de la clase MySQLConnection
     """
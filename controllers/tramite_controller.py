@@ -1,5 +1,202 @@
-from models.tramite import Tramite
+import base64
+import json
+import threading
+from datetime import datetime
+from models.tramite import COLUMNAS, Tramite, codificador_json, fecha_iso, serializar_tramites
 from config.database import connectToMySQL
+from services.cache import TTLCache
+from services.tramite_status import get_tramite_status
+from config import (
+    TRAMITE_CACHE_SIZE,
+    TRAMITE_CACHE_TTL,
+    TRAMITES_BULK_CHUNK,
+    TRAMITES_BULK_MAX_ROWS,
+    TRAMITES_EXPORT_FETCH,
+    TRAMITES_MAX_PAGE_SIZE,
+    TRAMITES_PAGE_SIZE,
+)
+
+# Trámites leídos por id. Cada escritura de este proceso invalida las entradas
+# afectadas; las de otros workers se ven al vencer el TTL.
+tramite_cache = TTLCache(maxsize=TRAMITE_CACHE_SIZE, ttl=TRAMITE_CACHE_TTL)
+
+# Cuenta las invalidaciones: una lectura que empezó antes de una escritura no
+# guarda en el cache la versión vieja que leyó.
+_generacion = 0
+_generacion_lock = threading.Lock()
+
+
+def _invalidar(*ids):
+    """Descarta del cache los trámites ``ids`` tras una escritura"""
+    global _generacion
+    with _generacion_lock:
+        _generacion += 1
+        for tramite_id in ids:
+            tramite_cache.pop(int(tramite_id))
+
+
+def _invalidar_remitentes(*usuarios):
+    """Descarta la respuesta cacheada de la ruta rápida de WhatsApp para ``usuarios``"""
+    consulta_estado = get_tramite_status()
+    if consulta_estado:
+        for usuario in set(usuarios):
+            consulta_estado.invalidate(usuario)
+
+
+def _remitentes(cursor, ids):
+    """
+    Números dueños de los trámites ``ids``, leídos antes de modificarlos
+
+    Solo consulta si la ruta rápida de WhatsApp está activa: sin ella no hay
+    respuestas por remitente que invalidar y la escritura no paga el SELECT.
+    """
+    if not ids or not get_tramite_status():
+        return []
+    cursor.execute(f"SELECT DISTINCT usuario_whatsapp FROM tramites WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                   tuple(ids))
+    return [fila['usuario_whatsapp'] for fila in cursor.fetchall()]
+
+
+def _guardar_en_cache(tramite_id, tramite, generacion):
+    with _generacion_lock:
+        if generacion == _generacion:
+            tramite_cache.set(tramite_id, tramite)
+
+
+def _codificar_cursor(fecha_creacion, tramite_id):
+    """Cursor opaco con la clave de orden (fecha_creacion, id) de la última fila"""
+    return base64.urlsafe_b64encode(f"{fecha_iso(fecha_creacion)}|{tramite_id}".encode()).decode().rstrip('=')
+
+
+def _decodificar_cursor(cursor):
+    """Retorna (fecha_creacion, id) del cursor; ValueError si no es válido"""
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        fecha, tramite_id = crudo.rsplit('|', 1)
+        return datetime.fromisoformat(fecha), int(tramite_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+
+def _consulta_listado(estado=None, usuario_whatsapp=None, campos=None, despues_de=None):
+    """
+    Arma el SELECT del listado ordenado por (fecha_creacion, id) descendente
+
+    Los filtros por igualdad usan los índices (estado, fecha_creacion, id) y
+    (usuario_whatsapp, fecha_creacion, id), así el orden sale del índice sin
+    ordenar en memoria. La página siguiente se pide con la clave de la última
+    fila (``despues_de``) en lugar de OFFSET, que obligaría a recorrer todas
+    las filas anteriores.
+
+    Returns:
+        tuple: (query, valores, columnas pedidas, columnas leídas); las pedidas
+        van primero en el SELECT, seguidas de id y fecha_creacion si faltaban
+    """
+    columnas = list(campos) if campos else list(COLUMNAS)
+    desconocidas = [c for c in columnas if c not in COLUMNAS]
+    if desconocidas:
+        raise ValueError(f"Campos desconocidos: {', '.join(desconocidas)}")
+
+    # id y fecha_creacion se leen siempre: forman la clave del cursor
+    seleccion = columnas + [c for c in ('id', 'fecha_creacion') if c not in columnas]
+    condiciones = []
+    valores = []
+    if estado:
+        condiciones.append("estado = %s")
+        valores.append(estado)
+    if usuario_whatsapp:
+        condiciones.append("usuario_whatsapp = %s")
+        valores.append(usuario_whatsapp)
+    if despues_de:
+        fecha, tramite_id = despues_de
+        condiciones.append("(fecha_creacion < %s OR (fecha_creacion = %s AND id < %s))")
+        valores.extend([fecha, fecha, tramite_id])
+
+    query = f"SELECT {', '.join(seleccion)} FROM tramites"
+    if condiciones:
+        query += " WHERE " + " AND ".join(condiciones)
+    query += " ORDER BY fecha_creacion DESC, id DESC"
+    return query, valores, columnas, seleccion
+
+
+def _version(valor):
+    """
+    Normaliza la ``fecha_actualizacion`` que envía el cliente para comparar versiones
+
+    Acepta el texto de ``Tramite.to_dict`` (o ISO-8601) y retorna un datetime.
+    """
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    try:
+        return datetime.fromisoformat(str(valor))
+    except ValueError:
+        raise ValueError('fecha_actualizacion inválida')
+
+
+# pymysql arma un INSERT de varias filas por executemany mientras no supere
+# Cursor.max_stmt_length (1024000); por debajo de eso cada lote es una sola
+# sentencia y InnoDB le asigna los ids de una vez: lastrowid es el primero y
+# los siguientes avanzan de a @@auto_increment_increment (1 salvo en Galera,
+# replicación de grupo o configuraciones con varios primarios).
+_MAX_BYTES_LOTE = 900000
+
+# @@auto_increment_increment por base de datos, leído una vez por proceso
+_incrementos = {}
+
+
+def _incremento_autoinc(db, cursor):
+    """Paso entre ids AUTO_INCREMENT consecutivos de una misma sentencia"""
+    incremento = _incrementos.get(db.database)
+    if incremento is None:
+        cursor.execute("SELECT @@auto_increment_increment AS incremento")
+        incremento = _incrementos[db.database] = int(cursor.fetchone()['incremento'])
+    return incremento
+
+# Longitudes máximas de las columnas de ``tramites``
+_LONGITUDES = {'nombre': 100, 'estado': 20, 'usuario_whatsapp': 20}
+
+
+def _validar_fila(fila):
+    """
+    Valida una fila de la carga masiva
+
+    Returns:
+        tuple: (valores para el INSERT, None) o (None, mensaje de error)
+    """
+    if not isinstance(fila, dict):
+        return None, 'La fila debe ser un objeto JSON'
+    nombre = fila.get('nombre')
+    if not isinstance(nombre, str) or not nombre.strip():
+        return None, "Falta 'nombre'"
+    estado = fila.get('estado') or 'pendiente'
+    valores = {
+        'nombre': nombre.strip(),
+        'descripcion': fila.get('descripcion'),
+        'usuario_whatsapp': fila.get('usuario_whatsapp'),
+        'estado': estado,
+    }
+    for campo, valor in valores.items():
+        if valor is not None and not isinstance(valor, str):
+            return None, f"'{campo}' debe ser texto"
+        if valor and len(valor) > _LONGITUDES.get(campo, len(valor)):
+            return None, f"'{campo}' supera {_LONGITUDES[campo]} caracteres"
+    return (valores['nombre'], valores['descripcion'], valores['usuario_whatsapp'], valores['estado']), None
+
+
+def _lotes(filas, tamano):
+    """Agrupa (indice, valores) en lotes de hasta ``tamano`` filas y _MAX_BYTES_LOTE bytes"""
+    lote, tamano_bytes = [], 0
+    for fila in filas:
+        # Peor caso: cada carácter escapado ocupa el doble
+        peso = sum(len(v.encode()) * 2 + 8 for v in fila[1] if v is not None) + 16
+        if lote and (len(lote) >= tamano or tamano_bytes + peso > _MAX_BYTES_LOTE):
+            yield lote
+            lote, tamano_bytes = [], 0
+        lote.append(fila)
+        tamano_bytes += peso
+    if lote:
+        yield lote
+
 
 class TramiteController:
     
@@ -15,6 +212,8 @@ class TramiteController:
             tramite_id = db.query_db(query, (nombre, descripcion, usuario_whatsapp, 'pendiente'))
             
             if tramite_id:
+                _invalidar(tramite_id)
+                _invalidar_remitentes(usuario_whatsapp)
                 return {
                     'success': True,
                     'mensaje': 'Trámite creado exitosamente',
@@ -25,91 +224,301 @@ class TramiteController:
         except Exception as e:
             return {'success': False, 'error': str(e)}, 400
 
+    @staticmethod
+    def crear_tramites_lote(filas):
+        """
+        CREATE - Crear varios trámites en una sola transacción
+
+        Las filas válidas se insertan con INSERT de varias filas (executemany)
+        en lotes de TRAMITES_BULK_CHUNK; las inválidas se informan sin
+        insertarse. Si MySQL rechaza un lote se revierte toda la carga.
+
+        Returns:
+            tuple: (resumen con el resultado de cada fila por ``indice``, status)
+        """
+        if not isinstance(filas, list) or not filas:
+            return {'success': False, 'error': 'Se espera una lista de trámites'}, 400
+        if len(filas) > TRAMITES_BULK_MAX_ROWS:
+            return {'success': False, 'error': f"Máximo {TRAMITES_BULK_MAX_ROWS} trámites por carga"}, 400
+
+        resultados = [None] * len(filas)
+        validas = []
+        for indice, fila in enumerate(filas):
+            valores, error = _validar_fila(fila)
+            if error:
+                resultados[indice] = {'indice': indice, 'success': False, 'error': error}
+            else:
+                validas.append((indice, valores))
+
+        query = """
+            INSERT INTO tramites (nombre, descripcion, usuario_whatsapp, estado)
+            VALUES (%s, %s, %s, %s)
+            """
+        try:
+            if validas:
+                db = connectToMySQL('esquema_t')
+                with db.transaction() as cursor:
+                    incremento = _incremento_autoinc(db, cursor)
+                    for lote in _lotes(validas, TRAMITES_BULK_CHUNK):
+                        cursor.executemany(query, [valores for _, valores in lote])
+                        for desplazamiento, (indice, _) in enumerate(lote):
+                            resultados[indice] = {'indice': indice, 'success': True,
+                                                  'tramite_id': cursor.lastrowid + desplazamiento * incremento}
+                _invalidar(*(r['tramite_id'] for r in resultados if r and r['success']))
+                _invalidar_remitentes(*(valores[2] for _, valores in validas))
+        except Exception as e:
+            for indice, _ in validas:
+                resultados[indice] = {'indice': indice, 'success': False, 'error': 'Carga revertida'}
+            return {'success': False, 'error': str(e), 'creados': 0, 'resultados': resultados}, 400
+
+        creados = len(validas)
+        return {
+            'success': creados == len(filas),
+            'creados': creados,
+            'rechazados': len(filas) - creados,
+            'resultados': resultados
+        }, 201 if creados else 400
+
+    @staticmethod
+    def cambiar_estado_lote(ids, estado, desde=None):
+        """
+        UPDATE - Cambiar el estado de varios trámites a la vez
+
+        Args:
+            ids (list): Ids de los trámites
+            estado (str): Estado nuevo
+            desde (list, optional): Solo cambia los que estén en alguno de estos estados
+
+        Returns:
+            tuple: (filas actualizadas, status); no cuenta las que ya tenían ``estado``
+        """
+        if not isinstance(ids, list) or not ids or not all(type(i) is int for i in ids):
+            return {'success': False, 'error': "'ids' debe ser una lista de enteros"}, 400
+        if len(ids) > TRAMITES_BULK_MAX_ROWS:
+            return {'success': False, 'error': f"Máximo {TRAMITES_BULK_MAX_ROWS} trámites por carga"}, 400
+        if not isinstance(estado, str) or not estado or len(estado) > _LONGITUDES['estado']:
+            return {'success': False, 'error': "'estado' inválido"}, 400
+        if desde is not None and (not isinstance(desde, list) or not all(isinstance(e, str) for e in desde)):
+            return {'success': False, 'error': "'desde' debe ser una lista de estados"}, 400
+
+        ids = list(dict.fromkeys(ids))
+        try:
+            db = connectToMySQL('esquema_t')
+            actualizados = 0
+            remitentes = []
+            with db.transaction() as cursor:
+                for inicio in range(0, len(ids), TRAMITES_BULK_CHUNK):
+                    parte = ids[inicio:inicio + TRAMITES_BULK_CHUNK]
+                    remitentes += _remitentes(cursor, parte)
+                    query = f"UPDATE tramites SET estado = %s WHERE id IN ({', '.join(['%s'] * len(parte))})"
+                    valores = [estado] + parte
+                    if desde:
+                        query += f" AND estado IN ({', '.join(['%s'] * len(desde))})"
+                        valores += desde
+                    cursor.execute(query, tuple(valores))
+                    actualizados += cursor.rowcount
+            _invalidar(*ids)
+            _invalidar_remitentes(*remitentes)
+            return {'success': True, 'solicitados': len(ids), 'actualizados': actualizados}, 200
+        except Exception as e:
+            return {'success': False, 'error': str(e)}, 400
+
     @staticmethod
     def obtener_tramite(tramite_id):
-        """READ - Obtener un trámite por ID"""
+        """READ - Obtener un trámite por ID (desde el cache si está vigente)"""
         try:
+            tramite_id = int(tramite_id)
+            tramite = tramite_cache.get(tramite_id)
+            if tramite is not None:
+                return {'success': True, 'tramite': dict(tramite)}, 200
+
+            generacion = _generacion
             db = connectToMySQL('esquema_t')
             query = "SELECT * FROM tramites WHERE id = %s"
             resultado = db.query_db(query, (tramite_id,))
             
             if resultado:
-                tramite = Tramite(resultado[0])
-                return {'success': True, 'tramite': tramite.to_dict()}, 200
+                tramite = Tramite(resultado[0]).to_dict()
+                _guardar_en_cache(tramite_id, tramite, generacion)
+                return {'success': True, 'tramite': dict(tramite)}, 200
             else:
                 return {'success': False, 'error': 'Trámite no encontrado'}, 404
         except Exception as e:
             return {'success': False, 'error': str(e)}, 400
 
     @staticmethod
-    def obtener_todos_tramites():
-        """READ - Obtener todos los trámites"""
+    def etag(tramite):
+        """ETag de un trámite serializado: cambia con cada fecha_actualizacion"""
+        return f"{tramite['id']}-{tramite['fecha_actualizacion']}"
+
+    @staticmethod
+    def obtener_todos_tramites(limite=None, cursor=None, estado=None, usuario_whatsapp=None, campos=None):
+        """
+        READ - Listar trámites por páginas, del más reciente al más antiguo
+
+        Las filas se leen como tuplas y se escriben directo al cuerpo JSON
+        (``serializar_tramites``), sin un dict ni un Tramite por fila.
+
+        Args:
+            limite (int, optional): Trámites por página (hasta TRAMITES_MAX_PAGE_SIZE)
+            cursor (str, optional): Valor ``siguiente`` de la página anterior
+            estado (str, optional): Filtrar por estado
+            usuario_whatsapp (str, optional): Filtrar por número de WhatsApp
+            campos (list, optional): Columnas a devolver (por defecto todas)
+
+        Returns:
+            tuple: (cuerpo JSON en bytes, 200, headers) o (error, status)
+        """
+        try:
+            limite = min(max(1, int(limite or TRAMITES_PAGE_SIZE)), TRAMITES_MAX_PAGE_SIZE)
+            despues_de = _decodificar_cursor(cursor) if cursor else None
+            query, valores, columnas, seleccion = _consulta_listado(estado, usuario_whatsapp, campos, despues_de)
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}, 400
+
         try:
             db = connectToMySQL('esquema_t')
-            query = "SELECT * FROM tramites ORDER BY fecha_creacion DESC"
-            resultados = db.query_db(query)
-            
-            tramites = [Tramite(t).to_dict() for t in resultados] if resultados else []
-            return {
-                'success': True,
-                'tramites': tramites,
-                'total': len(tramites)
-            }, 200
+            # Se pide una fila de más para saber si hay página siguiente
+            resultados = db.query_rows(query + " LIMIT %s", tuple(valores + [limite + 1]))
+            if resultados is False:
+                return {'success': False, 'error': 'Error al listar trámites'}, 400
+
+            pagina = resultados[:limite]
+            siguiente = None
+            if len(resultados) > limite:
+                ultima = pagina[-1]
+                siguiente = _codificar_cursor(ultima[seleccion.index('fecha_creacion')], ultima[seleccion.index('id')])
+
+            cuerpo = serializar_tramites(pagina, columnas, bytearray(b'{"success":true,"tramites":'))
+            cuerpo += f',"total":{len(pagina)},"siguiente":{json.dumps(siguiente)}}}'.encode()
+            return bytes(cuerpo), 200, {'Content-Type': 'application/json'}
         except Exception as e:
             return {'success': False, 'error': str(e)}, 400
 
     @staticmethod
-    def actualizar_tramite(tramite_id, **kwargs):
-        """UPDATE - Actualizar un trámite"""
+    def exportar_tramites(estado=None, usuario_whatsapp=None, campos=None):
+        """
+        READ - Exportar todos los trámites filtrados como NDJSON (una línea por trámite)
+
+        Las filas se leen con un cursor sin buffer y se escriben a medida que
+        llegan, sin cargar la tabla en memoria.
+
+        Returns:
+            tuple: (generador de líneas, 200) o (error, 400)
+        """
         try:
+            query, valores, columnas, _ = _consulta_listado(estado, usuario_whatsapp, campos)
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}, 400
+
+        def lineas():
+            codificar = codificador_json(columnas)
             db = connectToMySQL('esquema_t')
-            
-            # Verificar que el trámite existe
-            query_check = "SELECT * FROM tramites WHERE id = %s"
-            existe = db.query_db(query_check, (tramite_id,))
-            
-            if not existe:
+            for fila in db.stream(query, tuple(valores), TRAMITES_EXPORT_FETCH):
+                yield codificar(fila) + "\n"
+
+        return lineas(), 200
+
+    @staticmethod
+    def actualizar_tramite(tramite_id, fecha_actualizacion=None, **kwargs):
+        """
+        UPDATE - Actualizar un trámite
+
+        Se hace el UPDATE y una sola lectura del resultado en la misma conexión.
+        Si se envía ``fecha_actualizacion`` (la versión que leyó el cliente), el
+        UPDATE solo aplica si nadie modificó el trámite desde entonces; en caso
+        contrario responde 409 con la versión actual.
+        """
+        try:
+            version = _version(fecha_actualizacion)
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}, 400
+
+        # Construir dinámicamente la consulta UPDATE
+        campos = []
+        valores = []
+        for key, value in kwargs.items():
+            if key in ['nombre', 'descripcion', 'estado', 'usuario_whatsapp']:
+                campos.append(f"{key} = %s")
+                valores.append(value)
+
+        if not campos:
+            return {'success': False, 'error': 'No hay campos para actualizar'}, 400
+
+        query = f"UPDATE tramites SET {', '.join(campos)} WHERE id = %s"
+        valores.append(tramite_id)
+        if version is not None:
+            query += " AND fecha_actualizacion = %s"
+            valores.append(version)
+
+        try:
+            db = connectToMySQL('esquema_t')
+            with db.cursor() as cursor:
+                # Solo al reasignar hace falta leer el dueño anterior; el actual sale de ``fila``
+                remitentes = _remitentes(cursor, [tramite_id]) if 'usuario_whatsapp' in kwargs else []
+                cursor.execute(query, tuple(valores))
+                actualizadas = cursor.rowcount
+                cursor.execute("SELECT * FROM tramites WHERE id = %s", (tramite_id,))
+                fila = cursor.fetchone()
+            _invalidar(tramite_id)
+            _invalidar_remitentes(*remitentes, *([fila['usuario_whatsapp']] if fila else []))
+
+            if not fila:
                 return {'success': False, 'error': 'Trámite no encontrado'}, 404
-            
-            # Construir dinámicamente la consulta UPDATE
-            campos = []
-            valores = []
-            for key, value in kwargs.items():
-                if key in ['nombre', 'descripcion', 'estado', 'usuario_whatsapp']:
-                    campos.append(f"{key} = %s")
-                    valores.append(value)
-            
-            if not campos:
-                return {'success': False, 'error': 'No hay campos para actualizar'}, 400
-            
-            valores.append(tramite_id)
-            query = f"UPDATE tramites SET {', '.join(campos)} WHERE id = %s"
-            
-            db.query_db(query, tuple(valores))
-            
-            # Retornar el trámite actualizado
-            resultado = db.query_db(query_check, (tramite_id,))
-            tramite = Tramite(resultado[0])
-            return {'success': True, 'tramite': tramite.to_dict()}, 200
+
+            tramite = Tramite(fila).to_dict()
+            # Sin filas afectadas: o no cambió nada, o la versión ya no coincide
+            if not actualizadas and version is not None and fila['fecha_actualizacion'] != version:
+                return {
+                    'success': False,
+                    'error': 'El trámite fue modificado por otra petición',
+                    'tramite': tramite
+                }, 409
+            return {'success': True, 'tramite': tramite}, 200
         except Exception as e:
             return {'success': False, 'error': str(e)}, 400
 
     @staticmethod
-    def eliminar_tramite(tramite_id):
-        """DELETE - Eliminar un trámite"""
+    def eliminar_tramite(tramite_id, fecha_actualizacion=None):
+        """
+        DELETE - Eliminar un trámite
+
+        Un solo DELETE; las filas afectadas indican si existía. Con
+        ``fecha_actualizacion`` solo se elimina si la versión coincide (409 si no).
+        """
+        try:
+            version = _version(fecha_actualizacion)
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}, 400
+
+        query = "DELETE FROM tramites WHERE id = %s"
+        valores = [tramite_id]
+        if version is not None:
+            query += " AND fecha_actualizacion = %s"
+            valores.append(version)
+
         try:
             db = connectToMySQL('esquema_t')
-            
-            # Verificar que existe
-            query_check = "SELECT * FROM tramites WHERE id = %s"
-            existe = db.query_db(query_check, (tramite_id,))
-            
-            if not existe:
+            with db.cursor() as cursor:
+                remitentes = _remitentes(cursor, [tramite_id])
+                cursor.execute(query, tuple(valores))
+                if cursor.rowcount:
+                    _invalidar(tramite_id)
+                    _invalidar_remitentes(*remitentes)
+                    return {'success': True, 'mensaje': 'Trámite eliminado exitosamente'}, 200
+                if version is None:
+                    return {'success': False, 'error': 'Trámite no encontrado'}, 404
+
+                # Solo en el caso de fallo se distingue "no existe" de "otra versión"
+                cursor.execute("SELECT * FROM tramites WHERE id = %s", (tramite_id,))
+                fila = cursor.fetchone()
+
+            if not fila:
                 return {'success': False, 'error': 'Trámite no encontrado'}, 404
-            
-            query = "DELETE FROM tramites WHERE id = %s"
-            db.query_db(query, (tramite_id,))
-            
-            return {'success': True, 'mensaje': 'Trámite eliminado exitosamente'}, 200
+            return {
+                'success': False,
+                'error': 'El trámite fue modificado por otra petición',
+                'tramite': Tramite(fila).to_dict()
+            }, 409
         except Exception as e:
             return {'success': False, 'error': str(e)}, 400
@@ -12,9 +12,55 @@ CREATE TABLE IF NOT EXISTS tramites (
     estado VARCHAR(20) DEFAULT 'pendiente',
     usuario_whatsapp VARCHAR(20),
     fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    INDEX idx_estado (estado),
-    INDEX idx_usuario_whatsapp (usuario_whatsapp)
+    fecha_actualizacion TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
+    -- Índices con la clave de orden del listado paginado (fecha_creacion, id)
+    INDEX idx_fecha_creacion (fecha_creacion, id),
+    INDEX idx_estado (estado, fecha_creacion, id),
+    INDEX idx_usuario_whatsapp (usuario_whatsapp, fecha_creacion, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- fecha_actualizacion es la versión del trámite (concurrencia optimista en
+-- PUT/DELETE); con milisegundos dos ediciones en el mismo segundo no se confunden.
+
+-- En bases ya creadas, ampliar los índices del listado paginado:
+-- ALTER TABLE tramites
+--     ADD INDEX idx_fecha_creacion (fecha_creacion, id),
+--     DROP INDEX idx_estado, ADD INDEX idx_estado (estado, fecha_creacion, id),
+--     DROP INDEX idx_usuario_whatsapp, ADD INDEX idx_usuario_whatsapp (usuario_whatsapp, fecha_creacion, id);
+-- y la precisión de la versión:
+-- ALTER TABLE tramites MODIFY fecha_actualizacion
+--     TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3);
+
+-- Historial de conversación por remitente de WhatsApp (SESSION_STORE=mysql)
+CREATE TABLE IF NOT EXISTS sesiones_whatsapp (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    usuario_whatsapp VARCHAR(32) NOT NULL,
+    remitente VARCHAR(20) NOT NULL,
+    texto TEXT NOT NULL,
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_sesion_usuario (usuario_whatsapp, id),
+    INDEX idx_sesion_fecha (fecha_creacion)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Webhooks de Twilio ya procesados (deduplicación por MessageSid)
+CREATE TABLE IF NOT EXISTS webhooks_procesados (
+    message_sid VARCHAR(64) PRIMARY KEY,
+    estado VARCHAR(20) NOT NULL,
+    respuesta TEXT NULL,
+    actualizado DOUBLE NOT NULL,
+    INDEX idx_webhook_actualizado (actualizado)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Callbacks de estado de Twilio (escritos por lotes desde /api/whatsapp/status)
+CREATE TABLE IF NOT EXISTS estados_mensajes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    message_sid VARCHAR(64) NOT NULL,
+    estado VARCHAR(20) NOT NULL,
+    destinatario VARCHAR(32) NULL,
+    codigo_error VARCHAR(10) NULL,
+    fecha_evento DATETIME(3) NOT NULL,
+    INDEX idx_estado_sid (message_sid, id),
+    INDEX idx_estado_fecha (estado, fecha_evento)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Verificar que todo fue creado correctamente
@@ -2,20 +2,59 @@
 
 Responsabilidades:
 - Definir el prompt de sistema que acota el dominio del chatbot.
-- Convertir el historial local en el formato esperado por el SDK.
+- Convertir el historial local en el formato esperado por el SDK, acotado por tokens.
 - Gestionar la llamada al proveedor generativo (Gemini) y un modo local de respaldo.
 - Modo demo: simula respuestas para testing sin API key.
+- Reutilizar el modelo configurado entre peticiones (registro de modelos).
+- Cachear respuestas a preguntas repetidas (exactas o parecidas) para no llamar al proveedor.
+- Enrutar por intencion las preguntas de politicas sin pasar por el LLM.
+- Regular tasa y concurrencia de llamadas a Gemini (espera breve antes de degradar).
+- Cortar al respaldo local mientras Gemini falla o va lento (circuit breaker) y
+  acotar cada llamada con un plazo, con intentos paralelos opcionales.
+- Respetar el plazo de la petición (``services.deadline``) si hay uno activo.
 """
 
 from __future__ import annotations
 
+import hashlib
 import logging
 import random
-from typing import Any, Dict, List, Optional
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import google.generativeai as genai
 
-from config import DEFAULT_MODEL_NAME, GEMINI_API_KEY
+from config import (
+    DEFAULT_MODEL_NAME,
+    GEMINI_API_KEY,
+    GEMINI_CALL_TIMEOUT,
+    GEMINI_HEDGE_AFTER,
+    GEMINI_MAX_ATTEMPTS,
+    HISTORY_KEEP_TURNS,
+    HISTORY_SUMMARY_TOKENS,
+    HISTORY_TOKEN_BUDGET,
+    INTENT_ROUTER_INTENTS,
+    INTENT_ROUTER_THRESHOLD,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_WITH_HISTORY,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_THRESHOLD,
+)
+from model.semantic_cache import SemanticCache
+from services.cache import TTLCache
+from services.deadline import current_deadline, remaining_timeout
+from services.rate_limit import RateLimited, get_gemini_limiter
+from services.resilience import (
+    CircuitOpen,
+    DeadlineExceeded,
+    call_with_deadline,
+    call_with_deadline_async,
+    get_gemini_breaker,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -48,28 +87,255 @@ Reglas de seguridad y limites:
 - Prefiere listas numeradas o bullet points cuando des procedimientos.
 """
 
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_NONE",
+    },
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_NONE",
+    },
+]
+
+GENERATION_CONFIG = {
+    "temperature": 0.6,
+    "top_p": 0.9,
+    "candidate_count": 1,
+    "max_output_tokens": 256,
+}
+
+
+class ModelRegistry:
+    """Cache de modelos Gemini configurados, compartido entre hilos.
+
+    La clave es (api_key, modelo, prompt de sistema, generation config), de modo
+    que en estado estable cada peticion reutiliza el mismo objeto y su transporte.
+    ``genai.configure`` solo se vuelve a invocar cuando cambia la API key.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple[Any, ...], Any] = {}
+        self._configured_key: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(
+        api_key: str,
+        model_name: str,
+        system_instruction: str,
+        generation_config: Dict[str, Any],
+    ) -> Tuple[Any, ...]:
+        return (api_key, model_name, system_instruction, tuple(sorted(generation_config.items())))
+
+    def get(
+        self,
+        api_key: str,
+        model_name: str,
+        system_instruction: str = SYSTEM_PROMPT,
+        generation_config: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """Retorna el modelo para la configuracion dada, creandolo si no existe."""
+
+        config = generation_config or GENERATION_CONFIG
+        key = self._key(api_key, model_name, system_instruction, config)
+
+        model = self._models.get(key)
+        if model is not None:
+            self.hits += 1
+            return model
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.hits += 1
+                return model
+
+            self.misses += 1
+            if self._configured_key != api_key:
+                genai.configure(api_key=api_key)
+                self._configured_key = api_key
+
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                system_instruction=system_instruction,
+                safety_settings=SAFETY_SETTINGS,
+                generation_config=config,
+            )
+            self._models[key] = model
+            return model
+
+    def stats(self) -> Dict[str, Any]:
+        """Aciertos, fallos y tasa de acierto del registro."""
+
+        total = self.hits + self.misses
+        return {
+            "models": len(self._models),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._configured_key = None
+
+
+model_registry = ModelRegistry()
+
+# Cache de respuestas: clave (modelo, mensaje normalizado, huella del historial).
+response_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+# Productos del catalogo y sus alias (texto normalizado): el cache semantico
+# nunca reutiliza la respuesta de un producto para otro.
+PRODUCT_ENTITIES = {
+    "nova_air": ("nova air", "laptop", "laptops", "portatil", "portatiles", "computador", "computadora"),
+    "router_wave": ("router wave wifi 6", "router wave", "wave wifi 6", "router", "routers", "wave", "modem"),
+    "pulse_pro": ("reloj pulse pro", "pulse pro", "pulse", "reloj", "relojes", "smartwatch"),
+    "aeropods": ("aeropods", "aeropod", "audifonos", "auriculares"),
+    "kit_iot": ("kits iot", "kit iot", "iot", "hogar seguro"),
+}
+
+# Cache semantico: atrapa variantes de una pregunta que el cache exacto no ve.
+semantic_cache = SemanticCache(
+    maxsize=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD, entities=PRODUCT_ENTITIES
+)
+
+# Tasa, concurrencia y salud del proveedor, compartidas por todo el proceso.
+gemini_limiter = get_gemini_limiter()
+gemini_breaker = get_gemini_breaker()
+
+# Con menos plazo que esto no vale la pena llamar al proveedor.
+_MIN_PROVIDER_SECONDS = 1.0
+
+# Errores por los que se responde con el respaldo local sin volcar la traza.
+_PROVIDER_UNAVAILABLE = (RateLimited, CircuitOpen, DeadlineExceeded)
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_message(text: str) -> str:
+    """Minusculas, sin tildes ni puntuacion y con espacios colapsados."""
+
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_WORD_RE.sub(" ", stripped).strip()
+
+
+def history_fingerprint(history: Optional[List[Dict[str, Any]]]) -> str:
+    """Huella estable del historial para distinguir turnos con distinto contexto."""
+
+    if not history:
+        return ""
+    digest = hashlib.blake2b(digest_size=12)
+    for msg in history:
+        digest.update(str(msg.get("sender", "")).encode("utf-8"))
+        digest.update(b"\x1f")
+        digest.update(normalize_message(str(msg.get("text", ""))).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+# Respuestas deterministas por intencion (respaldo local y ruta rapida en produccion).
+FALLBACK_RESPONSES = {
+    "horario": "Atendemos lunes a viernes 8:00-18:00 y sabados 9:00-14:00. Tambien puedes escribir a soporte@novagadgets.co.",
+    "garantia": "La garantia es de 12 meses para hardware y 6 meses para accesorios. Guarda la factura y el numero de serie para tramites.",
+    "devolucion": "Puedes solicitar devolucion dentro de 30 dias si el producto esta intacto. Gestionamos un numero RMA y coordinamos la recoleccion.",
+    "envio": "Enviamos en Colombia en 2 a 5 dias habiles; zonas remotas pueden tardar hasta 7 dias. Compartimos numero de guia para seguimiento.",
+    "configuracion": "Sigue estos pasos rapidos: 1) Carga el dispositivo o conectalo a energia. 2) Descarga la app NovaGadgets. 3) Conecta a tu red WiFi de 2.4 o 5 GHz. 4) Actualiza firmware si la app lo sugiere.",
+    "contacto": "Puedes hablar con un agente al 01-8000-123-456 o escribir a soporte@novagadgets.co. Describe el modelo y el problema.",
+}
+
+# Palabras clave por intencion, en orden de prioridad para desempates.
+# Se comparan como subcadenas del mensaje normalizado (sin tildes ni mayusculas).
+INTENT_KEYWORDS = {
+    "precio": ["precio", "costo", "cuanto cuesta"],
+    "horario": ["horario", "cuando atienden"],
+    "garantia": ["garant"],
+    "envio": ["envio", "entrega", "transporte"],
+    "devolucion": ["devolu", "cambio", "reembolso"],
+    "pago": ["pago", "pagar"],
+    "configuracion": ["configurar", "instalar", "activar"],
+    "contacto": ["contacto", "humano", "asesor"],
+}
+
+# Mensajes de hasta esta cantidad de palabras no se penalizan por longitud.
+_ROUTER_SHORT_MESSAGE_WORDS = 8
+
+
+class IntentMatch(NamedTuple):
+    intent: Optional[str]
+    confidence: float
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """Construye una alternancia factorizada por prefijos (un trie en forma de regex).
+
+    En cada posicion el motor recorre a lo sumo un camino del trie, asi que el
+    costo de buscar todas las palabras crece con el largo del mensaje y no con
+    la cantidad de palabras clave.
+    """
+
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+_KEYWORD_INTENT = {
+    normalize_message(keyword): intent
+    for intent, keywords in INTENT_KEYWORDS.items()
+    for keyword in keywords
+}
+_INTENT_PRIORITY = {intent: i for i, intent in enumerate(INTENT_KEYWORDS)}
+_INTENT_RE = re.compile(_trie_regex(_KEYWORD_INTENT))
+
+
+def route_intent(user_message: str, allowed: Optional[Iterable[str]] = None) -> IntentMatch:
+    """Detecta la intencion del mensaje con una sola pasada de regex.
+
+    ``allowed`` limita las intenciones candidatas. La confianza combina cuanto
+    domina la intencion ganadora sobre el resto de coincidencias (de todas las
+    intenciones) y la brevedad del mensaje.
+    """
+
+    normalized = normalize_message(user_message)
+    scores: Dict[str, int] = {}
+    for found in _INTENT_RE.finditer(normalized):
+        intent = _KEYWORD_INTENT[found.group()]
+        scores[intent] = scores.get(intent, 0) + len(found.group())
+
+    candidates = [i for i in scores if allowed is None or i in allowed]
+    if not candidates:
+        return IntentMatch(None, 0.0)
+
+    best = max(candidates, key=lambda i: (scores[i], -_INTENT_PRIORITY[i]))
+    dominance = scores[best] / sum(scores.values())
+    brevity = min(1.0, _ROUTER_SHORT_MESSAGE_WORDS / max(1, len(normalized.split())))
+    return IntentMatch(best, round(dominance * brevity, 4))
+
 
 def get_demo_response(user_message: str) -> str:
     """Retorna una respuesta simulada basada en keywords (modo demo)."""
-    message_lower = user_message.lower()
-    
-    # Buscar palabras clave
-    keywords_map = {
-        "precio": DEMO_RESPONSES["precio"],
-        "costo": DEMO_RESPONSES["precio"],
-        "cuanto cuesta": DEMO_RESPONSES["precio"],
-        "garantia": DEMO_RESPONSES["garantia"],
-        "envio": DEMO_RESPONSES["envio"],
-        "entrega": DEMO_RESPONSES["envio"],
-        "devolucion": DEMO_RESPONSES["devolucion"],
-        "cambio": DEMO_RESPONSES["devolucion"],
-        "pago": DEMO_RESPONSES["pago"],
-        "pagar": DEMO_RESPONSES["pago"],
-    }
-    
-    for keyword, response in keywords_map.items():
-        if keyword in message_lower:
-            return response
+    match = route_intent(user_message, DEMO_RESPONSES)
+    if match.intent:
+        return DEMO_RESPONSES[match.intent]
     
     # Respuesta por defecto amigable
     default_responses = [
@@ -80,14 +346,103 @@ def get_demo_response(user_message: str) -> str:
     return random.choice(default_responses)
 
 
+def estimate_tokens(text: str) -> int:
+    """Aproximacion barata de tokens (~4 caracteres por token en espanol)."""
+
+    return len(text) // 4 + 1
+
+
+# Estado del resumen por huella del historial antiguo: (temas, preguntas recientes).
+_summary_cache = TTLCache(maxsize=1024, ttl=3600)
+_SUMMARY_QUESTIONS = 5
+_SUMMARY_QUESTION_CHARS = 120
+
+
+def _summary_state(older: List[Dict[str, Any]]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Estado del resumen de ``older``, extendiendo el del turno anterior si esta en cache."""
+
+    key = history_fingerprint(older)
+    state = _summary_cache.get(key)
+    if state is not None:
+        return state
+
+    # Resumen incremental: el historial antiguo crece de a un turno (2 mensajes).
+    previous = _summary_cache.get(history_fingerprint(older[:-2])) if len(older) > 2 else None
+    if previous is not None:
+        topics, questions = list(previous[0]), list(previous[1])
+        pending = older[-2:]
+    else:
+        topics, questions = [], []
+        pending = older
+
+    for msg in pending:
+        if msg.get("sender") != "Usuario":
+            continue
+        text = " ".join(str(msg.get("text", "")).split())
+        intent = route_intent(text).intent
+        if intent and intent not in topics:
+            topics.append(intent)
+        if text:
+            questions.append(text[:_SUMMARY_QUESTION_CHARS])
+
+    state = (tuple(topics), tuple(questions[-_SUMMARY_QUESTIONS:]))
+    _summary_cache.set(key, state)
+    return state
+
+
+def summarize_history(older: List[Dict[str, Any]], max_tokens: int = HISTORY_SUMMARY_TOKENS) -> str:
+    """Resumen extractivo y local de los turnos antiguos, acotado a ``max_tokens``."""
+
+    topics, questions = _summary_state(older)
+    parts = ["Resumen de la conversacion previa."]
+    if topics:
+        parts.append("Temas tratados: " + ", ".join(topics) + ".")
+    if questions:
+        parts.append("Ultimas preguntas del usuario: " + " | ".join(questions))
+    summary = " ".join(parts)
+    max_chars = max(0, (max_tokens - 1) * 4)
+    return summary if len(summary) <= max_chars else summary[:max_chars].rstrip() + "..."
+
+
+def compact_history(
+    history: List[Dict[str, Any]],
+    token_budget: int = HISTORY_TOKEN_BUDGET,
+    keep_turns: int = HISTORY_KEEP_TURNS,
+) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """Separa el historial en (resumen de lo antiguo, mensajes recientes literales).
+
+    Se conservan a lo sumo ``keep_turns`` turnos literales y solo mientras quepan
+    en el presupuesto (descontando el del resumen); el resto se resume.
+    """
+
+    recent = history[-keep_turns * 2:] if keep_turns > 0 else []
+    budget = token_budget - HISTORY_SUMMARY_TOKENS
+    used = sum(estimate_tokens(str(m.get("text", ""))) for m in recent)
+    while recent and used > budget:
+        used -= estimate_tokens(str(recent[0].get("text", "")))
+        recent = recent[1:]
+
+    older = history[:len(history) - len(recent)]
+    return (summarize_history(older) if older else None), recent
+
+
 def build_messages(
     user_message: str,
     history: Optional[List[Dict[str, Any]]] = None,
 ) -> List[Dict[str, Any]]:
-    """Convierte historial y mensaje actual al formato requerido por el SDK."""
+    """Convierte historial y mensaje actual al formato requerido por el SDK.
+
+    El historial se compacta con ``compact_history`` para que el tamano del
+    prompt no crezca con la longitud de la conversacion.
+    """
 
     messages: List[Dict[str, Any]] = []
-    for msg in history or []:
+    summary, recent = compact_history(history or [])
+    if summary:
+        messages.append({"role": "user", "parts": [summary]})
+        messages.append({"role": "model", "parts": ["Entendido."]})
+
+    for msg in recent:
         role = "user" if msg.get("sender") == "Usuario" else "model"
         messages.append({"role": role, "parts": [msg.get("text", "")]})
 
@@ -100,22 +455,74 @@ def build_messages(
 def _local_fallback(user_message: str) -> str:
     """Respuesta determinista cuando no hay clave o el modelo falla."""
 
-    lower = user_message.lower()
+    match = route_intent(user_message, FALLBACK_RESPONSES)
+    if match.intent:
+        return FALLBACK_RESPONSES[match.intent]
 
-    rules = [
-        (["horario", "cuando atienden"], "Atendemos lunes a viernes 8:00-18:00 y sabados 9:00-14:00. Tambien puedes escribir a soporte@novagadgets.co."),
-        (["garantia", "garant"], "La garantia es de 12 meses para hardware y 6 meses para accesorios. Guarda la factura y el numero de serie para tramites."),
-        (["devolu", "cambio", "reembolso"], "Puedes solicitar devolucion dentro de 30 dias si el producto esta intacto. Gestionamos un numero RMA y coordinamos la recoleccion."),
-        (["envio", "entrega", "transporte"], "Enviamos en Colombia en 2 a 5 dias habiles; zonas remotas pueden tardar hasta 7 dias. Compartimos numero de guia para seguimiento."),
-        (["configurar", "instalar", "activar"], "Sigue estos pasos rapidos: 1) Carga el dispositivo o conectalo a energia. 2) Descarga la app NovaGadgets. 3) Conecta a tu red WiFi de 2.4 o 5 GHz. 4) Actualiza firmware si la app lo sugiere."),
-        (["contacto", "humano", "asesor"], "Puedes hablar con un agente al 01-8000-123-456 o escribir a soporte@novagadgets.co. Describe el modelo y el problema."),
-    ]
+    return "Solo puedo ayudarte con informacion de soporte y ventas de NovaGadgets. Si necesitas algo mas especifico, dime el modelo y el problema."
 
-    for keywords, response in rules:
-        if any(k in lower for k in keywords):
-            return response
 
-    return "Solo puedo ayudarte con informacion de soporte y ventas de NovaGadgets. Si necesitas algo mas especifico, dime el modelo y el problema."
+def _prepare_turn(
+    user_message: str,
+    history: Optional[List[Dict[str, Any]]],
+    api_key: Optional[str],
+    model_name: Optional[str],
+    use_cache: bool,
+) -> Tuple[Optional[str], Dict[str, Any]]:
+    """Resuelve el turno sin proveedor si es posible.
+
+    Retorna (respuesta local o None, contexto para llamar al modelo y cachear).
+    """
+
+    key = api_key or GEMINI_API_KEY
+    turn: Dict[str, Any] = {"key": key, "model": model_name or DEFAULT_MODEL_NAME, "cache_key": None}
+
+    if not key or key == "your_gemini_api_key_here":
+        # Modo DEMO: usar respuestas simuladas
+        logger.info("Usando modo DEMO (API key no configurada)")
+        return get_demo_response(user_message), turn
+
+    # Ruta rapida: politicas fijas (horario, garantia...) no necesitan al LLM.
+    match = route_intent(user_message, INTENT_ROUTER_INTENTS)
+    if match.intent and match.confidence >= INTENT_ROUTER_THRESHOLD:
+        logger.info(f"Intencion '{match.intent}' resuelta localmente ({match.confidence:.2f})")
+        return FALLBACK_RESPONSES[match.intent], turn
+
+    if use_cache and (RESPONSE_CACHE_WITH_HISTORY or not history):
+        normalized = normalize_message(user_message)
+        scope = (turn["model"], history_fingerprint(history))
+        cache_key = scope + (normalized,)
+        turn.update(cache_key=cache_key, normalized=normalized, scope=scope)
+
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached, turn
+
+        similar = semantic_cache.lookup(normalized, scope)
+        if similar is not None:
+            logger.info(f"Respuesta desde cache semantico (similitud {similar[1]:.2f})")
+            response_cache.set(cache_key, similar[0])
+            return similar[0], turn
+
+    turn["messages"] = build_messages(user_message, history or [])
+    return None, turn
+
+
+def _remember(turn: Dict[str, Any], text: str) -> None:
+    """Guarda una respuesta del proveedor en los caches del turno."""
+
+    if turn["cache_key"] is not None:
+        response_cache.set(turn["cache_key"], text)
+        semantic_cache.add(turn["normalized"], text, turn["scope"])
+
+
+def _provider_timeout() -> Optional[float]:
+    """Timeout de la llamada al proveedor según GEMINI_CALL_TIMEOUT y el plazo activo."""
+
+    deadline = current_deadline()
+    if deadline is not None and deadline.remaining() < _MIN_PROVIDER_SECONDS:
+        raise DeadlineExceeded(f"Quedan {deadline.remaining():.2f}s del plazo, no alcanza para el proveedor")
+    return remaining_timeout(GEMINI_CALL_TIMEOUT, "llamar al proveedor")
 
 
 def generate_response(
@@ -123,49 +530,191 @@ def generate_response(
     history: Optional[List[Dict[str, Any]]] = None,
     api_key: Optional[str] = None,
     model_name: Optional[str] = None,
+    use_cache: bool = True,
 ) -> str:
-    """Genera la respuesta del asistente."""
+    """Genera la respuesta del asistente.
 
-    key = api_key or GEMINI_API_KEY
-    messages = build_messages(user_message, history or [])
+    ``use_cache=False`` omite el cache de respuestas (turnos que dependen del
+    contexto). Con historial, el cache solo se usa si RESPONSE_CACHE_WITH_HISTORY.
+    Con un plazo activo, la espera y la llamada se acotan a lo que queda de él.
+    """
 
-    if not key or key == "your_gemini_api_key_here":
-        # Modo DEMO: usar respuestas simuladas
-        logger.info("Usando modo DEMO (API key no configurada)")
-        return get_demo_response(user_message)
+    local, turn = _prepare_turn(user_message, history, api_key, model_name, use_cache)
+    if local is not None:
+        return local
 
     try:
-        genai.configure(api_key=key)
-
-        model = genai.GenerativeModel(
-            model_name=model_name or DEFAULT_MODEL_NAME,
-            system_instruction=SYSTEM_PROMPT,
+        model = model_registry.get(turn["key"], turn["model"])
+
+        timeout = _provider_timeout()
+        # Cada intento (también los paralelos) ocupa su turno hasta terminar;
+        # el circuito se consulta ya con turno, así la cola local no cuenta como fallo.
+        response = call_with_deadline(
+            lambda: model.generate_content(contents=turn["messages"]),
+            timeout,
+            GEMINI_HEDGE_AFTER,
+            GEMINI_MAX_ATTEMPTS,
+            limiter=gemini_limiter,
+            queue_timeout=remaining_timeout(None, "esperar turno"),
+            breaker=gemini_breaker,
         )
 
-        response = model.generate_content(
-            contents=messages,
-            safety_settings=[
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE",
-                },
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_NONE",
-                },
-            ],
-            generation_config={
-                "temperature": 0.6,
-                "top_p": 0.9,
-                "candidate_count": 1,
-                "max_output_tokens": 256,
-            },
+        text = getattr(response, "text", None) or str(response)
+        cleaned = text.strip()
+        if not cleaned:
+            return _local_fallback(user_message)
+
+        _remember(turn, cleaned)
+        return cleaned
+
+    except _PROVIDER_UNAVAILABLE as e:
+        logger.warning(f"Proveedor no disponible, se usa respaldo local: {e}")
+        return _local_fallback(user_message)
+    except Exception:
+        logger.exception("Error generando respuesta con el proveedor remoto")
+        return _local_fallback(user_message)
+
+
+async def generate_response_async(
+    user_message: str,
+    history: Optional[List[Dict[str, Any]]] = None,
+    api_key: Optional[str] = None,
+    model_name: Optional[str] = None,
+    use_cache: bool = True,
+) -> str:
+    """Version asincrona de ``generate_response`` para el modo ASGI.
+
+    La llamada al proveedor se espera con ``generate_content_async`` en vez de
+    bloquear un hilo, de modo que un proceso atiende muchos chats en vuelo.
+    """
+
+    local, turn = _prepare_turn(user_message, history, api_key, model_name, use_cache)
+    if local is not None:
+        return local
+
+    try:
+        model = model_registry.get(turn["key"], turn["model"])
+
+        timeout = _provider_timeout()
+        response = await call_with_deadline_async(
+            lambda: model.generate_content_async(contents=turn["messages"]),
+            timeout,
+            GEMINI_HEDGE_AFTER,
+            GEMINI_MAX_ATTEMPTS,
+            limiter=gemini_limiter,
+            queue_timeout=remaining_timeout(None, "esperar turno"),
+            breaker=gemini_breaker,
         )
 
         text = getattr(response, "text", None) or str(response)
         cleaned = text.strip()
-        return cleaned or _local_fallback(user_message)
+        if not cleaned:
+            return _local_fallback(user_message)
+
+        _remember(turn, cleaned)
+        return cleaned
 
+    except _PROVIDER_UNAVAILABLE as e:
+        logger.warning(f"Proveedor no disponible, se usa respaldo local: {e}")
+        return _local_fallback(user_message)
     except Exception:
-        logger.exception("Error generando respuesta con el proveedor remoto")
+        logger.exception("Error generando respuesta asincrona con el proveedor remoto")
         return _local_fallback(user_message)
+
+
+_STREAM_END = object()
+
+
+def _close_stream(response: Any) -> None:
+    """Cierra un stream abandonado para que el proveedor deje de enviar fragmentos."""
+
+    for target in (response, getattr(response, "_iterator", None)):
+        for name in ("close", "cancel"):
+            method = getattr(target, name, None)
+            if callable(method):
+                try:
+                    method()
+                except Exception:
+                    logger.debug("No se pudo cerrar el stream del proveedor", exc_info=True)
+                return
+
+
+def generate_response_stream(
+    user_message: str,
+    history: Optional[List[Dict[str, Any]]] = None,
+    api_key: Optional[str] = None,
+    model_name: Optional[str] = None,
+    use_cache: bool = True,
+) -> Iterator[str]:
+    """Version en streaming de ``generate_response``: produce fragmentos de texto.
+
+    Las respuestas locales (demo, intenciones, cache) salen en un solo fragmento.
+    Si el proveedor falla antes del primer fragmento se usa el respaldo local.
+    Cada fragmento espera como mucho GEMINI_CALL_TIMEOUT (y lo que quede del plazo
+    activo); al vencer, el stream del proveedor se cierra.
+    """
+
+    local, turn = _prepare_turn(user_message, history, api_key, model_name, use_cache)
+    if local is not None:
+        yield local
+        return
+
+    parts: List[str] = []
+    try:
+        model = model_registry.get(turn["key"], turn["model"])
+        _provider_timeout()
+        # El turno se mantiene mientras dura el stream; la espera se acota al plazo activo.
+        with gemini_limiter.slot(remaining_timeout(None, "esperar turno")):
+            gemini_breaker.allow()
+            started = time.monotonic()
+            first_chunk: Optional[float] = None
+            response = None
+            finished = False
+            try:
+                response = call_with_deadline(
+                    lambda: model.generate_content(contents=turn["messages"], stream=True),
+                    remaining_timeout(GEMINI_CALL_TIMEOUT, "llamar al proveedor"),
+                )
+                chunks = iter(response)
+                while True:
+                    # Cada fragmento dispone de GEMINI_CALL_TIMEOUT, sin pasar del plazo activo.
+                    chunk = call_with_deadline(
+                        lambda: next(chunks, _STREAM_END),
+                        remaining_timeout(GEMINI_CALL_TIMEOUT, "esperar fragmento"),
+                    )
+                    if chunk is _STREAM_END:
+                        break
+                    text = getattr(chunk, "text", None)
+                    if text:
+                        if first_chunk is None:
+                            first_chunk = time.monotonic() - started
+                        parts.append(text)
+                        yield text
+                finished = True
+            except GeneratorExit:
+                gemini_breaker.release()
+                raise
+            except Exception:
+                gemini_breaker.record(False, time.monotonic() - started)
+                raise
+            finally:
+                if response is not None and not finished:
+                    _close_stream(response)
+            # Para el circuito, la latencia de un stream es la del primer fragmento.
+            gemini_breaker.record(True, first_chunk if first_chunk is not None else time.monotonic() - started)
+    except _PROVIDER_UNAVAILABLE as e:
+        logger.warning(f"Proveedor no disponible, se usa respaldo local: {e}")
+        # Una respuesta cortada por plazo no se completa con el respaldo ni se guarda en cache.
+        if parts:
+            return
+    except Exception:
+        logger.exception("Error en streaming con el proveedor remoto")
+        if parts:
+            return
+
+    full = "".join(parts).strip()
+    if not full:
+        yield _local_fallback(user_message)
+        return
+
+    _remember(turn, full)
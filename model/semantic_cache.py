@@ -0,0 +1,251 @@
+"""Cache semantico local basado en TF-IDF de n-gramas de caracteres.
+
+Complementa el cache exacto del asistente: si una pregunta nueva se parece lo
+suficiente (similitud coseno) a una ya respondida, se reutiliza la respuesta.
+Todo ocurre en memoria y sin red; los vectores son dispersos (diccionarios) y un
+indice invertido limita la busqueda a entradas que comparten n-gramas.
+
+Antes de vectorizar, el texto se lleva a una forma canonica: los alias de cada
+producto pasan a un solo token, las formas de preguntar lo mismo ("cuanto
+cuesta", "valor") a una sola palabra y se quitan las palabras vacias. Dos
+preguntas solo comparten respuesta si mencionan exactamente los mismos
+productos: "garantia del router" nunca reutiliza la del reloj. Tampoco se
+mezclan una pregunta negada y su afirmativa ("no puedo pagar con pse"), que
+los n-gramas apenas distinguen.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, Mapping, Optional, Sequence, Set, Tuple
+
+
+# Formas equivalentes de pedir lo mismo (texto ya normalizado)
+SYNONYMS: Dict[str, str] = {
+    "cuanto cuesta": "precio",
+    "cuanto cuestan": "precio",
+    "cuanto vale": "precio",
+    "cuanto valen": "precio",
+    "cuanto sale": "precio",
+    "valor": "precio",
+    "costo": "precio",
+    "precios": "precio",
+    "envios": "envio",
+    "garantias": "garantia",
+    "devoluciones": "devolucion",
+}
+
+# Palabras que invierten el sentido de la pregunta; su presencia es parte de la llave
+NEGATORS: FrozenSet[str] = frozenset({"no", "nunca", "sin", "tampoco"})
+
+# Marca de negacion en la llave exacta (no puede coincidir con un producto)
+NEGATED = "~negada"
+
+# Palabras que no distinguen una pregunta de otra ("no" se conserva)
+STOPWORDS: FrozenSet[str] = frozenset(
+    "a al de del el la las lo los un una unos unas y o e que cual cuales es son "
+    "me mi mis tu tus su sus por para con en se le les hola".split()
+)
+
+
+def _alternation(phrases: Sequence[str]) -> "re.Pattern[str]":
+    ordered = sorted(set(phrases), key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(p) for p in ordered) + r")\b")
+
+
+def char_ngrams(text: str, n: int = 3) -> Counter:
+    """Frecuencia de n-gramas de caracteres de un texto ya normalizado."""
+
+    padded = f" {text} "
+    if len(padded) <= n:
+        return Counter([padded])
+    return Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+class Canonicalizer:
+    """Forma canonica de una pregunta normalizada y su llave exacta.
+
+    La llave son los productos que menciona mas ``NEGATED`` si lleva una negacion.
+    """
+
+    def __init__(self, entities: Optional[Mapping[str, Sequence[str]]] = None,
+                 synonyms: Mapping[str, str] = SYNONYMS, stopwords: FrozenSet[str] = STOPWORDS):
+        self._entity_of = {alias: name for name, aliases in (entities or {}).items() for alias in aliases}
+        self._entity_re = _alternation(list(self._entity_of)) if self._entity_of else None
+        self._synonyms = dict(synonyms)
+        self._synonym_re = _alternation(list(self._synonyms)) if self._synonyms else None
+        self._names = frozenset(self._entity_of.values())
+        self._stopwords = stopwords
+
+    def __call__(self, text: str) -> Tuple[str, FrozenSet[str]]:
+        if self._entity_re is not None:
+            text = self._entity_re.sub(lambda m: self._entity_of[m.group(0)], text)
+        if self._synonym_re is not None:
+            text = self._synonym_re.sub(lambda m: self._synonyms[m.group(0)], text)
+        words = [w for w in text.split() if w not in self._stopwords]
+        key = {w for w in words if w in self._names}
+        if NEGATORS.intersection(words):
+            key.add(NEGATED)
+        return " ".join(words), frozenset(key)
+
+
+class _Entry:
+    __slots__ = ("scope", "text", "entities", "grams", "answer", "weights", "norm", "version")
+
+    def __init__(self, scope: Hashable, text: str, entities: FrozenSet[str], grams: Counter, answer: str):
+        self.scope = scope
+        self.text = text
+        self.entities = entities
+        self.grams = grams
+        self.answer = answer
+        # Pesos TF-IDF y norma; se recalculan solo cuando cambia el IDF del indice
+        self.weights: Dict[str, float] = {}
+        self.norm = 0.0
+        self.version = -1
+
+
+class SemanticCache:
+    """Indice acotado de preguntas respondidas con busqueda por similitud coseno.
+
+    ``entities`` mapea cada producto a sus alias; las entradas solo se comparan
+    con preguntas que mencionan los mismos productos y con la misma polaridad
+    (afirmativa o negada).
+    """
+
+    def __init__(self, maxsize: int = 256, threshold: float = 0.85, ngram: int = 3,
+                 entities: Optional[Mapping[str, Sequence[str]]] = None):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ngram = ngram
+        self.canonicalize = Canonicalizer(entities)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_text: Dict[Tuple[Hashable, str], int] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._next_id = 0
+        # Cambia con cada alta o desalojo (el IDF depende del tamaño del indice)
+        self._version = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entity_mismatches = 0
+        self._lookup_seconds = 0.0
+        self._hit_seconds = 0.0
+
+    def _idf(self, gram: str) -> float:
+        df = len(self._postings.get(gram, ()))
+        return math.log((1 + len(self._entries)) / (1 + df)) + 1.0
+
+    def _weights(self, grams: Counter) -> Dict[str, float]:
+        return {g: tf * self._idf(g) for g, tf in grams.items()}
+
+    def _entry_weights(self, entry: _Entry) -> Tuple[Dict[str, float], float]:
+        if entry.version != self._version:
+            entry.weights = self._weights(entry.grams)
+            entry.norm = math.sqrt(sum(w * w for w in entry.weights.values()))
+            entry.version = self._version
+        return entry.weights, entry.norm
+
+    def lookup(self, text: str, scope: Hashable = None) -> Optional[Tuple[str, float]]:
+        """Retorna (respuesta, similitud) del vecino mas cercano sobre el umbral."""
+
+        if self.maxsize <= 0 or not text:
+            return None
+
+        started = time.perf_counter()
+        canonical, entities = self.canonicalize(text)
+        query = char_ngrams(canonical, self.ngram)
+        best: Optional[Tuple[int, float]] = None
+
+        with self._lock:
+            candidates: Set[int] = set()
+            for gram in query:
+                candidates.update(self._postings.get(gram, ()))
+
+            if candidates:
+                q = self._weights(query)
+                q_norm = math.sqrt(sum(w * w for w in q.values()))
+                for entry_id in candidates:
+                    entry = self._entries[entry_id]
+                    if entry.scope != scope:
+                        continue
+                    if entry.entities != entities:
+                        self.entity_mismatches += 1
+                        continue
+                    d, d_norm = self._entry_weights(entry)
+                    dot = sum(w * d.get(g, 0.0) for g, w in q.items())
+                    score = dot / (q_norm * d_norm) if q_norm and d_norm else 0.0
+                    if best is None or score > best[1]:
+                        best = (entry_id, score)
+
+            elapsed = time.perf_counter() - started
+            self._lookup_seconds += elapsed
+            if best is None or best[1] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best[0])
+            self.hits += 1
+            self._hit_seconds += elapsed
+            return self._entries[best[0]].answer, best[1]
+
+    def add(self, text: str, answer: str, scope: Hashable = None) -> None:
+        """Indexa una pregunta respondida, desalojando la menos usada si hace falta."""
+
+        if self.maxsize <= 0 or not text:
+            return
+
+        canonical, entities = self.canonicalize(text)
+        with self._lock:
+            existing = self._by_text.get((scope, canonical))
+            if existing is not None:
+                self._entries[existing].answer = answer
+                self._entries.move_to_end(existing)
+                return
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._version += 1
+            grams = char_ngrams(canonical, self.ngram)
+            self._entries[entry_id] = _Entry(scope, canonical, entities, grams, answer)
+            self._by_text[(scope, canonical)] = entry_id
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(entry_id)
+
+            while len(self._entries) > self.maxsize:
+                old_id, old = self._entries.popitem(last=False)
+                del self._by_text[(old.scope, old.text)]
+                for gram in old.grams:
+                    posting = self._postings[gram]
+                    posting.discard(old_id)
+                    if not posting:
+                        del self._postings[gram]
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_text.clear()
+            self._postings.clear()
+            self._version += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores y latencias medias de busqueda."""
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entity_mismatches": self.entity_mismatches,
+                "avg_lookup_ms": round(self._lookup_seconds / lookups * 1000, 3) if lookups else 0.0,
+                "avg_hit_ms": round(self._hit_seconds / self.hits * 1000, 3) if self.hits else 0.0,
+            }
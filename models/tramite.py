@@ -1,6 +1,23 @@
+from datetime import date, datetime
+from json.encoder import encode_basestring
 from config.database import connectToMySQL
 
+# Columnas de la tabla en el orden de ``SELECT *`` (el de las tuplas de fila)
+COLUMNAS = ('id', 'nombre', 'descripcion', 'estado', 'usuario_whatsapp',
+            'fecha_creacion', 'fecha_actualizacion')
+
+
+def fecha_iso(valor):
+    """Fecha en ISO-8601 (``2024-05-02T10:00:00.123000``), o None"""
+    if valor is None:
+        return None
+    return valor.isoformat() if isinstance(valor, date) else str(valor)
+
+
 class Tramite:
+    # Sin __dict__ por instancia: cada trámite ocupa solo sus siete referencias
+    __slots__ = COLUMNAS
+
     def __init__(self, datos):
         self.id = datos.get('id')
         self.nombre = datos.get('nombre')
@@ -10,6 +27,14 @@ class Tramite:
         self.fecha_creacion = datos.get('fecha_creacion')
         self.fecha_actualizacion = datos.get('fecha_actualizacion')
 
+    @classmethod
+    def desde_tupla(cls, fila):
+        """Crea el trámite desde una fila de cursor de tuplas (orden de COLUMNAS)"""
+        tramite = cls.__new__(cls)
+        (tramite.id, tramite.nombre, tramite.descripcion, tramite.estado, tramite.usuario_whatsapp,
+         tramite.fecha_creacion, tramite.fecha_actualizacion) = fila
+        return tramite
+
     @classmethod
     def crear_tabla(cls):
         """Crear tabla en MySQL si no existe"""
@@ -22,11 +47,15 @@ class Tramite:
             estado VARCHAR(20) DEFAULT 'pendiente',
             usuario_whatsapp VARCHAR(20),
             fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            fecha_actualizacion TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3)
         )
         """
         return db.query_db(query)
 
+    def to_tuple(self):
+        return (self.id, self.nombre, self.descripcion, self.estado, self.usuario_whatsapp,
+                self.fecha_creacion, self.fecha_actualizacion)
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -34,6 +63,73 @@ class Tramite:
             'descripcion': self.descripcion,
             'estado': self.estado,
             'usuario_whatsapp': self.usuario_whatsapp,
-            'fecha_creacion': str(self.fecha_creacion),
-            'fecha_actualizacion': str(self.fecha_actualizacion)
+            'fecha_creacion': fecha_iso(self.fecha_creacion),
+            'fecha_actualizacion': fecha_iso(self.fecha_actualizacion)
         }
+
+
+def _json_texto(valor):
+    if valor is None:
+        return 'null'
+    return encode_basestring(valor if type(valor) is str else str(valor))
+
+
+def _json_entero(valor):
+    return 'null' if valor is None else '%d' % valor
+
+
+def _json_fecha(valor):
+    if valor is None:
+        return 'null'
+    return '"%s"' % (valor.isoformat() if type(valor) is datetime else fecha_iso(valor))
+
+
+def codificador_json(columnas=COLUMNAS):
+    """
+    Función que convierte una fila (tupla en el orden de ``columnas``) en su
+    objeto JSON como texto, sin pasar por un dict intermedio
+
+    La plantilla y el codificador de cada columna se arman una sola vez; las
+    columnas extra al final de la fila se ignoran.
+    """
+    plantilla = '{' + ','.join(encode_basestring(c) + ':%s' for c in columnas) + '}'
+    codificadores = [_json_entero if c == 'id' else _json_fecha if c.startswith('fecha_') else _json_texto
+                     for c in columnas]
+
+    def codificar(fila):
+        return plantilla % tuple([codificar_valor(valor) for codificar_valor, valor in zip(codificadores, fila)])
+
+    return codificar
+
+
+def serializar_tramites(filas, columnas=COLUMNAS, buffer=None, filas_por_bloque=1000):
+    """
+    Escribe las filas como un array JSON directamente en un buffer de bytes
+
+    Las filas se codifican por bloques: nunca se arma la lista de dicts ni el
+    texto completo antes de pasar a bytes.
+
+    Args:
+        filas (iterable): Tuplas en el orden de ``columnas`` (o Tramite)
+        columnas (tuple): Columnas a escribir
+        buffer (bytearray, optional): Buffer donde escribir (se crea si falta)
+        filas_por_bloque (int): Filas codificadas antes de volcarlas al buffer
+
+    Returns:
+        bytearray: El buffer con el array JSON
+    """
+    buffer = bytearray() if buffer is None else buffer
+    codificar = codificador_json(columnas)
+    buffer += b'['
+    bloque = []
+    separador = b''
+    for fila in filas:
+        bloque.append(codificar(fila.to_tuple() if isinstance(fila, Tramite) else fila))
+        if len(bloque) >= filas_por_bloque:
+            buffer += separador + ','.join(bloque).encode()
+            separador = b','
+            bloque.clear()
+    if bloque:
+        buffer += separador + ','.join(bloque).encode()
+    buffer += b']'
+    return buffer
@@ -1,5 +1,6 @@
+from .chat import chat_bp
 from .main import main_bp
 from .tramite import tramite_bp
 from .whatsapp import whatsapp_bp
 
-__all__ = ['main_bp', 'tramite_bp', 'whatsapp_bp']
+__all__ = ['chat_bp', 'main_bp', 'tramite_bp', 'whatsapp_bp']
@@ -0,0 +1,107 @@
+"""Rutas del chat web (cliente en static/app.js)."""
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import json
+import logging
+from model.assistant import generate_response, generate_response_stream
+
+logger = logging.getLogger(__name__)
+
+chat_bp = Blueprint('chat', __name__, url_prefix='/api/chat')
+
+
+def _historial(data):
+    """Historial del cuerpo JSON: solo los turnos que son objetos, el resto se descarta."""
+    history = data.get('history') or []
+    if not isinstance(history, list):
+        return []
+    return [turno for turno in history if isinstance(turno, dict)]
+
+
+def _leer_peticion():
+    """Extrae (mensaje, historial) del cuerpo JSON del chat."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    message = str(data.get('message') or '').strip()
+    return message, _historial(data)
+
+
+def _extender_historial(history, message, response_text):
+    """Agrega el turno actual al historial que devuelve el endpoint."""
+    nuevo = list(history)
+    if not nuevo or nuevo[-1].get('sender') != 'Usuario' or nuevo[-1].get('text') != message:
+        nuevo.append({'sender': 'Usuario', 'text': message})
+    nuevo.append({'sender': 'Asistente', 'text': response_text})
+    return nuevo
+
+
+def _sse(payload, event=None):
+    """Serializa un evento Server-Sent Events."""
+    data = json.dumps(payload, ensure_ascii=False)
+    return f"event: {event}\ndata: {data}\n\n" if event else f"data: {data}\n\n"
+
+
+@chat_bp.route('', methods=['POST'])
+def chat():
+    """
+    Chat web: responde ``{success, response, history}``.
+
+    Body JSON:
+    {
+        "message": "¿Cuánto cuesta el Pulse Pro?",
+        "history": [{"sender": "Asistente", "text": "..."}]
+    }
+    """
+    message, history = _leer_peticion()
+    if not message:
+        return jsonify({'success': False, 'error': 'Mensaje vacío'}), 400
+
+    try:
+        response_text = generate_response(message, history)
+    except Exception as e:
+        logger.error(f"Error en chat: {e}")
+        return jsonify({'success': False, 'error': 'No pude procesar tu solicitud.'}), 500
+
+    return jsonify({
+        'success': True,
+        'response': response_text,
+        'history': _extender_historial(history, message, response_text),
+    }), 200
+
+
+@chat_bp.route('/stream', methods=['POST'])
+def chat_stream():
+    """
+    Chat en streaming (Server-Sent Events).
+
+    Emite un evento ``data: {"text": ...}`` por fragmento y al final
+    ``event: done`` con ``{success, response, history}``.
+    """
+    message, history = _leer_peticion()
+    if not message:
+        return jsonify({'success': False, 'error': 'Mensaje vacío'}), 400
+
+    def eventos():
+        parts = []
+        try:
+            for chunk in generate_response_stream(message, history):
+                parts.append(chunk)
+                yield _sse({'text': chunk})
+        except Exception as e:
+            logger.error(f"Error en chat streaming: {e}")
+            yield _sse({'success': False, 'error': 'No pude procesar tu solicitud.'}, event='error')
+            return
+
+        response_text = ''.join(parts).strip()
+        yield _sse({
+            'success': True,
+            'response': response_text,
+            'history': _extender_historial(history, message, response_text),
+        }, event='done')
+
+    return Response(
+        stream_with_context(eventos()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -1,5 +1,7 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from config import TRAMITES_BULK_MAX_ROWS
 from controllers.tramite_controller import TramiteController
+import json
 
 tramite_bp = Blueprint('tramites', __name__, url_prefix='/api/tramites')
 
@@ -13,23 +15,113 @@ def crear():
         usuario_whatsapp=data.get('usuario_whatsapp')
     )
 
+def _leer_filas():
+    """
+    Lee las filas de la carga masiva desde un array JSON o NDJSON
+
+    El NDJSON se procesa línea a línea; una línea que no es JSON válido queda
+    como fila inválida (se informa en su resultado). Retorna (filas, error).
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        filas = []
+        for raw in request.stream:
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                filas.append(json.loads(line))
+            except ValueError:
+                filas.append(None)
+            if len(filas) > TRAMITES_BULK_MAX_ROWS:
+                return None, f"Máximo {TRAMITES_BULK_MAX_ROWS} trámites por carga"
+        return filas, None
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('tramites')
+    if not isinstance(data, list):
+        return None, "Se espera un array JSON de trámites o NDJSON"
+    return data, None
+
+@tramite_bp.route('/lote', methods=['POST'])
+def crear_lote():
+    """
+    Crear trámites en bloque (importación desde sistemas externos)
+
+    Body: array JSON de trámites (o ``{"tramites": [...]}``), o NDJSON con
+    ``Content-Type: application/x-ndjson``. Responde el resultado de cada fila.
+    """
+    filas, error = _leer_filas()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    return TramiteController.crear_tramites_lote(filas)
+
+@tramite_bp.route('/lote/estado', methods=['POST'])
+def cambiar_estado_lote():
+    """
+    Cambiar el estado de varios trámites
+
+    Body JSON: ``{"ids": [1, 2, 3], "estado": "aprobado", "desde": ["pendiente"]}``
+    (``desde`` es opcional).
+    """
+    data = request.get_json(silent=True) or {}
+    return TramiteController.cambiar_estado_lote(data.get('ids'), data.get('estado'), data.get('desde'))
+
 @tramite_bp.route('/<int:tramite_id>', methods=['GET'])
 def obtener(tramite_id):
-    """Obtener trámite por ID"""
-    return TramiteController.obtener_tramite(tramite_id)
+    """
+    Obtener trámite por ID
+
+    Responde con ``ETag`` según ``fecha_actualizacion``; si el cliente envía
+    ``If-None-Match`` con la misma versión se responde 304 sin cuerpo.
+    """
+    body, status = TramiteController.obtener_tramite(tramite_id)
+    if status != 200:
+        return body, status
+    response = jsonify(body)
+    response.set_etag(TramiteController.etag(body['tramite']))
+    return response.make_conditional(request)
 
 @tramite_bp.route('', methods=['GET'])
 def obtener_todos():
-    """Obtener todos los trámites"""
-    return TramiteController.obtener_todos_tramites()
+    """
+    Listar trámites por páginas
+
+    Query params: ``limite``, ``cursor`` (valor ``siguiente`` de la respuesta
+    anterior), ``estado``, ``usuario_whatsapp`` y ``campos`` (separados por
+    coma). Con ``formato=ndjson`` (o ``Accept: application/x-ndjson``) se
+    exportan todos los trámites filtrados en streaming, sin paginar.
+    """
+    campos = [c.strip() for c in request.args.get('campos', '').split(',') if c.strip()] or None
+    estado = request.args.get('estado')
+    usuario_whatsapp = request.args.get('usuario_whatsapp')
+
+    if request.args.get('formato') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+        lineas, status = TramiteController.exportar_tramites(estado, usuario_whatsapp, campos)
+        if status != 200:
+            return lineas, status
+        return Response(stream_with_context(lineas), mimetype='application/x-ndjson')
+
+    return TramiteController.obtener_todos_tramites(
+        limite=request.args.get('limite'),
+        cursor=request.args.get('cursor'),
+        estado=estado,
+        usuario_whatsapp=usuario_whatsapp,
+        campos=campos
+    )
 
 @tramite_bp.route('/<int:tramite_id>', methods=['PUT'])
 def actualizar(tramite_id):
-    """Actualizar trámite"""
+    """
+    Actualizar trámite
+
+    Con ``fecha_actualizacion`` en el body (la versión leída) el cambio solo
+    se aplica si el trámite no fue modificado entretanto; si lo fue, 409.
+    """
     data = request.get_json()
     return TramiteController.actualizar_tramite(tramite_id, **data)
 
 @tramite_bp.route('/<int:tramite_id>', methods=['DELETE'])
 def eliminar(tramite_id):
-    """Eliminar trámite"""
-    return TramiteController.eliminar_tramite(tramite_id)
+    """Eliminar trámite (``?fecha_actualizacion=`` exige esa versión, si no 409)"""
+    return TramiteController.eliminar_tramite(tramite_id, request.args.get('fecha_actualizacion'))
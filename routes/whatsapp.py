@@ -1,10 +1,35 @@
 """Rutas para integración con WhatsApp usando Twilio."""
 
+from functools import partial
 from flask import Blueprint, request, jsonify
 import logging
-from twilio.rest import Client
 from twilio.twiml.messaging_response import MessagingResponse
 from model.assistant import generate_response
+from config import (
+    BROADCAST_MAX_RECIPIENTS,
+    DEADLINE_SEND_RESERVE,
+    WEBHOOK_ASYNC,
+    WEBHOOK_ASYNC_DEADLINE,
+    WEBHOOK_DEADLINE,
+)
+from services import (
+    Deadline,
+    QueueFull,
+    deadline_scope,
+    get_broadcaster,
+    get_messenger,
+    get_session_store,
+    get_status_buffer,
+    get_tramite_status,
+    get_webhook_dedup,
+    get_webhook_pool,
+    reserving,
+    run_with_deadline,
+    twilio_signature_valid,
+)
+from services.broadcast import prepare_recipients
+from services.dedup import IN_FLIGHT, NEW
+import json
 import os
 
 logger = logging.getLogger(__name__)
@@ -16,11 +41,58 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID', '')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN', '')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER', 'whatsapp:+1234567890')
 
-# Inicializar cliente de Twilio
-if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
-    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-else:
-    twilio_client = None
+# Servicio de envío compartido con app.py (None si faltan credenciales)
+messenger = get_messenger()
+
+
+def _firma_twilio_valida():
+    """True si la petición actual trae una X-Twilio-Signature válida."""
+    return twilio_signature_valid(
+        request.url,
+        request.form,
+        request.headers.get('X-Twilio-Signature'),
+        request.headers.get('X-Forwarded-Proto'),
+    )
+
+
+def _generar_con_historial(sender, incoming_msg, firmado=False):
+    """Genera la respuesta con el historial del remitente y registra el turno.
+
+    Las consultas de estado de trámites se responden desde MySQL sin llamar al LLM,
+    solo si la petición viene firmada por Twilio (``From`` no es falsificable).
+    """
+    store = get_session_store()
+    consulta_estado = get_tramite_status() if firmado else None
+    response_text = consulta_estado.answer(sender, incoming_msg) if consulta_estado else None
+    if response_text is None:
+        history = store.get_history(sender) if sender else []
+        response_text = generate_response(incoming_msg, history)
+    if sender:
+        store.append_turn(sender, incoming_msg, response_text)
+    return response_text
+
+
+def _responder_por_whatsapp(sender, incoming_msg, message_sid='', firmado=False):
+    """Genera la respuesta y la envía por la API REST (usado por el pool)."""
+    dedup = get_webhook_dedup()
+    try:
+        with reserving(DEADLINE_SEND_RESERVE):
+            response_text = _generar_con_historial(sender, incoming_msg, firmado)
+        msg = messenger.send(sender, response_text, from_=TWILIO_PHONE_NUMBER)
+    except Exception:
+        dedup.fail(message_sid)
+        raise
+    dedup.complete(message_sid, response_text)
+    logger.info(f"Respuesta enviada a {sender}: SID={msg.sid}")
+    return msg.sid
+
+
+def _twiml(text=None):
+    """Respuesta TwiML, con mensaje o vacía (solo acusa recibo)."""
+    resp = MessagingResponse()
+    if text:
+        resp.message(text)
+    return str(resp)
 
 
 @whatsapp_bp.route('/webhook', methods=['POST'])
@@ -33,22 +105,55 @@ def webhook():
         # Obtener datos del mensaje
         incoming_msg = request.values.get('Body', '').strip()
         sender = request.values.get('From', '')
+        message_sid = request.values.get('MessageSid', '')
+        # Sin firma válida no se consulta MySQL por ``From`` (cualquiera puede enviarlo)
+        firmado = _firma_twilio_valida()
         
         logger.info(f"Mensaje recibido de {sender}: {incoming_msg}")
         
         if not incoming_msg:
             return jsonify({"status": "ok"}), 200
         
-        # Generar respuesta usando el asistente
-        response_text = generate_response(incoming_msg)
+        # Twilio reintenta el webhook si tardamos: un MessageSid ya visto no se regenera
+        dedup = get_webhook_dedup()
+        state, cached = dedup.begin(message_sid)
         
-        # Crear respuesta TwiML
-        resp = MessagingResponse()
-        resp.message(response_text)
+        if WEBHOOK_ASYNC and messenger:
+            if state != NEW:
+                # La respuesta ya salió (o está saliendo) por la API REST
+                logger.info(f"Reintento de {message_sid} ({state}), se ignora")
+                return _twiml(), 200, {"Content-Type": "application/xml"}
+            # Acusar recibo con TwiML vacío; la respuesta sale desde el pool
+            deadline = Deadline(WEBHOOK_ASYNC_DEADLINE)
+            # Si vence en cola se libera el MessageSid para que el reintento de Twilio se procese
+            trabajo = partial(run_with_deadline, on_expire=partial(dedup.fail, message_sid))
+            if not get_webhook_pool().submit(trabajo, deadline, _responder_por_whatsapp,
+                                             sender, incoming_msg, message_sid, firmado):
+                dedup.fail(message_sid)
+                logger.warning("Cola de webhooks llena, mensaje rechazado")
+                return jsonify({"error": "Servicio saturado"}), 503, {"Retry-After": "5"}
+            return _twiml(), 200, {"Content-Type": "application/xml"}
+        
+        if state == IN_FLIGHT:
+            # El intento original sigue generando: esperar su respuesta en vez de repetirla
+            cached = dedup.wait_for(message_sid, WEBHOOK_DEADLINE)
+        if state != NEW:
+            logger.info(f"Reintento de {message_sid}, respuesta {'reutilizada' if cached else 'pendiente'}")
+            return _twiml(cached), 200
+        
+        # Generar respuesta usando el asistente y el historial del remitente,
+        # dentro del plazo que Twilio espera al webhook
+        try:
+            with deadline_scope(Deadline(WEBHOOK_DEADLINE)):
+                response_text = _generar_con_historial(sender, incoming_msg, firmado)
+        except Exception:
+            dedup.fail(message_sid)
+            raise
+        dedup.complete(message_sid, response_text)
         
         logger.info(f"Respuesta enviada a {sender}: {response_text}")
         
-        return str(resp), 200
+        return _twiml(response_text), 200
         
     except Exception as e:
         logger.error(f"Error en webhook de WhatsApp: {e}")
@@ -68,7 +173,7 @@ def send_message():
         "message": "Tu mensaje aquí"
     }
     """
-    if not twilio_client:
+    if not messenger:
         return jsonify({"error": "Twilio no configurado"}), 400
     
     try:
@@ -79,12 +184,8 @@ def send_message():
         if not phone or not message:
             return jsonify({"error": "Falta 'phone' o 'message'"}), 400
         
-        # Enviar mensaje
-        msg = twilio_client.messages.create(
-            body=message,
-            from_=TWILIO_PHONE_NUMBER,
-            to=f'whatsapp:{phone}'
-        )
+        # Enviar mensaje (cola compartida; respeta el orden por destinatario)
+        msg = messenger.send(f'whatsapp:{phone}', message, from_=TWILIO_PHONE_NUMBER)
         
         logger.info(f"Mensaje enviado a {phone}: SID={msg.sid}")
         
@@ -93,16 +194,102 @@ def send_message():
             "message_sid": msg.sid
         }), 200
         
+    except QueueFull:
+        return jsonify({"error": "Cola de envíos llena, intenta más tarde"}), 503
     except Exception as e:
         logger.error(f"Error enviando mensaje por WhatsApp: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def _leer_destinatarios():
+    """
+    Lee los destinatarios de la difusión desde JSON o NDJSON.
+
+    Retorna (items, plantilla, error). El NDJSON se procesa línea a línea
+    sin cargar el cuerpo completo en memoria.
+    """
+    template = request.args.get('template')
+    items = []
+
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        for raw in request.stream:
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+            if len(items) > BROADCAST_MAX_RECIPIENTS:
+                return None, None, f"Máximo {BROADCAST_MAX_RECIPIENTS} destinatarios"
+        return items, template, None
+
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        items = data
+    elif isinstance(data, dict):
+        items = data.get('recipients') or []
+        template = data.get('template') or template
+    if not isinstance(items, list):
+        return None, None, "'recipients' debe ser una lista"
+    if len(items) > BROADCAST_MAX_RECIPIENTS:
+        return None, None, f"Máximo {BROADCAST_MAX_RECIPIENTS} destinatarios"
+    return items, template, None
+
+
+@whatsapp_bp.route('/broadcast', methods=['POST'])
+def broadcast():
+    """
+    Difusión masiva. Responde 202 con el id del trabajo.
+
+    Body JSON:
+    {
+        "template": "Hola {nombre}, tu trámite está {estado}",
+        "recipients": [
+            {"phone": "+57300...", "vars": {"nombre": "Ana", "estado": "listo"}},
+            {"phone": "+57301...", "message": "Mensaje propio"}
+        ]
+    }
+
+    También acepta NDJSON (``Content-Type: application/x-ndjson``), un
+    destinatario por línea y la plantilla en ``?template=``.
+    """
+    if not messenger:
+        return jsonify({"error": "Twilio no configurado"}), 400
+
+    items, template, error = _leer_destinatarios()
+    if error:
+        return jsonify({"error": error}), 400
+    if not items:
+        return jsonify({"error": "Sin destinatarios"}), 400
+
+    messages, invalid = prepare_recipients(items, template)
+    job = get_broadcaster(messenger, TWILIO_PHONE_NUMBER).start(messages, invalid)
+    logger.info(f"Difusión {job.id} iniciada: {len(messages)} válidos, {len(invalid)} inválidos")
+
+    return jsonify({
+        "job_id": job.id,
+        "total": job.total,
+        "invalid": len(invalid),
+        "status_url": f"{whatsapp_bp.url_prefix}/broadcast/{job.id}"
+    }), 202
+
+
+@whatsapp_bp.route('/broadcast/<job_id>', methods=['GET'])
+def broadcast_status(job_id):
+    """Avance de una difusión: enviados, fallidos y pendientes."""
+    job = get_broadcaster(messenger, TWILIO_PHONE_NUMBER).get(job_id) if messenger else None
+    if not job:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(job.to_dict()), 200
+
+
 @whatsapp_bp.route('/status', methods=['POST'])
 def status_callback():
     """
     Webhook para recibir actualizaciones de estado de mensajes.
     Se configura en la consola de Twilio para recibir confirmaciones de entrega.
+    Los eventos se guardan por lotes en la tabla ``estados_mensajes``.
     """
     try:
         msg_sid = request.values.get('MessageSid')
@@ -110,6 +297,10 @@ def status_callback():
         
         logger.info(f"Actualización de estado - SID: {msg_sid}, Estado: {msg_status}")
         
+        status_buffer = get_status_buffer()
+        if status_buffer and msg_sid and msg_status:
+            status_buffer.add(msg_sid, msg_status, request.values.get('To'), request.values.get('ErrorCode'))
+        
         return jsonify({"status": "ok"}), 200
     
     except Exception as e:
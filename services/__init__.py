@@ -0,0 +1,52 @@
+"""Servicios de infraestructura compartidos por las rutas (colas, envíos, etc.)."""
+
+from .broadcast import Broadcaster, get_broadcaster
+from .cache import TTLCache
+from .delivery_status import StatusBuffer, current_status_buffer, get_status_buffer
+from .dedup import WebhookDedup, get_webhook_dedup
+from .db_metrics import QueryMetrics, get_query_metrics
+from .deadline import Deadline, current_deadline, deadline_scope, remaining_timeout, reserving, run_with_deadline
+from .messaging import OutboundMessenger, QueueFull, get_messenger, twilio_signature_valid
+from .rate_limit import CallGovernor, RateLimited, SharedTokenBucket, TokenBucket, get_gemini_limiter
+from .resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, get_gemini_breaker
+from .sessions import SessionStore, get_session_store
+from .tramite_status import TramiteStatusLookup, get_tramite_status
+from .webhook_queue import WebhookWorkerPool, get_webhook_pool
+
+__all__ = [
+    'Broadcaster',
+    'get_broadcaster',
+    'TTLCache',
+    'StatusBuffer',
+    'current_status_buffer',
+    'get_status_buffer',
+    'WebhookDedup',
+    'get_webhook_dedup',
+    'QueryMetrics',
+    'get_query_metrics',
+    'Deadline',
+    'current_deadline',
+    'deadline_scope',
+    'remaining_timeout',
+    'reserving',
+    'run_with_deadline',
+    'OutboundMessenger',
+    'QueueFull',
+    'get_messenger',
+    'twilio_signature_valid',
+    'CallGovernor',
+    'RateLimited',
+    'SharedTokenBucket',
+    'TokenBucket',
+    'get_gemini_limiter',
+    'CircuitBreaker',
+    'CircuitOpen',
+    'DeadlineExceeded',
+    'get_gemini_breaker',
+    'SessionStore',
+    'get_session_store',
+    'TramiteStatusLookup',
+    'get_tramite_status',
+    'WebhookWorkerPool',
+    'get_webhook_pool',
+]
@@ -0,0 +1,211 @@
+"""Difusión masiva de mensajes de WhatsApp.
+
+Un trabajo de difusión recibe una lista de destinatarios y una plantilla
+(``str.format`` con las variables de cada destinatario), y un hilo propio los
+encola en el servicio de envío respetando la tasa máxima por segundo de Twilio.
+Las difusiones ocupan como mucho ``BROADCAST_MAX_QUEUED`` lugares de la cola
+compartida, así una difusión grande con Twilio lento no deja sin lugar a las
+respuestas de los webhooks. El avance (enviados, fallidos, pendientes) se
+consulta por id de trabajo.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import BROADCAST_MAX_QUEUED, BROADCAST_RATE_PER_SEC
+from services.messaging import OutboundMessenger, QueueFull
+from services.rate_limit import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+# Se conservan los últimos trabajos para consultar su estado.
+_MAX_JOBS = 100
+# Errores individuales que se guardan por trabajo (el resto solo se cuenta).
+_MAX_ERRORS = 50
+
+
+class _Variables(dict):
+    """Deja intactos los marcadores sin valor en lugar de fallar."""
+
+    def __missing__(self, key: str) -> str:
+        return "{" + key + "}"
+
+
+def render_message(template: str, variables: Optional[Dict[str, Any]]) -> str:
+    """Aplica las variables del destinatario a la plantilla."""
+
+    if not variables:
+        return template
+    try:
+        return template.format_map(_Variables(variables))
+    except (ValueError, IndexError, AttributeError):
+        return template
+
+
+def prepare_recipients(
+    items: Iterable[Any], template: Optional[str]
+) -> Tuple[List[Tuple[str, str]], List[Dict[str, Any]]]:
+    """Valida destinatarios y arma (lista de (to, cuerpo), errores de validación).
+
+    Cada item es ``{"phone": "+57...", "vars": {...}}`` o ``{"phone", "message"}``.
+    """
+
+    messages: List[Tuple[str, str]] = []
+    errors: List[Dict[str, Any]] = []
+    for index, item in enumerate(items):
+        phone = str(item.get("phone") or "").strip() if isinstance(item, dict) else ""
+        body = ""
+        if phone:
+            body = item.get("message") or (render_message(template, item.get("vars")) if template else "")
+        if not phone or not body:
+            errors.append({"index": index, "phone": phone, "error": "Falta 'phone' o mensaje"})
+            continue
+        to = phone if phone.startswith("whatsapp:") else f"whatsapp:{phone}"
+        messages.append((to, str(body)))
+    return messages, errors
+
+
+class BroadcastJob:
+    """Estado y contadores de una difusión."""
+
+    def __init__(self, messages: List[Tuple[str, str]], invalid: List[Dict[str, Any]]):
+        self.id = uuid.uuid4().hex
+        self.messages = messages
+        self.total = len(messages) + len(invalid)
+        self.submitted = 0
+        self.sent = 0
+        self.failed = len(invalid)
+        self.errors: List[Dict[str, Any]] = invalid[:_MAX_ERRORS]
+        self.status = "en_curso"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _on_sent(self, to: str, future: Any) -> None:
+        self._record(to, future.exception())
+
+    def _record(self, to: str, error: Optional[BaseException]) -> None:
+        with self._lock:
+            if error is None:
+                self.sent += 1
+            else:
+                self.failed += 1
+                if len(self.errors) < _MAX_ERRORS:
+                    self.errors.append({"phone": to, "error": str(error)})
+            if self.status == "encolado" and self.sent + self.failed == self.total:
+                self.status = "completado"
+                self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            done = self.sent + self.failed
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "total": self.total,
+                "submitted": self.submitted,
+                "sent": self.sent,
+                "failed": self.failed,
+                "pending": self.total - done,
+                "progress": round(done / self.total, 4) if self.total else 1.0,
+                "errors": list(self.errors),
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class Broadcaster:
+    """Lanza difusiones sobre el servicio de envío con un límite de tasa global."""
+
+    def __init__(
+        self,
+        messenger: OutboundMessenger,
+        rate_per_sec: float,
+        from_: Optional[str] = None,
+        max_queued: Optional[int] = None,
+    ):
+        self.messenger = messenger
+        self.from_ = from_
+        self.bucket = TokenBucket(rate_per_sec, capacity=rate_per_sec)
+        # Lugares de la cola de envío que pueden ocupar todas las difusiones juntas
+        self.max_queued = max(1, max_queued if max_queued is not None else messenger.max_queue // 2)
+        self._queued = threading.BoundedSemaphore(self.max_queued)
+        self._jobs: "OrderedDict[str, BroadcastJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, messages: List[Tuple[str, str]], invalid: List[Dict[str, Any]]) -> BroadcastJob:
+        """Registra el trabajo y lo despacha en segundo plano."""
+
+        job = BroadcastJob(messages, invalid)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > _MAX_JOBS:
+                self._jobs.popitem(last=False)
+
+        threading.Thread(target=self._run, args=(job,), name=f"broadcast-{job.id[:8]}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[BroadcastJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _submit(self, job: BroadcastJob, to: str, body: str) -> Optional[Future]:
+        """Encola un mensaje sin pasar del tope de la difusión en la cola compartida."""
+
+        while not self._queued.acquire(timeout=0.05):
+            if self.messenger.closed:
+                job._record(to, QueueFull("Servicio de envío cerrado"))
+                return None
+        while True:
+            try:
+                future = self.messenger.submit(to, body, self.from_)
+            except QueueFull as e:
+                if self.messenger.closed:
+                    self._queued.release()
+                    job._record(to, e)
+                    return None
+                # La cola compartida está llena: esperar en lugar de descartar.
+                time.sleep(0.05)
+                continue
+            future.add_done_callback(lambda _: self._queued.release())
+            return future
+
+    def _run(self, job: BroadcastJob) -> None:
+        for to, body in job.messages:
+            self.bucket.acquire()
+            future = self._submit(job, to, body)
+            with job._lock:
+                job.submitted += 1
+            if future is not None:
+                future.add_done_callback(lambda f, to=to: job._on_sent(to, f))
+
+        with job._lock:
+            job.messages = []
+            job.status = "encolado"
+            if job.sent + job.failed == job.total:
+                job.status = "completado"
+                job.finished_at = time.time()
+        logger.info(f"Difusión {job.id}: {job.submitted} mensajes encolados")
+
+
+_broadcaster: Optional[Broadcaster] = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster(messenger: OutboundMessenger, from_: Optional[str] = None) -> Broadcaster:
+    """Difusor del proceso (comparte el límite de tasa entre trabajos)."""
+
+    global _broadcaster
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                _broadcaster = Broadcaster(messenger, BROADCAST_RATE_PER_SEC, from_, BROADCAST_MAX_QUEUED)
+    return _broadcaster
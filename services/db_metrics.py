@@ -0,0 +1,204 @@
+"""Latencia de las consultas a MySQL, agregada por sentencia normalizada.
+
+Cada sentencia se mide en tres fases: ``connect`` (espera por una conexión
+del pool), ``execute`` (envío y ejecución, incluido el COMMIT de escrituras)
+y ``fetch`` (lectura de filas). Las mediciones se agrupan por el texto SQL
+normalizado (literales y listas ``IN (%s, %s, ...)`` colapsados), con un
+histograma de buckets fijos por sentencia. Las que superan
+``DB_SLOW_QUERY_MS`` se registran en el log junto con el método del
+controlador que las originó.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import re
+import sys
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from config import DB_METRICS_MAX_STATEMENTS, DB_SLOW_QUERY_MS
+
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (ms) de los buckets del histograma; el último es abierto.
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+_ETIQUETAS = tuple(f"<={limite}" for limite in BUCKETS_MS) + (f">{BUCKETS_MS[-1]}",)
+_PERCENTILES = (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99))
+
+# Sentencias que no entran en el registro cuando ya hay ``max_statements``.
+OTRAS = "<otras>"
+
+_COMENTARIO_RE = re.compile(r"/\*.*?\*/|--[^\n]*|#[^\n]*", re.DOTALL)
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|%s|%\(\w+\)s|\b\d+(?:\.\d+)?\b")
+_LISTA_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_FILAS_RE = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+_ESPACIOS_RE = re.compile(r"\s+")
+
+# Módulos de la capa de datos: no son "quien llama" a la consulta.
+_MODULOS_INTERNOS = ("services.db_metrics", "config.mysqlconnections", "contextlib")
+
+
+def normalizar_sql(query: str, max_len: int = 300) -> str:
+    """Texto SQL sin comentarios ni literales, para agrupar sentencias equivalentes.
+
+    ``WHERE id IN (%s, %s, %s)`` y ``WHERE id IN (%s)`` quedan como
+    ``WHERE id IN (?+)``; los VALUES de varias filas, como ``VALUES (?+)...``.
+    """
+
+    texto = _COMENTARIO_RE.sub(" ", query)
+    texto = _LITERAL_RE.sub("?", texto)
+    texto = _LISTA_RE.sub("(?+)", texto)
+    texto = _FILAS_RE.sub("(?+)...", texto)
+    texto = _ESPACIOS_RE.sub(" ", texto).strip()
+    return texto if len(texto) <= max_len else texto[:max_len] + "…"
+
+
+def metodo_llamador() -> str:
+    """Método del controlador (``TramiteController.obtener_tramite``) en la pila actual.
+
+    Si la consulta no viene de ``controllers``, retorna la primera función
+    fuera de la capa de datos como ``modulo.funcion``.
+    """
+
+    frame = sys._getframe(1)
+    primero = None
+    while frame is not None:
+        modulo = frame.f_globals.get("__name__", "")
+        nombre = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+        if modulo.startswith("controllers."):
+            return nombre
+        if primero is None and not modulo.startswith(_MODULOS_INTERNOS):
+            primero = f"{modulo}.{nombre}"
+        frame = frame.f_back
+    return primero or "?"
+
+
+class _Serie:
+    """Acumulados de una sentencia normalizada."""
+
+    __slots__ = ("count", "errors", "slow", "connect", "execute", "fetch", "max", "buckets", "callers")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.slow = 0
+        self.connect = 0.0
+        self.execute = 0.0
+        self.fetch = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(_ETIQUETAS)
+        self.callers: Counter = Counter()
+
+    def percentil(self, fraccion: float) -> float:
+        """Límite superior del bucket que contiene el percentil (ms)."""
+
+        objetivo = fraccion * self.count
+        acumulado = 0
+        for i, cantidad in enumerate(self.buckets):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else round(self.max * 1000, 2)
+        return round(self.max * 1000, 2)
+
+    def resumen(self) -> Dict[str, Any]:
+        n = self.count or 1
+        total = self.connect + self.execute + self.fetch
+        datos = {
+            "count": self.count,
+            "errors": self.errors,
+            "slow": self.slow,
+            "total_ms": round(total * 1000, 2),
+            "avg_ms": round(total / n * 1000, 3),
+            "max_ms": round(self.max * 1000, 2),
+            "connect_ms": round(self.connect / n * 1000, 3),
+            "execute_ms": round(self.execute / n * 1000, 3),
+            "fetch_ms": round(self.fetch / n * 1000, 3),
+        }
+        for clave, fraccion in _PERCENTILES:
+            datos[clave] = self.percentil(fraccion) if self.count else 0.0
+        datos["histogram"] = {etiqueta: c for etiqueta, c in zip(_ETIQUETAS, self.buckets) if c}
+        if self.callers:
+            datos["slow_callers"] = dict(self.callers.most_common(5))
+        return datos
+
+
+class QueryMetrics:
+    """Histogramas de latencia por sentencia y log de consultas lentas."""
+
+    def __init__(self, slow_seconds: float = 0.5, max_statements: int = 200):
+        self.slow_seconds = slow_seconds
+        self.max_statements = max(1, max_statements)
+        self._lock = threading.Lock()
+        self._series: Dict[str, _Serie] = {}
+
+    def record(self, statement: str, connect: float, execute: float, fetch: float = 0.0,
+               error: bool = False) -> None:
+        """Registra una sentencia ya normalizada; los tiempos van en segundos."""
+
+        total = connect + execute + fetch
+        lenta = bool(self.slow_seconds) and total >= self.slow_seconds
+        caller = metodo_llamador() if lenta else None
+        bucket = bisect.bisect_left(BUCKETS_MS, total * 1000)
+
+        with self._lock:
+            serie = self._series.get(statement)
+            if serie is None:
+                if len(self._series) >= self.max_statements:
+                    statement = OTRAS
+                serie = self._series.setdefault(statement, _Serie())
+            serie.count += 1
+            serie.connect += connect
+            serie.execute += execute
+            serie.fetch += fetch
+            serie.max = max(serie.max, total)
+            serie.buckets[bucket] += 1
+            if error:
+                serie.errors += 1
+            if lenta:
+                serie.slow += 1
+                serie.callers[caller] += 1
+
+        if lenta:
+            logger.warning(
+                f"🐢 Consulta lenta ({total * 1000:.1f} ms: conexión {connect * 1000:.1f}, "
+                f"ejecución {execute * 1000:.1f}, lectura {fetch * 1000:.1f}) en {caller}: {statement}"
+            )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Totales y detalle por sentencia, de mayor a menor tiempo acumulado."""
+
+        with self._lock:
+            series: List[tuple] = [(s, serie.resumen()) for s, serie in self._series.items()]
+        series.sort(key=lambda par: par[1]["total_ms"], reverse=True)
+        return {
+            "slow_ms": round(self.slow_seconds * 1000, 1),
+            "statements": len(series),
+            "queries": sum(datos["count"] for _, datos in series),
+            "errors": sum(datos["errors"] for _, datos in series),
+            "slow": sum(datos["slow"] for _, datos in series),
+            "total_ms": round(sum(datos["total_ms"] for _, datos in series), 2),
+            "by_statement": dict(series),
+        }
+
+
+_metrics: Optional[QueryMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_query_metrics() -> QueryMetrics:
+    """Métricas de consultas MySQL compartidas por el proceso."""
+
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = QueryMetrics(DB_SLOW_QUERY_MS / 1000, DB_METRICS_MAX_STATEMENTS)
+    return _metrics
@@ -0,0 +1,114 @@
+"""Plazo por petición, propagado de forma implícita.
+
+La ruta del webhook crea un ``Deadline`` al recibir el mensaje y lo activa con
+``deadline_scope``. Las capas inferiores (llamada a Gemini, MySQL, envío por
+Twilio) consultan ``remaining_timeout`` para usar como timeout lo que queda del
+plazo y omitir el trabajo que ya no alcanzaría a terminar.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+from services.resilience import DeadlineExceeded
+
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline:
+    """Instante límite para terminar una petición."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def shortened(self, seconds: float) -> "Deadline":
+        """Plazo que vence ``seconds`` antes (reserva tiempo para pasos posteriores)."""
+
+        deadline = Deadline(self.seconds)
+        deadline.expires_at = self.expires_at - seconds
+        return deadline
+
+    def __repr__(self) -> str:
+        return f"Deadline(restante={self.remaining():.2f}s)"
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("plazo_peticion", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Plazo activo en este contexto, o None si la operación no tiene plazo."""
+
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Activa ``deadline`` para el código del bloque (hilo o tarea actual)."""
+
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def reserving(seconds: float) -> Iterator[Optional[Deadline]]:
+    """Acota el bloque para que termine ``seconds`` antes del plazo activo (si hay)."""
+
+    deadline = _current.get()
+    with deadline_scope(deadline.shortened(seconds) if deadline is not None else None) as scoped:
+        yield scoped
+
+
+def remaining_timeout(default: Optional[float] = None, what: str = "la operación") -> Optional[float]:
+    """Timeout a usar: el menor entre ``default`` y lo que queda del plazo activo.
+
+    Sin plazo activo retorna ``default``. Si el plazo ya venció lanza
+    ``DeadlineExceeded`` para no empezar un trabajo que no puede terminar.
+    """
+
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"Plazo de la petición agotado antes de {what}")
+    return min(default, remaining) if default else remaining
+
+
+def run_with_deadline(
+    deadline: Deadline,
+    fn: Callable[..., Any],
+    *args: Any,
+    on_expire: Optional[Callable[[], Any]] = None,
+) -> Any:
+    """Ejecuta ``fn`` con el plazo activo; si ya venció (p. ej. esperando en cola) la omite.
+
+    ``on_expire`` corre en lugar de ``fn`` cuando se omite, para deshacer lo que
+    el encolado dejó reservado (por ejemplo, el MessageSid en curso del dedup).
+    """
+
+    if deadline.expired:
+        logger.warning(f"Trabajo {getattr(fn, '__name__', fn)} omitido: plazo de {deadline.seconds:.0f}s vencido")
+        if on_expire is not None:
+            try:
+                on_expire()
+            except Exception:
+                logger.exception("Error al liberar un trabajo omitido por plazo")
+        return None
+    with deadline_scope(deadline):
+        return fn(*args)
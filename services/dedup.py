@@ -0,0 +1,320 @@
+"""Idempotencia de webhooks de Twilio por ``MessageSid``.
+
+Twilio reintenta el webhook si la respuesta tarda; sin deduplicar, cada reintento
+vuelve a llamar a Gemini y a enviar la respuesta. ``begin`` reclama el SID: el
+primero que llega lo procesa (``NEW``), los reintentos ven que está en curso
+(``IN_FLIGHT``) o reciben la respuesta ya guardada (``DONE``). Backends:
+
+- ``memory``: TTL en el proceso (por defecto).
+- ``sqlite``: archivo compartido entre workers de la misma máquina.
+- ``mysql``: tabla ``webhooks_procesados`` a través del pool de conexiones.
+
+Los backends SQL guardan además en memoria las respuestas ya resueltas, así que
+un reintento repetido en el mismo worker no llega a la base de datos.
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+from config import (
+    DEDUP_INFLIGHT_TIMEOUT,
+    DEDUP_MAX_ENTRIES,
+    DEDUP_SQLITE_PATH,
+    DEDUP_STORE,
+    DEDUP_TTL,
+)
+from services.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+NEW = "nuevo"
+IN_FLIGHT = "en_curso"
+DONE = "respondido"
+
+# Cada 500 reclamos se borran los registros vencidos de los backends SQL.
+_PRUNE_EVERY = 500
+# Intervalo de sondeo de ``wait_for``.
+_POLL_SECONDS = 0.1
+
+
+class WebhookDedup(ABC):
+    """Interfaz común de los backends de deduplicación."""
+
+    def __init__(self, ttl: float = 3600.0, inflight_timeout: float = 30.0, max_entries: int = 50000):
+        self.ttl = ttl
+        # Un SID en curso por más de esto se considera abandonado y se puede reclamar.
+        self.inflight_timeout = inflight_timeout
+        self._done = TTLCache(max_entries, ttl)
+        self._lock = threading.Lock()
+        self._counters = {"new": 0, "duplicates": 0, "in_flight": 0, "reclaimed": 0}
+
+    def begin(self, sid: str) -> Tuple[str, Optional[str]]:
+        """Reclama ``sid``. Retorna (NEW | IN_FLIGHT | DONE, respuesta guardada).
+
+        Sin SID (peticiones que no vienen de Twilio) siempre retorna NEW.
+        """
+
+        if not sid:
+            return NEW, None
+        reply = self._done.get(sid)
+        if reply is not None:
+            self._count("duplicates")
+            return DONE, reply
+
+        state, reply = self._claim(sid, time.time())
+        if state == DONE:
+            self._done.set(sid, reply)
+            self._count("duplicates")
+        else:
+            self._count("new" if state == NEW else "in_flight")
+        return state, reply
+
+    def complete(self, sid: str, reply: str) -> None:
+        """Guarda la respuesta de ``sid`` para devolverla en los reintentos."""
+
+        if not sid:
+            return
+        self._done.set(sid, reply)
+        self._store(sid, reply)
+
+    def fail(self, sid: str) -> None:
+        """Libera el reclamo tras un error para que un reintento lo procese."""
+
+        if sid:
+            self._release(sid)
+
+    def wait_for(self, sid: str, timeout: float) -> Optional[str]:
+        """Espera hasta ``timeout`` segundos la respuesta de un SID en curso."""
+
+        deadline = time.monotonic() + timeout
+        while True:
+            reply = self._done.get(sid)
+            if reply is None:
+                state, reply = self._lookup(sid)
+                if state is None:
+                    return None
+            if reply is not None:
+                self._done.set(sid, reply)
+                return reply
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(_POLL_SECONDS, remaining))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counters, backend=type(self).__name__, cached_replies=len(self._done))
+
+    # Operaciones de cada backend
+    @abstractmethod
+    def _claim(self, sid: str, now: float) -> Tuple[str, Optional[str]]:
+        """Reclama ``sid`` de forma atómica; retorna (estado, respuesta guardada)."""
+
+    @abstractmethod
+    def _lookup(self, sid: str) -> Tuple[Optional[str], Optional[str]]:
+        """Estado y respuesta de ``sid`` sin reclamarlo."""
+
+    @abstractmethod
+    def _store(self, sid: str, reply: str) -> None:
+        """Marca ``sid`` como respondido con ``reply``."""
+
+    @abstractmethod
+    def _release(self, sid: str) -> None:
+        """Libera ``sid`` para que un reintento lo vuelva a procesar."""
+
+
+class MemoryWebhookDedup(WebhookDedup):
+    """Reclamos en memoria del proceso; las respuestas viven en el TTLCache base."""
+
+    def __init__(self, ttl: float = 3600.0, inflight_timeout: float = 30.0, max_entries: int = 50000):
+        super().__init__(ttl, inflight_timeout, max_entries)
+        self._claims = TTLCache(max_entries, inflight_timeout)
+        self._claims_lock = threading.Lock()
+
+    def _claim(self, sid: str, now: float) -> Tuple[str, Optional[str]]:
+        with self._claims_lock:
+            reply = self._done.get(sid)
+            if reply is not None:
+                return DONE, reply
+            if self._claims.get(sid) is not None:
+                return IN_FLIGHT, None
+            self._claims.set(sid, now)
+            return NEW, None
+
+    def _lookup(self, sid: str) -> Tuple[Optional[str], Optional[str]]:
+        reply = self._done.get(sid)
+        if reply is not None:
+            return DONE, reply
+        return (IN_FLIGHT, None) if self._claims.get(sid) is not None else (None, None)
+
+    def _store(self, sid: str, reply: str) -> None:
+        self._claims.pop(sid)
+
+    def _release(self, sid: str) -> None:
+        self._claims.pop(sid)
+
+
+class SQLWebhookDedup(WebhookDedup):
+    """Lógica común de los backends SQL sobre la tabla ``webhooks_procesados``."""
+
+    # Marcador de parámetros del driver y sentencia de inserción sin duplicar
+    _param = "?"
+    _insert_ignore = "INSERT OR IGNORE"
+
+    def __init__(self, ttl: float = 3600.0, inflight_timeout: float = 30.0, max_entries: int = 50000):
+        super().__init__(ttl, inflight_timeout, max_entries)
+        self._claims_count = 0
+
+    @abstractmethod
+    def _execute(self, query: str, data: tuple) -> int:
+        """Ejecuta y retorna las filas afectadas."""
+
+    @abstractmethod
+    def _fetchone(self, query: str, data: tuple) -> Optional[Tuple[str, Optional[str]]]:
+        """Ejecuta y retorna la primera fila (estado, respuesta), o None."""
+
+    def _sql(self, query: str) -> str:
+        return query.replace("?", self._param)
+
+    def _claim(self, sid: str, now: float) -> Tuple[str, Optional[str]]:
+        self._claims_count += 1
+        if self._claims_count % _PRUNE_EVERY == 0:
+            self._execute(self._sql("DELETE FROM webhooks_procesados WHERE actualizado < ?"), (now - self.ttl,))
+
+        inserted = self._execute(
+            self._sql(
+                f"{self._insert_ignore} INTO webhooks_procesados (message_sid, estado, respuesta, actualizado) "
+                "VALUES (?, ?, NULL, ?)"
+            ),
+            (sid, IN_FLIGHT, now),
+        )
+        if inserted:
+            return NEW, None
+
+        # Reclamo abandonado (el worker murió o tardó demasiado): se retoma.
+        reclaimed = self._execute(
+            self._sql(
+                "UPDATE webhooks_procesados SET actualizado = ? "
+                "WHERE message_sid = ? AND estado = ? AND actualizado < ?"
+            ),
+            (now, sid, IN_FLIGHT, now - self.inflight_timeout),
+        )
+        if reclaimed:
+            self._count("reclaimed")
+            return NEW, None
+
+        state, reply = self._lookup(sid)
+        return (state or IN_FLIGHT), reply
+
+    def _lookup(self, sid: str) -> Tuple[Optional[str], Optional[str]]:
+        row = self._fetchone(
+            self._sql("SELECT estado, respuesta FROM webhooks_procesados WHERE message_sid = ?"), (sid,)
+        )
+        if row is None:
+            return None, None
+        return row[0], row[1] if row[0] == DONE else None
+
+    def _store(self, sid: str, reply: str) -> None:
+        self._execute(
+            self._sql("UPDATE webhooks_procesados SET estado = ?, respuesta = ?, actualizado = ? WHERE message_sid = ?"),
+            (DONE, reply, time.time(), sid),
+        )
+
+    def _release(self, sid: str) -> None:
+        self._execute(
+            self._sql("DELETE FROM webhooks_procesados WHERE message_sid = ? AND estado = ?"), (sid, IN_FLIGHT)
+        )
+
+
+class SQLiteWebhookDedup(SQLWebhookDedup):
+    """Deduplicación en un archivo SQLite (una conexión por hilo, modo WAL)."""
+
+    def __init__(self, path: str, ttl: float = 3600.0, inflight_timeout: float = 30.0, max_entries: int = 50000):
+        super().__init__(ttl, inflight_timeout, max_entries)
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS webhooks_procesados (
+                message_sid TEXT PRIMARY KEY,
+                estado TEXT NOT NULL,
+                respuesta TEXT,
+                actualizado REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_webhook_actualizado ON webhooks_procesados (actualizado)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, query: str, data: tuple) -> int:
+        return self._conn().execute(query, data).rowcount
+
+    def _fetchone(self, query: str, data: tuple) -> Optional[Tuple[str, Optional[str]]]:
+        return self._conn().execute(query, data).fetchone()
+
+
+class MySQLWebhookDedup(SQLWebhookDedup):
+    """Deduplicación en la tabla ``webhooks_procesados`` de MySQL (ver database.sql)."""
+
+    _param = "%s"
+    _insert_ignore = "INSERT IGNORE"
+
+    def __init__(self, db: str = "esquema_t", ttl: float = 3600.0, inflight_timeout: float = 30.0,
+                 max_entries: int = 50000):
+        super().__init__(ttl, inflight_timeout, max_entries)
+        self.db = db
+
+    def _execute(self, query: str, data: tuple) -> int:
+        # query_db no expone las filas afectadas; aquí se usa el pool directamente.
+        from config.mysqlconnections import get_pool
+
+        with get_pool(self.db).connection() as connection, connection.cursor() as cursor:
+            return cursor.execute(query, data)
+
+    def _fetchone(self, query: str, data: tuple) -> Optional[Tuple[str, Optional[str]]]:
+        from config.mysqlconnections import get_pool
+
+        with get_pool(self.db).connection() as connection, connection.cursor() as cursor:
+            cursor.execute(query, data)
+            row = cursor.fetchone()
+        return (row["estado"], row["respuesta"]) if row else None
+
+
+_dedup: Optional[WebhookDedup] = None
+_dedup_lock = threading.Lock()
+
+
+def get_webhook_dedup() -> WebhookDedup:
+    """Retorna el backend configurado en DEDUP_STORE (se crea una vez por proceso)."""
+
+    global _dedup
+    if _dedup is None:
+        with _dedup_lock:
+            if _dedup is None:
+                if DEDUP_STORE == "sqlite":
+                    _dedup = SQLiteWebhookDedup(DEDUP_SQLITE_PATH, DEDUP_TTL, DEDUP_INFLIGHT_TIMEOUT, DEDUP_MAX_ENTRIES)
+                elif DEDUP_STORE == "mysql":
+                    _dedup = MySQLWebhookDedup("esquema_t", DEDUP_TTL, DEDUP_INFLIGHT_TIMEOUT, DEDUP_MAX_ENTRIES)
+                else:
+                    _dedup = MemoryWebhookDedup(DEDUP_TTL, DEDUP_INFLIGHT_TIMEOUT, DEDUP_MAX_ENTRIES)
+                logger.info(f"Deduplicación de webhooks en backend '{DEDUP_STORE}'")
+    return _dedup
@@ -0,0 +1,234 @@
+"""Registro de los callbacks de estado de Twilio (entregado, leído, fallido...).
+
+Twilio envía varios callbacks por mensaje; escribir cada uno con un INSERT propio
+sería una ida y vuelta a la base de datos por callback. ``StatusBuffer`` los
+acumula en memoria y un hilo los escribe en lotes (``executemany``) cuando se
+juntan ``batch_size`` eventos o pasan ``flush_interval`` segundos. Al apagar el
+proceso se escribe lo pendiente. Backends de escritura:
+
+- ``sqlite``: tabla ``estados_mensajes`` en un archivo local (por defecto).
+- ``mysql``: tabla ``estados_mensajes`` (ver database.sql).
+- ``none``: solo se registran en el log.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from config import (
+    STATUS_BATCH_SIZE,
+    STATUS_FLUSH_INTERVAL,
+    STATUS_MAX_BUFFER,
+    STATUS_SQLITE_PATH,
+    STATUS_STORE,
+    WEBHOOK_DRAIN_TIMEOUT,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# (message_sid, estado, destinatario, codigo_error, fecha_evento)
+StatusRow = Tuple[str, str, Optional[str], Optional[str], str]
+
+_COLUMNS = "message_sid, estado, destinatario, codigo_error, fecha_evento"
+
+
+class StatusBuffer:
+    """Buffer acotado de eventos de estado con escritura por lotes en segundo plano."""
+
+    def __init__(
+        self,
+        writer: Callable[[List[StatusRow]], Any],
+        batch_size: int = 200,
+        flush_interval: float = 2.0,
+        max_buffer: int = 10000,
+    ):
+        self.writer = writer
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_buffer = max(self.batch_size, max_buffer)
+
+        self._cond = threading.Condition()
+        self._rows: Deque[StatusRow] = deque()
+        # Serializa las escrituras: el hilo de fondo y ``flush`` no escriben a la vez.
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._written = 0
+        self._batches = 0
+        self._dropped = 0
+        self._errors = 0
+        self._last_batch_ms = 0.0
+
+    def add(self, sid: str, status: str, to: Optional[str] = None, error_code: Optional[str] = None) -> bool:
+        """Encola un evento. Retorna False si el buffer está lleno y se descartó."""
+
+        row = (sid, status, to or None, error_code or None, datetime.now().isoformat(sep=" ", timespec="milliseconds"))
+        with self._cond:
+            if len(self._rows) >= self.max_buffer:
+                self._dropped += 1
+                return False
+            self._rows.append(row)
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="estados-twilio", daemon=True)
+                self._thread.start()
+            if len(self._rows) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def _take(self) -> List[StatusRow]:
+        return [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+
+    def _write(self, batch: List[StatusRow]) -> bool:
+        started = time.perf_counter()
+        try:
+            ok = self.writer(batch) is not False
+        except Exception as e:
+            logger.error(f"Error escribiendo {len(batch)} estados: {e}")
+            ok = False
+
+        with self._cond:
+            if ok:
+                self._written += len(batch)
+                self._batches += 1
+                self._last_batch_ms = (time.perf_counter() - started) * 1000
+            else:
+                # Se reintenta en el siguiente ciclo si aún hay espacio.
+                self._errors += 1
+                room = self.max_buffer - len(self._rows)
+                self._rows.extendleft(reversed(batch[:room]))
+                self._dropped += max(0, len(batch) - room)
+        return ok
+
+    def flush(self) -> int:
+        """Escribe todo lo pendiente ahora. Retorna cuántos eventos se escribieron."""
+
+        written = 0
+        with self._write_lock:
+            while True:
+                with self._cond:
+                    batch = self._take()
+                if not batch or not self._write(batch):
+                    return written
+                written += len(batch)
+
+    def _run(self) -> None:
+        failed = False
+        while True:
+            with self._cond:
+                # Tras un error se espera el intervalo completo antes de reintentar.
+                if (failed or len(self._rows) < self.batch_size) and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+                errors = self._errors
+            self.flush()
+            with self._cond:
+                failed = self._errors != errors
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "buffered": len(self._rows),
+                "written": self._written,
+                "batches": self._batches,
+                "dropped": self._dropped,
+                "errors": self._errors,
+                "batch_size": self.batch_size,
+                "last_batch_ms": round(self._last_batch_ms, 2),
+            }
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Detiene el hilo de fondo y escribe lo que quede en el buffer."""
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+
+class SQLiteStatusWriter:
+    """Escribe lotes de estados en la tabla ``estados_mensajes`` de un archivo SQLite."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS estados_mensajes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_sid TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                destinatario TEXT,
+                codigo_error TEXT,
+                fecha_evento TEXT NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_estado_sid ON estados_mensajes (message_sid, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_estado_fecha ON estados_mensajes (estado, fecha_evento)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def __call__(self, rows: Sequence[StatusRow]) -> int:
+        conn = self._conn()
+        with conn:
+            conn.executemany(f"INSERT INTO estados_mensajes ({_COLUMNS}) VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+
+class MySQLStatusWriter:
+    """Escribe lotes de estados en la tabla ``estados_mensajes`` de MySQL."""
+
+    def __init__(self, db: str = "esquema_t"):
+        self.db = db
+
+    def __call__(self, rows: Sequence[StatusRow]) -> Any:
+        from config.mysqlconnections import connectToMySQL
+
+        return connectToMySQL(self.db).execute_many(
+            f"INSERT INTO estados_mensajes ({_COLUMNS}) VALUES (%s, %s, %s, %s, %s)", list(rows)
+        )
+
+
+_buffer: Optional[StatusBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def current_status_buffer() -> Optional[StatusBuffer]:
+    """Buffer ya creado, o None; no abre el backend (para diagnóstico)."""
+
+    return _buffer
+
+
+def get_status_buffer() -> Optional[StatusBuffer]:
+    """Buffer de estados del proceso según STATUS_STORE, o None si es ``none``."""
+
+    global _buffer
+    if _buffer is None and STATUS_STORE != "none":
+        with _buffer_lock:
+            if _buffer is None:
+                if STATUS_STORE == "mysql":
+                    writer: Callable[[List[StatusRow]], Any] = MySQLStatusWriter("esquema_t")
+                else:
+                    writer = SQLiteStatusWriter(STATUS_SQLITE_PATH)
+                _buffer = StatusBuffer(writer, STATUS_BATCH_SIZE, STATUS_FLUSH_INTERVAL, STATUS_MAX_BUFFER)
+                atexit.register(_buffer.shutdown, WEBHOOK_DRAIN_TIMEOUT)
+                logger.info(f"Estados de mensajes en backend '{STATUS_STORE}'")
+    return _buffer
@@ -0,0 +1,251 @@
+"""Servicio compartido de envío de mensajes salientes por Twilio.
+
+Todas las rutas usan un único cliente de Twilio con un pool HTTP keep-alive
+dimensionado para la concurrencia de envío. Los mensajes pasan por una cola
+acotada y se despachan en paralelo (hasta ``parallelism`` a la vez) sin romper
+el orden por destinatario: los mensajes a un mismo número salen uno tras otro
+y en el orden en que se encolaron. Un mensaje encolado con un plazo activo
+(ver ``services.deadline``) se descarta si el plazo vence antes de enviarlo.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
+
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from twilio.request_validator import RequestValidator
+from twilio.rest import Client
+
+from config import (
+    TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN,
+    TWILIO_HTTP_RETRIES,
+    TWILIO_HTTP_TIMEOUT,
+    TWILIO_SEND_PARALLELISM,
+    TWILIO_SEND_QUEUE_SIZE,
+    WEBHOOK_DRAIN_TIMEOUT,
+)
+from services.deadline import Deadline, current_deadline, remaining_timeout
+from services.resilience import DeadlineExceeded
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """La cola de envíos alcanzó su capacidad."""
+
+
+def build_twilio_client(
+    account_sid: str,
+    auth_token: str,
+    pool_size: int = 8,
+    timeout: Optional[float] = None,
+    max_retries: int = 0,
+) -> Client:
+    """Cliente de Twilio con una sesión HTTP keep-alive de ``pool_size`` conexiones.
+
+    El adaptador por defecto de requests guarda 10 conexiones; con más envíos
+    concurrentes las sobrantes se cierran tras cada uso y se pierde el keep-alive.
+    """
+
+    http_client = TwilioHttpClient(pool_connections=True, timeout=timeout)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=max_retries)
+    http_client.session.mount("https://", adapter)
+    return Client(account_sid, auth_token, http_client=http_client)
+
+
+class OutboundMessenger:
+    """Cola acotada de mensajes con despacho concurrente y orden por destinatario."""
+
+    def __init__(self, client: Any, parallelism: int = 8, max_queue: int = 1000):
+        self.client = client
+        self.parallelism = max(1, parallelism)
+        self.max_queue = max(1, max_queue)
+
+        self._cond = threading.Condition()
+        # Mensajes pendientes por destinatario y destinatarios listos para despachar.
+        # Un destinatario en curso tiene carril pero no está en ``_ready``.
+        self._lanes: Dict[str, Deque[Tuple[Future, Dict[str, Any], Optional[Deadline]]]] = {}
+        self._ready: Deque[str] = deque()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        self._queued = 0
+        self._in_flight = 0
+        self._sent = 0
+        self._failed = 0
+        self._rejected = 0
+        self._expired = 0
+
+    def submit(self, to: str, body: str, from_: Optional[str] = None, **kwargs: Any) -> Future:
+        """Encola un mensaje; el Future se resuelve con el mensaje de Twilio.
+
+        Lanza ``QueueFull`` si la cola está llena o el servicio se está apagando.
+        """
+
+        params = dict(kwargs, to=to, body=body)
+        if from_:
+            params["from_"] = from_
+
+        future: Future = Future()
+        with self._cond:
+            if self._closed or self._queued >= self.max_queue:
+                self._rejected += 1
+                raise QueueFull(f"Cola de envíos llena ({self.max_queue})")
+
+            lane = self._lanes.get(to)
+            if lane is None:
+                lane = self._lanes[to] = deque()
+                self._ready.append(to)
+            lane.append((future, params, current_deadline()))
+            self._queued += 1
+
+            if len(self._threads) < self.parallelism:
+                self._start_worker()
+            self._cond.notify()
+        return future
+
+    def _start_worker(self) -> None:
+        thread = threading.Thread(
+            target=self._worker, name=f"twilio-sender-{len(self._threads)}", daemon=True
+        )
+        self._threads.append(thread)
+        thread.start()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._ready and not self._closed:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                to = self._ready.popleft()
+                future, params, deadline = self._lanes[to].popleft()
+                self._queued -= 1
+                self._in_flight += 1
+
+            expired = deadline is not None and deadline.expired
+            if expired:
+                # Quien lo pidió ya no espera la respuesta: no se envía.
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(DeadlineExceeded(f"Plazo vencido antes de enviar a {to}"))
+                ok = None
+            elif future.set_running_or_notify_cancel():
+                try:
+                    message = self.client.messages.create(**params)
+                except Exception as e:
+                    logger.error(f"Error enviando mensaje a {to}: {e}")
+                    future.set_exception(e)
+                    ok = False
+                else:
+                    future.set_result(message)
+                    ok = True
+            else:
+                ok = None
+
+            with self._cond:
+                self._in_flight -= 1
+                if ok:
+                    self._sent += 1
+                elif ok is False:
+                    self._failed += 1
+                elif expired:
+                    self._expired += 1
+                if self._lanes[to]:
+                    self._ready.append(to)
+                else:
+                    del self._lanes[to]
+                self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def send(self, to: str, body: str, from_: Optional[str] = None, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """Encola y espera el resultado (para endpoints que devuelven el SID).
+
+        Con un plazo activo la espera no lo supera y, si ya venció, no se encola.
+        """
+
+        timeout = remaining_timeout(timeout, f"enviar a {to}")
+        return self.submit(to, body, from_, **kwargs).result(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "parallelism": self.parallelism,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "in_flight": self._in_flight,
+                "recipients": len(self._lanes),
+                "sent": self._sent,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "expired": self._expired,
+            }
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Deja de aceptar mensajes y espera a que se despache lo encolado."""
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+_messenger: Optional[OutboundMessenger] = None
+_messenger_lock = threading.Lock()
+
+
+def get_messenger() -> Optional[OutboundMessenger]:
+    """Servicio de envío del proceso, o None si faltan credenciales de Twilio."""
+
+    global _messenger
+    if _messenger is None and TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
+        with _messenger_lock:
+            if _messenger is None:
+                client = build_twilio_client(
+                    TWILIO_ACCOUNT_SID,
+                    TWILIO_AUTH_TOKEN,
+                    pool_size=TWILIO_SEND_PARALLELISM,
+                    timeout=TWILIO_HTTP_TIMEOUT,
+                    max_retries=TWILIO_HTTP_RETRIES,
+                )
+                _messenger = OutboundMessenger(
+                    client,
+                    parallelism=TWILIO_SEND_PARALLELISM,
+                    max_queue=TWILIO_SEND_QUEUE_SIZE,
+                )
+                atexit.register(_messenger.shutdown, WEBHOOK_DRAIN_TIMEOUT)
+    return _messenger
+
+
+def twilio_signature_valid(
+    url: str,
+    params: Mapping[str, Any],
+    signature: Optional[str],
+    forwarded_proto: Optional[str] = None,
+) -> bool:
+    """True si ``signature`` (cabecera X-Twilio-Signature) firma la petición con TWILIO_AUTH_TOKEN.
+
+    Detrás de un proxy que termina TLS, ``forwarded_proto`` (X-Forwarded-Proto)
+    restituye el esquema de la URL que Twilio firmó. Sin token o sin firma la
+    petición se trata como no autenticada.
+    """
+
+    if not TWILIO_AUTH_TOKEN or not signature:
+        return False
+    if forwarded_proto and "://" in url:
+        url = f"{forwarded_proto.split(',')[0].strip()}://{url.split('://', 1)[1]}"
+    try:
+        return RequestValidator(TWILIO_AUTH_TOKEN).validate(url, params, signature)
+    except Exception:
+        logger.warning("No se pudo validar la firma de Twilio", exc_info=True)
+        return False
@@ -0,0 +1,317 @@
+"""Limitadores de tasa y de concurrencia.
+
+``TokenBucket`` permite ráfagas de hasta ``capacity`` operaciones y repone
+``rate`` fichas por segundo; ``acquire`` espera lo justo para no superar la tasa.
+``SharedTokenBucket`` guarda ese estado en SQLite para repartir la tasa entre
+workers, y ``CallGovernor`` combina tasa y llamadas simultáneas con una cola de
+espera acotada en tiempo (usado para las llamadas a Gemini).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from config import (
+    GEMINI_BURST,
+    GEMINI_LIMITER_PATH,
+    GEMINI_MAX_CONCURRENT,
+    GEMINI_QUEUE_TIMEOUT,
+    GEMINI_RATE_PER_SEC,
+)
+
+
+# Intervalo de sondeo de la espera asíncrona por un hueco de concurrencia.
+_ASYNC_POLL = 0.01
+
+
+class RateLimited(Exception):
+    """No hubo turno para llamar al proveedor dentro del plazo de espera."""
+
+
+class TokenBucket:
+    """Token bucket seguro entre hilos."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate debe ser positivo")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Toma fichas si hay; si no, retorna los segundos que faltan (0 = tomadas)."""
+
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                self.acquired += 1
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Espera hasta obtener ``tokens``. Retorna False si vence ``timeout``."""
+
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                with self._lock:
+                    self.waited_seconds += time.monotonic() - started
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "rate": self.rate,
+                "capacity": self.capacity,
+                "tokens": round(self._tokens, 2),
+                "acquired": self.acquired,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket cuyo estado vive en un archivo SQLite compartido entre procesos.
+
+    Cada toma de fichas es una transacción ``BEGIN IMMEDIATE``, así que varios
+    workers de gunicorn respetan juntos la misma tasa.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: Optional[float] = None, name: str = "default"):
+        super().__init__(rate, capacity)
+        self.path = path
+        self.name = name
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS limitador_tasa (
+                nombre TEXT PRIMARY KEY,
+                fichas REAL NOT NULL,
+                actualizado REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO limitador_tasa (nombre, fichas, actualizado) VALUES (?, ?, ?)",
+            (name, self.capacity, time.time()),
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _take(self, tokens: float) -> Tuple[float, float]:
+        """Repone y toma fichas en una transacción. Retorna (espera, fichas restantes)."""
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT fichas, actualizado FROM limitador_tasa WHERE nombre = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            available = self.capacity if row is None else min(
+                self.capacity, row[0] + max(0.0, now - row[1]) * self.rate
+            )
+            wait = 0.0
+            if tokens:
+                if available >= tokens:
+                    available -= tokens
+                else:
+                    wait = (tokens - available) / self.rate
+            conn.execute(
+                "INSERT OR REPLACE INTO limitador_tasa (nombre, fichas, actualizado) VALUES (?, ?, ?)",
+                (self.name, available, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait, available
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        wait, _ = self._take(tokens)
+        if wait == 0.0:
+            with self._lock:
+                self.acquired += 1
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        _, available = self._take(0.0)
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "capacity": self.capacity,
+                "tokens": round(available, 2),
+                "acquired": self.acquired,
+                "waited_seconds": round(self.waited_seconds, 3),
+                "shared": self.path,
+            }
+
+
+class CallGovernor:
+    """Regula las llamadas a un proveedor: tasa (token bucket) y llamadas simultáneas.
+
+    Quien no obtiene turno espera en cola hasta ``max_wait`` segundos (o el
+    ``timeout`` que indique, si es menor) y después recibe ``RateLimited``.
+    """
+
+    def __init__(self, bucket: Optional[TokenBucket], max_concurrent: int = 4, max_wait: float = 5.0):
+        self.bucket = bucket
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_wait = max(0.0, max_wait)
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._queued_seconds = 0.0
+        self._max_queued = 0.0
+
+    def _limit(self, timeout: Optional[float]) -> float:
+        return self.max_wait if timeout is None else max(0.0, min(timeout, self.max_wait))
+
+    def _enter_queue(self) -> float:
+        with self._lock:
+            self._waiting += 1
+        return time.monotonic()
+
+    def _leave_queue(self, started: float, admitted: bool) -> float:
+        queued = time.monotonic() - started
+        with self._lock:
+            self._waiting -= 1
+            if admitted:
+                self._admitted += 1
+                self._in_flight += 1
+                self._queued_seconds += queued
+                self._max_queued = max(self._max_queued, queued)
+            else:
+                self._rejected += 1
+        if not admitted:
+            raise RateLimited(f"Sin turno para llamar al proveedor tras {queued:.2f}s en cola")
+        return queued
+
+    def release(self) -> None:
+        """Devuelve un turno tomado con ``acquire`` (o ``acquire_async``)."""
+
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """Espera turno; retorna los segundos en cola. Lanza ``RateLimited`` si vence."""
+
+        started = self._enter_queue()
+        deadline = started + self._limit(timeout)
+        admitted = self._slots.acquire(timeout=max(0.0, deadline - time.monotonic()))
+        if admitted and self.bucket is not None:
+            admitted = self.bucket.acquire(timeout=max(0.0, deadline - time.monotonic()))
+            if not admitted:
+                self._slots.release()
+        return self._leave_queue(started, admitted)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> float:
+        """Versión para asyncio: espera sin bloquear el event loop."""
+
+        started = self._enter_queue()
+        deadline = started + self._limit(timeout)
+        admitted = False
+        while not admitted:
+            admitted = self._slots.acquire(blocking=False)
+            if not admitted:
+                if time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(_ASYNC_POLL)
+
+        while admitted and self.bucket is not None:
+            wait = self.bucket.try_acquire()
+            if wait == 0.0:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._slots.release()
+                admitted = False
+                break
+            await asyncio.sleep(min(wait, remaining))
+        return self._leave_queue(started, admitted)
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[float]:
+        """``with governor.slot():`` alrededor de la llamada al proveedor."""
+
+        queued = self.acquire(timeout)
+        try:
+            yield queued
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self, timeout: Optional[float] = None) -> AsyncIterator[float]:
+        queued = await self.acquire_async(timeout)
+        try:
+            yield queued
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = {
+                "max_concurrent": self.max_concurrent,
+                "max_wait": self.max_wait,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "avg_queued_ms": round(1000 * self._queued_seconds / self._admitted, 2) if self._admitted else 0.0,
+                "max_queued_ms": round(1000 * self._max_queued, 2),
+            }
+        data["rate"] = self.bucket.stats() if self.bucket is not None else None
+        return data
+
+
+_gemini_limiter: Optional[CallGovernor] = None
+_gemini_limiter_lock = threading.Lock()
+
+
+def get_gemini_limiter() -> CallGovernor:
+    """Regulador de llamadas a Gemini del proceso (GEMINI_RATE_PER_SEC=0 quita la tasa)."""
+
+    global _gemini_limiter
+    if _gemini_limiter is None:
+        with _gemini_limiter_lock:
+            if _gemini_limiter is None:
+                bucket: Optional[TokenBucket] = None
+                if GEMINI_RATE_PER_SEC > 0 and GEMINI_LIMITER_PATH:
+                    bucket = SharedTokenBucket(GEMINI_LIMITER_PATH, GEMINI_RATE_PER_SEC, GEMINI_BURST, name="gemini")
+                elif GEMINI_RATE_PER_SEC > 0:
+                    bucket = TokenBucket(GEMINI_RATE_PER_SEC, GEMINI_BURST)
+                _gemini_limiter = CallGovernor(bucket, GEMINI_MAX_CONCURRENT, GEMINI_QUEUE_TIMEOUT)
+    return _gemini_limiter
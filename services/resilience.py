@@ -0,0 +1,463 @@
+"""Protecciones ante un proveedor lento o caído.
+
+``CircuitBreaker`` observa las últimas llamadas (errores y lentitud) y, si superan
+los umbrales, corta de inmediato durante ``open_seconds`` para que las peticiones
+vayan directo al respaldo local en vez de esperar el timeout del SDK. Pasado ese
+tiempo deja pasar llamadas de prueba (semiabierto) y se cierra si salen bien.
+
+``call_with_deadline`` ejecuta una llamada bloqueante con plazo máximo y,
+opcionalmente, la cubre (hedging) o la reintenta dentro del mismo plazo.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, Optional, Set, Tuple
+
+from config import (
+    GEMINI_BREAKER_ERROR_RATE,
+    GEMINI_BREAKER_MIN_CALLS,
+    GEMINI_BREAKER_OPEN_SECONDS,
+    GEMINI_BREAKER_SLOW_RATE,
+    GEMINI_BREAKER_SLOW_SECONDS,
+    GEMINI_BREAKER_WINDOW,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Hilos para llamadas con plazo; una llamada abandonada por plazo termina en segundo plano.
+_CALL_WORKERS = 32
+
+
+class CircuitOpen(Exception):
+    """El circuito está abierto: no se llama al proveedor."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """La llamada no terminó dentro del plazo."""
+
+
+class CircuitBreaker:
+    """Circuit breaker por tasa de error y de llamadas lentas en una ventana deslizante."""
+
+    CLOSED = "cerrado"
+    OPEN = "abierto"
+    HALF_OPEN = "semiabierto"
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        error_rate: float = 0.5,
+        slow_seconds: float = 8.0,
+        slow_rate: float = 0.5,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 1,
+    ):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+
+        self._lock = threading.Lock()
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=max(1, window))
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._calls = 0
+        self._failures = 0
+        self._slow_calls = 0
+        self._short_circuited = 0
+        self._opened = 0
+
+    def _refresh(self, now: float) -> None:
+        if self._state == self.OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+
+    def _open(self, now: float, reason: str) -> None:
+        self._state = self.OPEN
+        self._opened_at = now
+        self._opened += 1
+        self._outcomes.clear()
+        logger.warning(f"Circuito '{self.name}' abierto ({reason}) por {self.open_seconds:.0f}s")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def allow(self) -> None:
+        """Autoriza una llamada o lanza ``CircuitOpen`` sin esperar."""
+
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self._state == self.OPEN or (
+                self._state == self.HALF_OPEN and self._probes >= self.half_open_probes
+            ):
+                self._short_circuited += 1
+                raise CircuitOpen(f"Circuito '{self.name}' abierto")
+            if self._state == self.HALF_OPEN:
+                self._probes += 1
+
+    def release(self) -> None:
+        """Devuelve una autorización sin registrar resultado (llamada cancelada)."""
+
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        """Registra el resultado de una llamada autorizada con ``allow``."""
+
+        slow = elapsed >= self.slow_seconds
+        now = time.monotonic()
+        with self._lock:
+            self._calls += 1
+            self._failures += not ok
+            self._slow_calls += slow
+
+            if self._state == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if ok and not slow:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"Circuito '{self.name}' cerrado tras llamada de prueba")
+                else:
+                    self._open(now, "falló la llamada de prueba")
+                return
+
+            if self._state != self.CLOSED:
+                return
+            self._outcomes.append((not ok, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            total = len(self._outcomes)
+            errors = sum(failed for failed, _ in self._outcomes) / total
+            slows = sum(s for _, s in self._outcomes) / total
+            if errors >= self.error_rate:
+                self._open(now, f"errores {errors:.0%}")
+            elif slows >= self.slow_rate:
+                self._open(now, f"lentas {slows:.0%}")
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """``with breaker.guard():`` alrededor de la llamada; mide y registra."""
+
+        self.allow()
+        with self.measure():
+            yield
+
+    @contextmanager
+    def measure(self) -> Iterator[None]:
+        """Mide y registra una llamada ya autorizada con ``allow``."""
+
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(False, time.monotonic() - started)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        else:
+            self.record(True, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            total = len(self._outcomes)
+            return {
+                "state": self._state,
+                "window_calls": total,
+                "error_rate": round(sum(f for f, _ in self._outcomes) / total, 3) if total else 0.0,
+                "slow_rate": round(sum(s for _, s in self._outcomes) / total, 3) if total else 0.0,
+                "calls": self._calls,
+                "failures": self._failures,
+                "slow_calls": self._slow_calls,
+                "short_circuited": self._short_circuited,
+                "opened": self._opened,
+                "retry_in": round(max(0.0, self._opened_at + self.open_seconds - now), 1)
+                if self._state == self.OPEN else 0.0,
+            }
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_CALL_WORKERS, thread_name_prefix="llamada-plazo")
+    return _executor
+
+
+def _take_slot(limiter: Optional[Any], timeout: Optional[float]) -> float:
+    """Turno de ``limiter`` para un intento; retorna los segundos en cola."""
+
+    return limiter.acquire(timeout) if limiter is not None else 0.0
+
+
+def _hold_slot(limiter: Optional[Any], future: Any) -> None:
+    """El turno se libera cuando el intento termina de verdad, no cuando se abandona."""
+
+    if limiter is not None:
+        future.add_done_callback(lambda _: limiter.release())
+
+
+def call_with_deadline(
+    fn: Callable[[], Any],
+    timeout: Optional[float] = None,
+    hedge_after: Optional[float] = None,
+    max_attempts: int = 1,
+    limiter: Optional[Any] = None,
+    queue_timeout: Optional[float] = None,
+    breaker: Optional[CircuitBreaker] = None,
+) -> Any:
+    """Ejecuta ``fn`` con plazo total ``timeout`` (segundos).
+
+    Con ``max_attempts > 1`` se lanza otro intento si el anterior falla o, con
+    ``hedge_after``, si tarda más de esos segundos sin responder (gana el primero
+    que termine bien). Todos los intentos comparten el mismo plazo; al vencer o
+    al ganar uno, los que no empezaron se cancelan.
+
+    Con ``limiter`` (un ``CallGovernor``) cada intento ocupa su propio turno
+    hasta que termina, aunque ya se haya abandonado por plazo: las llamadas
+    reales al proveedor nunca superan ``max_concurrent``. El primer turno se
+    espera hasta ``queue_timeout`` y ese tiempo en cola se descuenta del plazo;
+    los intentos extra solo se lanzan si hay turno libre en ese momento.
+
+    Con ``breaker`` el circuito se consulta una vez obtenido el turno: el rechazo
+    local o el plazo vencido en cola no cuentan como fallo del proveedor, y la
+    latencia registrada se mide desde la admisión.
+    """
+
+    queued = _take_slot(limiter, queue_timeout)
+    if timeout:
+        timeout -= queued
+        if timeout <= 0:
+            if limiter is not None:
+                limiter.release()
+            raise DeadlineExceeded(f"El plazo venció tras {queued:.1f}s esperando turno")
+    _admit(breaker, limiter)
+
+    with breaker.measure() if breaker is not None else nullcontext():
+        if not timeout and max_attempts <= 1:
+            try:
+                return fn()
+            finally:
+                if limiter is not None:
+                    limiter.release()
+        return _run_attempts(fn, timeout, hedge_after, max_attempts, limiter)
+
+
+def _admit(breaker: Optional[CircuitBreaker], limiter: Optional[Any]) -> None:
+    """Consulta el circuito con el turno ya tomado; si está abierto, devuelve el turno."""
+
+    if breaker is None:
+        return
+    try:
+        breaker.allow()
+    except BaseException:
+        if limiter is not None:
+            limiter.release()
+        raise
+
+
+def _run_attempts(
+    fn: Callable[[], Any],
+    timeout: Optional[float],
+    hedge_after: Optional[float],
+    max_attempts: int,
+    limiter: Optional[Any],
+) -> Any:
+    """Intentos de ``call_with_deadline``; el turno del primero ya está tomado."""
+
+    started = time.monotonic()
+    deadline = started + timeout if timeout else None
+    executor = _get_executor()
+
+    def submit() -> Future:
+        try:
+            future = executor.submit(fn)
+        except BaseException:
+            if limiter is not None:
+                limiter.release()
+            raise
+        _hold_slot(limiter, future)
+        return future
+
+    pending: Set[Future] = {submit()}
+    attempts = 1
+    next_hedge = started + hedge_after if hedge_after else None
+    last_error: Optional[BaseException] = None
+
+    try:
+        while pending:
+            now = time.monotonic()
+            limits = [t for t in (deadline, next_hedge if attempts < max_attempts else None) if t is not None]
+            done, pending = wait(pending, timeout=max(0.0, min(limits) - now) if limits else None,
+                                 return_when=FIRST_COMPLETED)
+
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    return future.result()
+                last_error = error
+
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            if attempts < max_attempts and (done or (next_hedge is not None and now >= next_hedge)):
+                next_hedge = now + hedge_after if hedge_after else None
+                try:
+                    _take_slot(limiter, 0)
+                except Exception as e:
+                    # Sin turno libre: se sigue esperando a los intentos en curso
+                    logger.info(f"Intento extra omitido: {e}")
+                    continue
+                if not done:
+                    logger.info(f"Sin respuesta tras {now - started:.1f}s, se lanza intento paralelo")
+                pending.add(submit())
+                attempts += 1
+    finally:
+        for future in pending:
+            future.cancel()
+
+    if pending or last_error is None:
+        raise DeadlineExceeded(f"Sin respuesta en {timeout:.1f}s ({attempts} intentos)")
+    raise last_error
+
+
+async def call_with_deadline_async(
+    factory: Callable[[], Awaitable[Any]],
+    timeout: Optional[float] = None,
+    hedge_after: Optional[float] = None,
+    max_attempts: int = 1,
+    limiter: Optional[Any] = None,
+    queue_timeout: Optional[float] = None,
+    breaker: Optional[CircuitBreaker] = None,
+) -> Any:
+    """Versión asyncio de ``call_with_deadline``; ``factory`` crea cada intento."""
+
+    queued = await limiter.acquire_async(queue_timeout) if limiter is not None else 0.0
+    if timeout:
+        timeout -= queued
+        if timeout <= 0:
+            if limiter is not None:
+                limiter.release()
+            raise DeadlineExceeded(f"El plazo venció tras {queued:.1f}s esperando turno")
+    _admit(breaker, limiter)
+
+    with breaker.measure() if breaker is not None else nullcontext():
+        if not timeout and max_attempts <= 1:
+            try:
+                return await factory()
+            finally:
+                if limiter is not None:
+                    limiter.release()
+        return await _run_attempts_async(factory, timeout, hedge_after, max_attempts, limiter)
+
+
+async def _run_attempts_async(
+    factory: Callable[[], Awaitable[Any]],
+    timeout: Optional[float],
+    hedge_after: Optional[float],
+    max_attempts: int,
+    limiter: Optional[Any],
+) -> Any:
+    """Intentos de ``call_with_deadline_async``; el turno del primero ya está tomado."""
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + timeout if timeout else None
+
+    def submit() -> asyncio.Future:
+        try:
+            task = asyncio.ensure_future(factory())
+        except BaseException:
+            if limiter is not None:
+                limiter.release()
+            raise
+        _hold_slot(limiter, task)
+        return task
+
+    pending: Set[asyncio.Future] = {submit()}
+    attempts = 1
+    next_hedge = started + hedge_after if hedge_after else None
+    last_error: Optional[BaseException] = None
+
+    try:
+        while pending:
+            now = loop.time()
+            limits = [t for t in (deadline, next_hedge if attempts < max_attempts else None) if t is not None]
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, min(limits) - now) if limits else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    return task.result()
+                last_error = error
+
+            now = loop.time()
+            if deadline is not None and now >= deadline:
+                break
+            if attempts < max_attempts and (done or (next_hedge is not None and now >= next_hedge)):
+                next_hedge = now + hedge_after if hedge_after else None
+                try:
+                    _take_slot(limiter, 0)
+                except Exception as e:
+                    logger.info(f"Intento extra omitido: {e}")
+                    continue
+                pending.add(submit())
+                attempts += 1
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if pending or last_error is None:
+        raise DeadlineExceeded(f"Sin respuesta en {timeout:.1f}s ({attempts} intentos)")
+    raise last_error
+
+
+_gemini_breaker: Optional[CircuitBreaker] = None
+_gemini_breaker_lock = threading.Lock()
+
+
+def get_gemini_breaker() -> CircuitBreaker:
+    """Circuit breaker del proceso para las llamadas a Gemini."""
+
+    global _gemini_breaker
+    if _gemini_breaker is None:
+        with _gemini_breaker_lock:
+            if _gemini_breaker is None:
+                _gemini_breaker = CircuitBreaker(
+                    "gemini",
+                    window=GEMINI_BREAKER_WINDOW,
+                    min_calls=GEMINI_BREAKER_MIN_CALLS,
+                    error_rate=GEMINI_BREAKER_ERROR_RATE,
+                    slow_seconds=GEMINI_BREAKER_SLOW_SECONDS,
+                    slow_rate=GEMINI_BREAKER_SLOW_RATE,
+                    open_seconds=GEMINI_BREAKER_OPEN_SECONDS,
+                )
+    return _gemini_breaker
@@ -0,0 +1,214 @@
+"""Historial de conversación por remitente de WhatsApp.
+
+Cada número (el campo ``From`` de Twilio) guarda una ventana acotada de los
+últimos mensajes en el formato que espera ``build_messages``
+(``{"sender": "Usuario"|"Asistente", "text": ...}``). Backends disponibles:
+
+- ``memory``: LRU con TTL en el proceso (por defecto).
+- ``sqlite``: archivo compartido entre workers de la misma máquina.
+- ``mysql``: tabla ``sesiones_whatsapp`` a través del pool de conexiones.
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from config import (
+    SESSION_MAX_SENDERS,
+    SESSION_MAX_TURNS,
+    SESSION_SQLITE_PATH,
+    SESSION_STORE,
+    SESSION_TTL,
+)
+from services.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+# Cada 200 inserciones se borran los mensajes vencidos de los backends SQL.
+_PRUNE_EVERY = 200
+
+
+class SessionStore(ABC):
+    """Interfaz común de los backends de historial."""
+
+    def __init__(self, max_turns: int = 6, ttl: float = 1800.0):
+        # Un turno es un mensaje del usuario y la respuesta del asistente.
+        self.window = max(1, max_turns) * 2
+        self.ttl = ttl
+
+    @abstractmethod
+    def get_history(self, sender: str) -> List[Dict[str, Any]]:
+        """Últimos mensajes vigentes de ``sender``, del más antiguo al más reciente."""
+
+    @abstractmethod
+    def append(self, sender: str, role: str, text: str) -> None:
+        """Agrega un mensaje a la ventana de ``sender``."""
+
+    @abstractmethod
+    def clear(self, sender: str) -> None:
+        """Borra el historial de ``sender``."""
+
+    def append_turn(self, sender: str, user_text: str, assistant_text: str) -> None:
+        """Registra el mensaje del usuario y la respuesta del asistente."""
+
+        self.append(sender, "Usuario", user_text)
+        self.append(sender, "Asistente", assistant_text)
+
+
+class MemorySessionStore(SessionStore):
+    """Ventanas en memoria (deque acotado) dentro de un LRU con TTL por remitente."""
+
+    def __init__(self, max_turns: int = 6, ttl: float = 1800.0, max_senders: int = 10000):
+        super().__init__(max_turns, ttl)
+        self._sessions = TTLCache(maxsize=max_senders, ttl=ttl)
+        # Leer, extender y reinsertar la ventana debe ser atómico: dos mensajes
+        # simultáneos del mismo remitente no pueden pisarse ni crear dos ventanas.
+        self._lock = threading.Lock()
+
+    def get_history(self, sender: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            window = self._sessions.get(sender)
+            return list(window) if window else []
+
+    def append(self, sender: str, role: str, text: str) -> None:
+        with self._lock:
+            window = self._sessions.get(sender)
+            if window is None:
+                window = deque(maxlen=self.window)
+            window.append({"sender": role, "text": text})
+            # Reinsertar renueva el TTL y la posición en el LRU.
+            self._sessions.set(sender, window)
+
+    def clear(self, sender: str) -> None:
+        with self._lock:
+            self._sessions.pop(sender)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._sessions.stats()
+
+
+class SQLiteSessionStore(SessionStore):
+    """Historial en un archivo SQLite (una conexión por hilo, modo WAL)."""
+
+    def __init__(self, path: str, max_turns: int = 6, ttl: float = 1800.0):
+        super().__init__(max_turns, ttl)
+        self.path = path
+        self._local = threading.local()
+        self._appends = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sesiones_whatsapp (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_whatsapp TEXT NOT NULL,
+                remitente TEXT NOT NULL,
+                texto TEXT NOT NULL,
+                fecha_creacion REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sesion_usuario "
+            "ON sesiones_whatsapp (usuario_whatsapp, id)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get_history(self, sender: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT remitente, texto FROM sesiones_whatsapp "
+            "WHERE usuario_whatsapp = ? AND fecha_creacion >= ? "
+            "ORDER BY id DESC LIMIT ?",
+            (sender, time.time() - self.ttl, self.window),
+        ).fetchall()
+        return [{"sender": role, "text": text} for role, text in reversed(rows)]
+
+    def append(self, sender: str, role: str, text: str) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO sesiones_whatsapp (usuario_whatsapp, remitente, texto, fecha_creacion) "
+            "VALUES (?, ?, ?, ?)",
+            (sender, role, text, time.time()),
+        )
+        self._appends += 1
+        if self._appends % _PRUNE_EVERY == 0:
+            conn.execute(
+                "DELETE FROM sesiones_whatsapp WHERE fecha_creacion < ?",
+                (time.time() - self.ttl,),
+            )
+
+    def clear(self, sender: str) -> None:
+        self._conn().execute("DELETE FROM sesiones_whatsapp WHERE usuario_whatsapp = ?", (sender,))
+
+
+class MySQLSessionStore(SessionStore):
+    """Historial en la tabla ``sesiones_whatsapp`` de MySQL (ver database.sql)."""
+
+    def __init__(self, db: str = "esquema_t", max_turns: int = 6, ttl: float = 1800.0):
+        super().__init__(max_turns, ttl)
+        self.db = db
+        self._appends = 0
+
+    def _query(self, query: str, data: Optional[tuple] = None) -> Any:
+        from config.database import connectToMySQL
+
+        return connectToMySQL(self.db).query_db(query, data)
+
+    def get_history(self, sender: str) -> List[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT remitente, texto FROM sesiones_whatsapp "
+            "WHERE usuario_whatsapp = %s AND fecha_creacion >= NOW() - INTERVAL %s SECOND "
+            "ORDER BY id DESC LIMIT %s",
+            (sender, int(self.ttl), self.window),
+        )
+        return [{"sender": r["remitente"], "text": r["texto"]} for r in reversed(rows or [])]
+
+    def append(self, sender: str, role: str, text: str) -> None:
+        self._query(
+            "INSERT INTO sesiones_whatsapp (usuario_whatsapp, remitente, texto) VALUES (%s, %s, %s)",
+            (sender, role, text),
+        )
+        self._appends += 1
+        if self._appends % _PRUNE_EVERY == 0:
+            self._query(
+                "DELETE FROM sesiones_whatsapp WHERE fecha_creacion < NOW() - INTERVAL %s SECOND",
+                (int(self.ttl),),
+            )
+
+    def clear(self, sender: str) -> None:
+        self._query("DELETE FROM sesiones_whatsapp WHERE usuario_whatsapp = %s", (sender,))
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Retorna el almacén configurado en SESSION_STORE (se crea una vez por proceso)."""
+
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SESSION_STORE == "sqlite":
+                    _store = SQLiteSessionStore(SESSION_SQLITE_PATH, SESSION_MAX_TURNS, SESSION_TTL)
+                elif SESSION_STORE == "mysql":
+                    _store = MySQLSessionStore("esquema_t", SESSION_MAX_TURNS, SESSION_TTL)
+                else:
+                    _store = MemorySessionStore(SESSION_MAX_TURNS, SESSION_TTL, SESSION_MAX_SENDERS)
+                logger.info(f"Historial de WhatsApp en backend '{SESSION_STORE}'")
+    return _store
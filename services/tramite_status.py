@@ -0,0 +1,158 @@
+"""Ruta rápida de WhatsApp para "¿cómo va mi trámite?".
+
+Gemini no conoce los trámites del usuario. Cuando el mensaje pregunta por el
+estado de un trámite, se buscan los del remitente en la tabla ``tramites`` por
+el índice ``idx_usuario_whatsapp`` (con LIMIT, a través del pool de conexiones)
+y se responde sin llamar al LLM. El resultado se guarda por remitente unos
+segundos para absorber consultas repetidas; si MySQL falla, el mensaje sigue
+su camino normal hacia el asistente.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import (
+    TRAMITE_STATUS_CACHE_SIZE,
+    TRAMITE_STATUS_CACHE_TTL,
+    TRAMITE_STATUS_LIMIT,
+    TRAMITE_STATUS_LOOKUP,
+)
+from services.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+# (id, nombre, estado, fecha_actualizacion)
+TramiteRow = Tuple[int, str, str, Any]
+
+# Se compara contra el mensaje sin tildes, en minúsculas y sin puntuación.
+_TRAMITE_RE = re.compile(r"\btramites?\b")
+_CONSULTA_RE = re.compile(
+    r"\b(?:mis?|estado|como (?:va|van|sigue|siguen)|avance|seguimiento|consultar|ya esta|esta listo)\b"
+)
+# Quien quiere iniciar un trámite no pregunta por su estado.
+_NUEVO_RE = re.compile(r"\b(?:iniciar|crear|registrar|abrir|nuevo|requisitos)\b")
+_NO_PALABRA_RE = re.compile(r"[^\w\s]+")
+
+_QUERY = (
+    "SELECT id, nombre, estado, fecha_actualizacion FROM tramites "
+    "WHERE usuario_whatsapp = %s ORDER BY fecha_creacion DESC, id DESC LIMIT %s"
+)
+
+
+def _normalizar(texto: str) -> str:
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    sin_tildes = "".join(ch for ch in descompuesto if not unicodedata.combining(ch))
+    return " ".join(_NO_PALABRA_RE.sub(" ", sin_tildes).split())
+
+
+def es_consulta_estado(mensaje: str) -> bool:
+    """True si el mensaje pregunta por el estado de los trámites propios."""
+
+    normalizado = _normalizar(mensaje or "")
+    return bool(
+        _TRAMITE_RE.search(normalizado)
+        and _CONSULTA_RE.search(normalizado)
+        and not _NUEVO_RE.search(normalizado)
+    )
+
+
+def numero_remitente(sender: str) -> str:
+    """Número tal como se guarda en ``tramites.usuario_whatsapp`` (sin ``whatsapp:``)."""
+
+    return sender.split(":", 1)[1] if sender.startswith("whatsapp:") else sender
+
+
+def formatear_respuesta(filas: Sequence[TramiteRow]) -> str:
+    if not filas:
+        return ("No encontramos trámites asociados a tu número. "
+                "Si lo registraste con otro número, escríbenos desde ese.")
+    lineas = ["Estado de tus trámites:"]
+    for tramite_id, nombre, estado, actualizado in filas:
+        fecha = f" (actualizado {actualizado:%d/%m/%Y})" if hasattr(actualizado, "strftime") else ""
+        lineas.append(f"• #{tramite_id} {nombre}: {estado}{fecha}")
+    return "\n".join(lineas)
+
+
+class TramiteStatusLookup:
+    """Responde consultas de estado con los trámites del remitente, con cache por número."""
+
+    def __init__(self, db: str = "esquema_t", limit: int = 3, cache_size: int = 5000, ttl: float = 60.0):
+        self.db = db
+        self.limit = max(1, limit)
+        self._cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self._counters = {"answered": 0, "queries": 0, "errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _consultar(self, numero: str) -> Optional[List[TramiteRow]]:
+        from config.mysqlconnections import connectToMySQL
+
+        self._count("queries")
+        filas = connectToMySQL(self.db).query_rows(_QUERY, (numero, self.limit))
+        return None if filas is False else filas
+
+    def tramites(self, sender: str) -> Optional[List[TramiteRow]]:
+        """Trámites más recientes del remitente (cacheados), o None si no se pudo consultar."""
+
+        numero = numero_remitente(sender)
+        filas = self._cache.get(numero)
+        if filas is None:
+            filas = self._consultar(numero)
+            if filas is None:
+                self._count("errors")
+                return None
+            self._cache.set(numero, filas)
+        return filas
+
+    def answer(self, sender: str, message: str) -> Optional[str]:
+        """Respuesta directa si ``message`` es una consulta de estado; None para seguir al LLM."""
+
+        if not sender or not es_consulta_estado(message):
+            return None
+        try:
+            filas = self.tramites(sender)
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"No se pudo consultar trámites de {sender}: {e}")
+            return None
+        if filas is None:
+            return None
+        self._count("answered")
+        logger.info(f"Consulta de estado de {sender} resuelta sin LLM ({len(filas)} trámites)")
+        return formatear_respuesta(filas)
+
+    def invalidate(self, usuario_whatsapp: Optional[str]) -> None:
+        """Descarta el resultado cacheado de un número (tras crear o editar sus trámites)."""
+
+        if usuario_whatsapp:
+            self._cache.pop(numero_remitente(usuario_whatsapp))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counters, limit=self.limit, cache=self._cache.stats())
+
+
+_lookup: Optional[TramiteStatusLookup] = None
+_lookup_lock = threading.Lock()
+
+
+def get_tramite_status() -> Optional[TramiteStatusLookup]:
+    """Ruta rápida del proceso, o None si TRAMITE_STATUS_LOOKUP está desactivado."""
+
+    global _lookup
+    if _lookup is None and TRAMITE_STATUS_LOOKUP:
+        with _lookup_lock:
+            if _lookup is None:
+                _lookup = TramiteStatusLookup(
+                    "esquema_t", TRAMITE_STATUS_LIMIT, TRAMITE_STATUS_CACHE_SIZE, TRAMITE_STATUS_CACHE_TTL
+                )
+    return _lookup
@@ -0,0 +1,172 @@
+"""Pool acotado de workers para procesar webhooks fuera del ciclo HTTP.
+
+El webhook valida y encola el mensaje, responde a Twilio de inmediato y un
+pool de hilos genera la respuesta y la envía por la API REST. Si la cola está
+llena, ``submit`` rechaza el trabajo para que la ruta aplique backpressure en
+lugar de bloquear al worker de gunicorn.
+
+Los workers son hilos del mismo proceso: comparten el dedup, el historial por
+remitente y los carriles de envío de Twilio, que viven en memoria. Para más
+paralelismo se agregan workers de gunicorn, no procesos hijos del pool.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import (
+    WEBHOOK_DRAIN_TIMEOUT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_WORKERS,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def _run_timed(fn: Callable[..., Any], enqueued_at: float, args: Tuple[Any, ...]) -> Tuple[float, Any]:
+    """Ejecuta ``fn`` y devuelve (segundos en cola, resultado)."""
+
+    waited = time.time() - enqueued_at
+    return waited, fn(*args)
+
+
+class WebhookWorkerPool:
+    """Pool de workers con admisión acotada, métricas y drenado ordenado."""
+
+    def __init__(self, workers: int = 4, max_pending: int = 100):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="webhook-worker")
+
+        self._lock = threading.Condition()
+        self._closed = False
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> bool:
+        """Encola ``fn(*args)``. Retorna False si la cola está llena o cerrada."""
+
+        with self._lock:
+            if self._closed or self._pending >= self.max_pending:
+                self._rejected += 1
+                return False
+            self._pending += 1
+            self._submitted += 1
+
+        try:
+            future = self._executor.submit(_run_timed, fn, time.time(), args)
+        except RuntimeError:
+            # El executor ya se cerró (por ejemplo, durante el apagado).
+            with self._lock:
+                self._pending -= 1
+                self._submitted -= 1
+                self._rejected += 1
+                self._lock.notify_all()
+            return False
+
+        future.add_done_callback(self._on_done)
+        return True
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            try:
+                waited, _ = future.result()
+                self._completed += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            except Exception:
+                self._failed += 1
+                logger.exception("Error procesando webhook en segundo plano")
+            self._lock.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de backpressure y latencia de cola."""
+
+        with self._lock:
+            done = self._completed
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._wait_total / done * 1000, 2) if done else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 2),
+                "closed": self._closed,
+            }
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """Deja de aceptar trabajos y espera a que la cola se vacíe.
+
+        Retorna True si todo el trabajo pendiente terminó dentro del plazo.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._closed = True
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+            drained = self._pending == 0
+
+        if not drained:
+            logger.warning(f"Apagado con {self._pending} webhooks sin procesar")
+        self._executor.shutdown(wait=drained, cancel_futures=not drained)
+        return drained
+
+
+_pool: Optional[WebhookWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def _register_drain(pool: WebhookWorkerPool) -> None:
+    """Drena el pool al salir, antes de que el intérprete espere a los hilos.
+
+    ``concurrent.futures`` une los hilos de sus executors con
+    ``threading._register_atexit``, que corre antes que ``atexit``: registrado
+    con ``atexit`` el drenado llegaría tarde y su plazo no se aplicaría. Esos
+    callbacks corren en orden inverso, así que este va antes que la espera del
+    executor.
+    """
+
+    def drain() -> None:
+        pool.shutdown(WEBHOOK_DRAIN_TIMEOUT)
+
+    register = getattr(threading, "_register_atexit", None)
+    if register is None:
+        atexit.register(drain)
+        return
+    try:
+        register(drain)
+    except RuntimeError:
+        # El intérprete ya se está apagando
+        drain()
+
+
+def get_webhook_pool() -> WebhookWorkerPool:
+    """Retorna el pool del proceso, creándolo con la configuración la primera vez."""
+
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WebhookWorkerPool(workers=WEBHOOK_WORKERS, max_pending=WEBHOOK_QUEUE_SIZE)
+                _register_drain(_pool)
+                logger.info(f"Pool de webhooks iniciado ({_pool.workers} hilos, cola {_pool.max_pending})")
+    return _pool
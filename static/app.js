@@ -92,6 +92,34 @@ function appendMessage(sender, text) {
   bubble.appendChild(content);
   chatLog.appendChild(bubble);
   chatLog.scrollTop = chatLog.scrollHeight;
+  return content;
+}
+
+// Lee una respuesta Server-Sent Events y llama onEvent(evento, datos) por cada evento
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) >= 0) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      raw.split("\n").forEach(line => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
 }
 
 function setLoading(state) {
@@ -127,7 +155,7 @@ async function sendMessage(event) {
   createTypingIndicator();
 
   try {
-    const response = await fetch("/api/chat", {
+    const response = await fetch("/api/chat/stream", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({
@@ -136,16 +164,38 @@ async function sendMessage(event) {
       }),
     });
 
-    const data = await response.json();
-    removeTypingIndicator();
-
-    if (!data.success) {
+    if (!response.ok || !response.body) {
+      const data = await response.json().catch(() => ({}));
+      removeTypingIndicator();
       appendMessage("Sistema", data.error || "No pude procesar tu solicitud.");
       return;
     }
 
-    appendMessage("Asistente", data.response);
-    conversationHistory = data.history || conversationHistory;
+    // Mostrar el texto a medida que llega en lugar de esperar la respuesta completa
+    let textNode = null;
+    let streamed = "";
+    await readEventStream(response, (event, data) => {
+      if (event === "error") {
+        removeTypingIndicator();
+        appendMessage("Sistema", data.error || "No pude procesar tu solicitud.");
+        return;
+      }
+      if (event === "done") {
+        conversationHistory = data.history || conversationHistory;
+        if (!textNode) {
+          removeTypingIndicator();
+          appendMessage("Asistente", data.response);
+        }
+        return;
+      }
+      if (!textNode) {
+        removeTypingIndicator();
+        textNode = appendMessage("Asistente", "");
+      }
+      streamed += data.text;
+      textNode.textContent = streamed;
+      chatLog.scrollTop = chatLog.scrollHeight;
+    });
   } catch (error) {
     removeTypingIndicator();
     appendMessage("Sistema", "❌ Error de red. Intenta de nuevo.");
@@ -0,0 +1,758 @@
+#!/usr/bin/env python
+"""Tests de la capa de acceso a MySQL (sin servidor: conexiones simuladas)."""
+
+import os
+import sys
+import threading
+import unittest
+
+# Agregar ruta del proyecto
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeCursor:
+    """Cursor que registra las consultas y devuelve las filas preparadas."""
+
+    def __init__(self, connection, cursorclass=None):
+        self.connection = connection
+        self.cursorclass = cursorclass
+        self.lastrowid = None
+        self.rowcount = 0
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, data=None):
+        self.connection.executed.append((query, data))
+        if self.connection.results:
+            # Resultado preparado para esta sentencia: (filas, filas afectadas)
+            rows, self.rowcount = self.connection.results.pop(0)
+        else:
+            rows = self.connection.rows
+            self.rowcount = len(rows)
+        self._pending = list(rows)
+
+    def executemany(self, query, rows):
+        self.connection.executed.append((query, list(rows)))
+        if self.connection.fail_on and self.connection.fail_on in query:
+            raise RuntimeError("fallo simulado")
+        self.rowcount = len(rows)
+        # Como InnoDB: ids desde el primero del INSERT, de a auto_increment_increment
+        self.lastrowid = self.connection.next_id
+        self.connection.next_id += len(rows) * self.connection.increment
+        return self.rowcount
+
+    def fetchall(self):
+        rows, self._pending = self._pending, []
+        return rows
+
+    def fetchone(self):
+        return self._pending.pop(0) if self._pending else None
+
+    def fetchmany(self, size):
+        rows, self._pending = self._pending[:size], self._pending[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Conexión mínima con la interfaz que usan el pool y query_db."""
+
+    def __init__(self):
+        self.open = True
+        self.pings = 0
+        self.executed = []
+        self.rows = []
+        self.results = []
+        self.cursorclasses = []
+        self.transactions = []
+        self.next_id = 1
+        self.increment = 1
+        self.fail_on = None
+
+    def cursor(self, cursorclass=None):
+        self.cursorclasses.append(cursorclass)
+        return FakeCursor(self, cursorclass)
+
+    def begin(self):
+        self.transactions.append('begin')
+
+    def commit(self):
+        self.transactions.append('commit')
+
+    def rollback(self):
+        self.transactions.append('rollback')
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if not self.open:
+            raise ConnectionError("conexión cerrada")
+
+    def close(self):
+        self.open = False
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Test suite para el pool de conexiones."""
+
+    def test_pool_reuses_connections(self):
+        """Verifica que las conexiones devueltas se reutilizan."""
+        from config.mysqlconnections import ConnectionPool
+
+        pool = ConnectionPool(FakeConnection, min_size=0, max_size=2)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['reused'], 1)
+        print("✓ Pool reutiliza conexiones")
+
+    def test_pool_is_bounded_and_times_out(self):
+        """Verifica el límite de conexiones y el tiempo de espera."""
+        from config.mysqlconnections import ConnectionPool, PoolTimeout
+
+        pool = ConnectionPool(FakeConnection, min_size=0, max_size=1, timeout=0.05)
+        held = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+        threading.Timer(0.01, pool.release, args=(held,)).start()
+        pool.timeout = 1
+        self.assertIs(pool.acquire(), held)
+        print("✓ Pool acotado con timeout")
+
+    def test_pool_discards_broken_and_expired_connections(self):
+        """Verifica el health-check en checkout y la vida máxima."""
+        from config.mysqlconnections import ConnectionPool
+
+        pool = ConnectionPool(FakeConnection, min_size=0, max_size=2, ping_after=0)
+        broken = pool.acquire()
+        pool.release(broken)
+        broken.open = True
+        broken.ping = lambda reconnect=False: (_ for _ in ()).throw(ConnectionError())
+
+        fresh = pool.acquire()
+        self.assertIsNot(fresh, broken)
+        pool.release(fresh)
+
+        pool.max_lifetime = 0
+        self.assertIsNot(pool.acquire(), fresh)
+        self.assertEqual(pool.stats()['discarded'], 2)
+        print("✓ Pool descarta conexiones rotas o vencidas")
+
+
+def fake_db(pool):
+    """MySQLConnection sobre un pool de conexiones simuladas."""
+    from config.mysqlconnections import MySQLConnection
+
+    db = MySQLConnection.__new__(MySQLConnection)
+    db.database = 'test'
+    db.pool = pool
+    return db
+
+
+class TestQueryDeadline(unittest.TestCase):
+    """Test suite para el plazo de la petición en la capa MySQL."""
+
+    def test_query_db_honours_request_deadline(self):
+        """Verifica el límite de ejecución en SELECT y que no se consulte con el plazo vencido."""
+        import time
+        from config.mysqlconnections import ConnectionPool
+        from services.deadline import Deadline, deadline_scope
+        from services.resilience import DeadlineExceeded
+
+        pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+        db = fake_db(pool)
+        with pool.connection() as connection:
+            connection.rows = [{'id': 1}]
+
+        self.assertEqual(db.query_db("SELECT * FROM tramites WHERE id = %s", (1,)), [{'id': 1}])
+        self.assertNotIn('MAX_EXECUTION_TIME', connection.executed[-1][0])
+
+        with deadline_scope(Deadline(2)):
+            db.query_db("SELECT * FROM tramites WHERE id = %s", (1,))
+        self.assertRegex(connection.executed[-1][0], r'^SELECT /\*\+ MAX_EXECUTION_TIME\(\d+\) \*/ \*')
+
+        expired = Deadline(0.01)
+        time.sleep(0.02)
+        with deadline_scope(expired), self.assertRaises(DeadlineExceeded):
+            db.query_db("UPDATE tramites SET estado = %s", ('listo',))
+        self.assertEqual(len(connection.executed), 2)
+        print("✓ query_db respeta el plazo de la petición")
+
+
+class TestExecuteMany(unittest.TestCase):
+    """Test suite para la escritura de varias filas en un solo viaje."""
+
+    def test_execute_many_sends_one_batch(self):
+        """Verifica que todas las filas viajen en una sola llamada."""
+        from config.mysqlconnections import ConnectionPool
+
+        pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+        db = fake_db(pool)
+        rows = [('SM%d' % i, 'delivered') for i in range(5)]
+
+        self.assertEqual(db.execute_many("INSERT INTO estados_mensajes (message_sid, estado) VALUES (%s, %s)", rows), 5)
+        self.assertEqual(db.execute_many("INSERT INTO estados_mensajes (message_sid, estado) VALUES (%s, %s)", []), 0)
+        with pool.connection() as connection:
+            self.assertEqual(len(connection.executed), 1)
+        print("✓ execute_many en un solo viaje")
+
+
+class TestStatementRegistry(unittest.TestCase):
+    """Test suite para el registro de sentencias de query_db."""
+
+    def test_classifies_by_leading_verb(self):
+        """Verifica la clasificación por verbo inicial (no por subcadenas)."""
+        from config.mysqlconnections import clasificar_sentencia
+
+        casos = {
+            "SELECT id, insertado FROM auditoria": 'lectura',
+            "  /* listado */ (SELECT 1) UNION (SELECT 2)": 'lectura',
+            "-- comentario\nSHOW TABLES": 'lectura',
+            "WITH t AS (SELECT 1) SELECT * FROM t": 'lectura',
+            "INSERT INTO tramites (nombre) VALUES (%s)": 'insercion',
+            "\n            INSERT INTO tramites (nombre) VALUES (%s)": 'insercion',
+            "UPDATE tramites SET descripcion = 'select * from x' WHERE id = %s": 'escritura',
+            "DELETE FROM tramites WHERE nombre = 'insert'": 'escritura',
+        }
+        for query, tipo in casos.items():
+            self.assertEqual(clasificar_sentencia(query).tipo, tipo, query)
+        self.assertEqual(clasificar_sentencia("  select 1").fin_select, 8)
+        self.assertEqual(clasificar_sentencia("SHOW TABLES").fin_select, 0)
+        print("✓ Clasificación de sentencias por verbo")
+
+    def test_query_db_parses_once_and_does_not_print(self):
+        """Verifica que cada texto se analice una vez y que no haya salida por consola."""
+        import io
+        from contextlib import redirect_stdout
+        from config.mysqlconnections import ConnectionPool, clasificar_sentencia
+
+        pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+        db = fake_db(pool)
+        with pool.connection() as connection:
+            connection.rows = [{'id': 1, 'insertado': 'hoy'}]
+
+        query = "SELECT id, insertado FROM auditoria WHERE id = %s -- registro"
+        antes = clasificar_sentencia.cache_info()
+        salida = io.StringIO()
+        with redirect_stdout(salida):
+            resultados = [db.query_db(query, (1,)) for _ in range(5)]
+        despues = clasificar_sentencia.cache_info()
+
+        self.assertEqual(resultados[0], [{'id': 1, 'insertado': 'hoy'}])
+        self.assertEqual(despues.misses - antes.misses, 1)
+        self.assertEqual(despues.hits - antes.hits, 4)
+        self.assertEqual(salida.getvalue(), '')
+        print("✓ query_db analiza cada sentencia una vez y sin prints")
+
+
+class TestTramiteListing(unittest.TestCase):
+    """Test suite para el listado paginado y la exportación de trámites."""
+
+    def setUp(self):
+        from datetime import datetime
+        from config.mysqlconnections import ConnectionPool
+
+        self.pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+        self.db = fake_db(self.pool)
+        with self.pool.connection() as connection:
+            pass
+        self.connection = connection
+        self.fechas = [datetime(2024, 5, 3, 10, 0), datetime(2024, 5, 2, 10, 0), datetime(2024, 5, 2, 10, 0)]
+
+    def test_keyset_pagination_with_filters_and_projection(self):
+        """Verifica LIMIT, filtros, proyección y el cursor de la página siguiente."""
+        import json
+        from unittest import mock
+        from controllers.tramite_controller import TramiteController
+
+        # Tuplas en el orden del SELECT: campos pedidos y luego id, fecha_creacion
+        self.connection.rows = [(n, 'pendiente', i, f) for n, i, f in zip('CBA', (3, 2, 1), self.fechas)]
+        with mock.patch('controllers.tramite_controller.connectToMySQL', return_value=self.db):
+            cuerpo, status, headers = TramiteController.obtener_todos_tramites(
+                limite=2, estado='pendiente', campos=['nombre', 'estado'])
+
+        body = json.loads(cuerpo)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        self.assertEqual(body['tramites'], [{'nombre': 'C', 'estado': 'pendiente'},
+                                            {'nombre': 'B', 'estado': 'pendiente'}])
+        self.assertIsNotNone(body['siguiente'])
+        query, data = self.connection.executed[-1]
+        self.assertIn('SELECT nombre, estado, id, fecha_creacion FROM tramites WHERE estado = %s', query)
+        self.assertTrue(query.endswith('ORDER BY fecha_creacion DESC, id DESC LIMIT %s'))
+        self.assertEqual(data, ('pendiente', 3))
+
+        self.connection.rows = [(1, self.fechas[2])]
+        with mock.patch('controllers.tramite_controller.connectToMySQL', return_value=self.db):
+            cuerpo, _, _ = TramiteController.obtener_todos_tramites(
+                limite=2, cursor=body['siguiente'], campos=['id'])
+        body = json.loads(cuerpo)
+        query, data = self.connection.executed[-1]
+        self.assertIn('(fecha_creacion < %s OR (fecha_creacion = %s AND id < %s))', query)
+        self.assertEqual(data[2:], (2, 3))
+        self.assertEqual(body['tramites'], [{'id': 1}])
+        self.assertIsNone(body['siguiente'])
+
+        self.assertEqual(TramiteController.obtener_todos_tramites(cursor='???')[1], 400)
+        self.assertEqual(TramiteController.obtener_todos_tramites(campos=['clave'])[1], 400)
+        print("✓ Listado paginado por (fecha_creacion, id)")
+
+    def test_export_streams_ndjson_with_unbuffered_cursor(self):
+        """Verifica la exportación NDJSON con cursor sin buffer."""
+        import json
+        import pymysql
+        from unittest import mock
+        from controllers.tramite_controller import TramiteController
+
+        self.connection.rows = [(i, n, f) for i, n, f in zip((3, 2, 1), 'CBA', self.fechas)]
+        with mock.patch('controllers.tramite_controller.connectToMySQL', return_value=self.db), \
+                mock.patch('controllers.tramite_controller.TRAMITES_EXPORT_FETCH', 2):
+            lineas, status = TramiteController.exportar_tramites(campos=['id', 'nombre'])
+            self.assertEqual(status, 200)
+            filas = [json.loads(linea) for linea in lineas]
+
+        self.assertEqual(filas, [{'id': 3, 'nombre': 'C'}, {'id': 2, 'nombre': 'B'}, {'id': 1, 'nombre': 'A'}])
+        self.assertIs(self.connection.cursorclasses[-1], pymysql.cursors.SSCursor)
+        self.assertNotIn('LIMIT', self.connection.executed[-1][0])
+        print("✓ Exportación NDJSON en streaming")
+
+
+class TestTramiteModel(unittest.TestCase):
+    """Test suite para el modelo Tramite y su serialización JSON."""
+
+    def test_slotted_row_and_iso_dates(self):
+        """Verifica __slots__, la creación desde tupla y las fechas ISO-8601."""
+        from datetime import datetime
+        from models.tramite import Tramite
+
+        fila = (7, 'Licencia', None, 'listo', '+57300', datetime(2024, 5, 2, 10, 0), None)
+        tramite = Tramite.desde_tupla(fila)
+        self.assertFalse(hasattr(tramite, '__dict__'))
+        self.assertEqual(tramite.to_tuple(), fila)
+        self.assertEqual(tramite.to_dict()['fecha_creacion'], '2024-05-02T10:00:00')
+        self.assertIsNone(tramite.to_dict()['fecha_actualizacion'])
+        self.assertEqual(Tramite(tramite.to_dict()).to_dict(), tramite.to_dict())
+        print("✓ Tramite con __slots__ y fechas ISO-8601")
+
+    def test_bulk_serializer_matches_json(self):
+        """Verifica que el serializador por bloques produzca el mismo JSON que json.dumps."""
+        import json
+        from datetime import datetime
+        from models.tramite import COLUMNAS, Tramite, serializar_tramites
+
+        filas = [(i, f'Trámite "{i}"\n', None if i % 2 else 'ñandú \\ ok', 'pendiente', None,
+                  datetime(2024, 1, 1, 0, 0, i), datetime(2024, 1, 1, 0, 0, i, 500)) for i in range(7)]
+        esperado = [Tramite.desde_tupla(f).to_dict() for f in filas]
+
+        for por_bloque in (1, 3, 7, 100):
+            self.assertEqual(json.loads(serializar_tramites(filas, filas_por_bloque=por_bloque)), esperado)
+        self.assertEqual(json.loads(serializar_tramites([], COLUMNAS)), [])
+        self.assertEqual(json.loads(serializar_tramites([Tramite.desde_tupla(filas[0])], ('id', 'nombre'))),
+                         [{'id': 0, 'nombre': 'Trámite "0"\n'}])
+        print("✓ Serialización JSON por bloques")
+
+
+class TestTramiteWrites(unittest.TestCase):
+    """Test suite para UPDATE/DELETE de trámites por filas afectadas."""
+
+    def setUp(self):
+        from datetime import datetime
+        from config.mysqlconnections import ConnectionPool
+
+        self.pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+        self.db = fake_db(self.pool)
+        with self.pool.connection() as connection:
+            pass
+        self.connection = connection
+        self.version = datetime(2024, 5, 2, 10, 0, 0, 123000)
+        self.fila = {'id': 7, 'nombre': 'Licencia', 'descripcion': None, 'estado': 'listo',
+                     'usuario_whatsapp': '+573001112233', 'fecha_creacion': datetime(2024, 5, 1),
+                     'fecha_actualizacion': self.version}
+
+    def _call(self, method, *args, **kwargs):
+        from unittest import mock
+        from controllers.tramite_controller import TramiteController
+
+        before = len(self.connection.executed)
+        with mock.patch('controllers.tramite_controller.connectToMySQL', return_value=self.db):
+            body, status = getattr(TramiteController, method)(*args, **kwargs)
+        return body, status, len(self.connection.executed) - before
+
+    def test_round_trips_per_operation(self):
+        """Mide los viajes a MySQL: UPDATE + lectura y DELETE solo (antes 3 y 2)."""
+        self.connection.results = [([], 1), ([self.fila], 1)]
+        body, status, viajes_update = self._call('actualizar_tramite', 7, estado='listo')
+        self.assertEqual((status, body['tramite']['estado']), (200, 'listo'))
+        self.assertEqual(viajes_update, 2)
+
+        self.connection.results = [([], 1)]
+        body, status, viajes_delete = self._call('eliminar_tramite', 7)
+        self.assertEqual(status, 200)
+        self.assertEqual(viajes_delete, 1)
+
+        self.connection.results = [([], 0)]
+        self.assertEqual(self._call('eliminar_tramite', 8)[1], 404)
+        self.connection.results = [([], 0), ([], 0)]
+        self.assertEqual(self._call('actualizar_tramite', 8, estado='listo')[1], 404)
+        self.assertEqual(self._call('actualizar_tramite', 7)[1:], (400, 0))
+        print(f"✓ Viajes por operación: UPDATE {viajes_update} (antes 3), DELETE {viajes_delete} (antes 2)")
+
+    def test_optimistic_concurrency_on_fecha_actualizacion(self):
+        """Verifica que una versión vieja produzca 409 sin aplicar el cambio."""
+        self.connection.results = [([], 1), ([self.fila], 1)]
+        _, status, _ = self._call('actualizar_tramite', 7, fecha_actualizacion=str(self.version), estado='listo')
+        query, data = self.connection.executed[-2]
+        self.assertTrue(query.endswith('WHERE id = %s AND fecha_actualizacion = %s'))
+        self.assertEqual(data, ('listo', 7, self.version))
+        self.assertEqual(status, 200)
+
+        self.connection.results = [([], 0), ([self.fila], 1)]
+        body, status, _ = self._call('actualizar_tramite', 7, fecha_actualizacion='2024-05-02 09:00:00', estado='x')
+        self.assertEqual(status, 409)
+        self.assertEqual(body['tramite']['estado'], 'listo')
+
+        self.connection.results = [([], 0), ([self.fila], 1)]
+        body, status, viajes = self._call('eliminar_tramite', 7, '2024-05-02T09:00:00')
+        self.assertEqual((status, viajes), (409, 2))
+
+        self.assertEqual(self._call('eliminar_tramite', 7, 'ayer')[1], 400)
+        print("✓ Concurrencia optimista por fecha_actualizacion")
+
+
+class TestTramiteBulk(unittest.TestCase):
+    """Test suite para la carga masiva y el cambio de estado en bloque."""
+
+    def setUp(self):
+        from config.mysqlconnections import ConnectionPool
+        from controllers import tramite_controller
+
+        self.pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+        self.db = fake_db(self.pool)
+        with self.pool.connection() as connection:
+            connection.next_id = 100
+        self.connection = connection
+        # @@auto_increment_increment ya leído (servidor con paso 1)
+        tramite_controller._incrementos['test'] = 1
+        self.addCleanup(tramite_controller._incrementos.clear)
+
+    def _patch(self):
+        from unittest import mock
+        return mock.patch('controllers.tramite_controller.connectToMySQL', return_value=self.db)
+
+    def test_bulk_create_chunks_in_one_transaction(self):
+        """Verifica lotes de executemany, ids por fila y filas inválidas informadas."""
+        from unittest import mock
+        from controllers.tramite_controller import TramiteController
+
+        filas = [{'nombre': f'T{i}', 'usuario_whatsapp': '+57300'} for i in range(5)]
+        filas.insert(2, {'descripcion': 'sin nombre'})
+        with self._patch(), mock.patch('controllers.tramite_controller.TRAMITES_BULK_CHUNK', 2):
+            body, status = TramiteController.crear_tramites_lote(filas)
+
+        self.assertEqual(status, 201)
+        self.assertEqual((body['creados'], body['rechazados']), (5, 1))
+        self.assertEqual([r.get('tramite_id') for r in body['resultados']], [100, 101, None, 102, 103, 104])
+        self.assertEqual(body['resultados'][2], {'indice': 2, 'success': False, 'error': "Falta 'nombre'"})
+        self.assertEqual([len(rows) for _, rows in self.connection.executed], [2, 2, 1])
+        self.assertEqual(self.connection.transactions, ['begin', 'commit'])
+
+        self.connection.fail_on = 'INSERT'
+        with self._patch():
+            body, status = TramiteController.crear_tramites_lote([{'nombre': 'A'}, {'nombre': 'B'}])
+        self.assertEqual(status, 400)
+        self.assertEqual(body['creados'], 0)
+        self.assertEqual(self.connection.transactions[-1], 'rollback')
+        print("✓ Carga masiva por lotes en una transacción")
+
+    def test_bulk_create_honours_auto_increment_increment(self):
+        """Verifica los ids por fila cuando el servidor avanza AUTO_INCREMENT de a más de 1."""
+        from unittest import mock
+        from controllers import tramite_controller
+        from controllers.tramite_controller import TramiteController
+
+        tramite_controller._incrementos.clear()
+        # Como Galera con tres nodos: ids 100, 103, 106...
+        self.connection.increment = 3
+        self.connection.results = [([{'incremento': 3}], 1)]
+        filas = [{'nombre': f'T{i}'} for i in range(3)]
+        with self._patch(), mock.patch('controllers.tramite_controller.TRAMITES_BULK_CHUNK', 2):
+            body, _ = TramiteController.crear_tramites_lote(filas)
+            self.connection.next_id = 200
+            otra, _ = TramiteController.crear_tramites_lote(filas[:2])
+
+        self.assertEqual([r['tramite_id'] for r in body['resultados']], [100, 103, 106])
+        self.assertEqual([r['tramite_id'] for r in otra['resultados']], [200, 203])
+        consultas = [q for q, _ in self.connection.executed if '@@auto_increment_increment' in q]
+        self.assertEqual(len(consultas), 1)
+        print("✓ Ids de la carga masiva con auto_increment_increment")
+
+    def test_bulk_endpoint_accepts_ndjson(self):
+        """Verifica el endpoint con NDJSON y líneas inválidas."""
+        from flask import Flask
+        from routes.tramite import tramite_bp
+
+        app = Flask(__name__)
+        app.register_blueprint(tramite_bp)
+        cuerpo = '{"nombre": "Pasaporte"}\nno es json\n\n{"nombre": "Visa", "estado": "en_revision"}\n'
+        with self._patch():
+            response = app.test_client().post('/api/tramites/lote', data=cuerpo,
+                                              content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 201)
+        resultados = response.get_json()['resultados']
+        self.assertEqual([r['success'] for r in resultados], [True, False, True])
+        self.assertEqual(self.connection.executed[0][1][1], ('Visa', None, None, 'en_revision'))
+        print("✓ Endpoint de carga masiva con NDJSON")
+
+    def test_bulk_state_transition(self):
+        """Verifica el UPDATE ... WHERE id IN (...) por lotes con estado de origen."""
+        from unittest import mock
+        from controllers.tramite_controller import TramiteController
+
+        self.connection.results = [([], 2), ([], 1)]
+        with self._patch(), mock.patch('controllers.tramite_controller.TRAMITES_BULK_CHUNK', 2):
+            body, status = TramiteController.cambiar_estado_lote([1, 2, 2, 3], 'aprobado', ['pendiente'])
+
+        self.assertEqual(status, 200)
+        self.assertEqual((body['solicitados'], body['actualizados']), (3, 3))
+        query, data = self.connection.executed[0]
+        self.assertEqual(query, "UPDATE tramites SET estado = %s WHERE id IN (%s, %s) AND estado IN (%s)")
+        self.assertEqual(data, ('aprobado', 1, 2, 'pendiente'))
+        self.assertEqual(self.connection.transactions, ['begin', 'commit'])
+        self.assertEqual(TramiteController.cambiar_estado_lote(['1'], 'aprobado')[1], 400)
+        print("✓ Cambio de estado en bloque")
+
+
+class TestTramiteCache(unittest.TestCase):
+    """Test suite para el cache de obtener_tramite y el ETag de la ruta."""
+
+    def setUp(self):
+        from datetime import datetime
+        from config.mysqlconnections import ConnectionPool
+        from controllers.tramite_controller import tramite_cache
+
+        tramite_cache.clear()
+        self.pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+        self.db = fake_db(self.pool)
+        with self.pool.connection() as connection:
+            connection.rows = [{'id': 5, 'nombre': 'Visa', 'descripcion': None, 'estado': 'pendiente',
+                                'usuario_whatsapp': None, 'fecha_creacion': datetime(2024, 5, 1),
+                                'fecha_actualizacion': datetime(2024, 5, 2, 9, 30, 0, 250000)}]
+        self.connection = connection
+
+    def _patch(self):
+        from unittest import mock
+        return mock.patch('controllers.tramite_controller.connectToMySQL', return_value=self.db)
+
+    def test_reads_are_cached_and_writes_invalidate(self):
+        """Verifica que la segunda lectura no consulte y que las escrituras invaliden."""
+        from controllers.tramite_controller import TramiteController
+
+        with self._patch():
+            primero = TramiteController.obtener_tramite(5)
+            segundo = TramiteController.obtener_tramite(5)
+            self.assertEqual(primero, segundo)
+            self.assertEqual(len(self.connection.executed), 1)
+
+            self.connection.results = [([], 1), (self.connection.rows, 1)]
+            TramiteController.actualizar_tramite(5, estado='listo')
+            TramiteController.obtener_tramite(5)
+            self.assertEqual(len(self.connection.executed), 4)
+
+            self.connection.results = [([], 1)]
+            TramiteController.eliminar_tramite(5)
+            self.connection.rows = []
+            self.assertEqual(TramiteController.obtener_tramite(5)[1], 404)
+        print("✓ Cache de trámites con invalidación en escrituras")
+
+    def test_read_racing_a_write_is_not_cached(self):
+        """Verifica que una lectura concurrente con una escritura no deje la versión vieja."""
+        from controllers import tramite_controller
+        from controllers.tramite_controller import TramiteController, tramite_cache
+
+        original = self.db.query_db
+
+        def lectura_lenta(query, data=None):
+            resultado = original(query, data)
+            tramite_controller._invalidar(5)  # escritura entre el SELECT y el guardado
+            return resultado
+
+        self.db.query_db = lectura_lenta
+        with self._patch():
+            self.assertEqual(TramiteController.obtener_tramite(5)[1], 200)
+        self.assertIsNone(tramite_cache.get(5))
+        print("✓ Lectura concurrente con escritura no se cachea")
+
+    def test_etag_and_if_none_match(self):
+        """Verifica el ETag por fecha_actualizacion y el 304 sin cuerpo."""
+        from flask import Flask
+        from routes.tramite import tramite_bp
+
+        app = Flask(__name__)
+        app.register_blueprint(tramite_bp)
+        client = app.test_client()
+        with self._patch():
+            response = client.get('/api/tramites/5')
+            etag = response.headers['ETag']
+            self.assertEqual(etag, '"5-2024-05-02T09:30:00.250000"')
+
+            no_modificado = client.get('/api/tramites/5', headers={'If-None-Match': etag})
+            self.assertEqual(no_modificado.status_code, 304)
+            self.assertEqual(no_modificado.data, b'')
+
+            otra_version = client.get('/api/tramites/5', headers={'If-None-Match': '"5-2024-01-01T00:00:00"'})
+            self.assertEqual(otra_version.status_code, 200)
+        self.assertEqual(len(self.connection.executed), 1)
+        print("✓ ETag y 304 en GET /api/tramites/<id>")
+
+    def test_writes_invalidate_whatsapp_status(self):
+        """Verifica que cambiar estado, reasignar y eliminar refresquen la respuesta por WhatsApp."""
+        from unittest import mock
+        from datetime import datetime
+        from controllers.tramite_controller import TramiteController
+        from services.tramite_status import TramiteStatusLookup
+
+        lookup = TramiteStatusLookup(limit=3, ttl=60)
+        estado_db = mock.Mock()
+        estado_db.query_rows.return_value = [(5, 'Visa', 'pendiente', datetime(2024, 5, 2))]
+        pregunta = '¿Cómo va mi trámite?'
+        with self._patch(), \
+                mock.patch('config.mysqlconnections.connectToMySQL', return_value=estado_db), \
+                mock.patch('controllers.tramite_controller.get_tramite_status', return_value=lookup):
+            self.assertIn('Visa: pendiente', lookup.answer('whatsapp:+570001', pregunta))
+
+            # SELECT de dueños y UPDATE en bloque
+            self.connection.results = [([{'usuario_whatsapp': '+570001'}], 1), ([], 1)]
+            TramiteController.cambiar_estado_lote([5], 'aprobado')
+            estado_db.query_rows.return_value = [(5, 'Visa', 'aprobado', datetime(2024, 5, 3))]
+            self.assertIn('Visa: aprobado', lookup.answer('whatsapp:+570001', pregunta))
+
+            # Reasignación: se invalidan el dueño anterior y el nuevo
+            lookup.answer('whatsapp:+570002', pregunta)
+            fila = dict(self.connection.rows[0], usuario_whatsapp='+570002')
+            self.connection.results = [([{'usuario_whatsapp': '+570001'}], 1), ([], 1), ([fila], 1)]
+            TramiteController.actualizar_tramite(5, usuario_whatsapp='+570002')
+            self.assertIsNone(lookup._cache.get('+570001'))
+            self.assertIsNone(lookup._cache.get('+570002'))
+
+            # Sin reasignación no hay SELECT previo: el dueño sale de la fila ya leída
+            lookup.answer('whatsapp:+570002', pregunta)
+            self.connection.executed.clear()
+            self.connection.results = [([], 1), ([dict(fila, estado='en revisión')], 1)]
+            TramiteController.actualizar_tramite(5, estado='en revisión')
+            self.assertEqual(len(self.connection.executed), 2)
+            self.assertTrue(self.connection.executed[0][0].startswith('UPDATE'))
+            self.assertIsNone(lookup._cache.get('+570002'))
+
+            lookup.answer('whatsapp:+570002', pregunta)
+            self.connection.results = [([{'usuario_whatsapp': '+570002'}], 1), ([], 1)]
+            self.assertEqual(TramiteController.eliminar_tramite(5)[1], 200)
+            estado_db.query_rows.return_value = []
+            self.assertIn('No encontramos trámites', lookup.answer('whatsapp:+570002', pregunta))
+        self.assertEqual(estado_db.query_rows.call_count, 6)
+        print("✓ Escrituras invalidan la consulta de estado por WhatsApp")
+
+
+class TestQueryMetrics(unittest.TestCase):
+    """Test suite para la latencia por sentencia y el log de consultas lentas."""
+
+    def setUp(self):
+        from unittest import mock
+        from config.mysqlconnections import ConnectionPool
+        from controllers.tramite_controller import tramite_cache
+        from services.db_metrics import QueryMetrics
+
+        tramite_cache.clear()
+        self.metrics = QueryMetrics(slow_seconds=0, max_statements=50)
+        patcher = mock.patch('config.mysqlconnections.get_query_metrics', return_value=self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+        self.db = fake_db(self.pool)
+
+    def test_normalizes_statements(self):
+        """Verifica que literales, listas IN y filas de VALUES se agrupen en una sola clave."""
+        from services.db_metrics import normalizar_sql
+
+        self.assertEqual(normalizar_sql("SELECT *\n  FROM tramites WHERE id IN (%s, %s, %s) LIMIT 50 -- x"),
+                         "SELECT * FROM tramites WHERE id IN (?+) LIMIT ?")
+        self.assertEqual(normalizar_sql("SELECT * FROM tramites WHERE id IN (%s)"),
+                         "SELECT * FROM tramites WHERE id IN (?+)")
+        self.assertEqual(normalizar_sql("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)"),
+                         "INSERT INTO t (a, b) VALUES (?+)...")
+        self.assertEqual(normalizar_sql("UPDATE t SET estado = 'listo' WHERE id = 7"),
+                         "UPDATE t SET estado = ? WHERE id = ?")
+        print("✓ Normalización de sentencias")
+
+    def test_records_phases_and_histogram(self):
+        """Verifica las fases, el histograma y el conteo de errores por sentencia."""
+        with self.pool.connection() as connection:
+            connection.rows = [{'id': 1}]
+
+        for i in range(3):
+            self.db.query_db("SELECT * FROM tramites WHERE id = %s", (i,))
+        with self.db.cursor() as cursor:
+            cursor.execute("UPDATE tramites SET estado = %s WHERE id = %s", ('listo', 1))
+            cursor.execute("SELECT * FROM tramites WHERE id = %s", (1,))
+            cursor.fetchone()
+        with self.assertRaises(RuntimeError), self.db.transaction() as cursor:
+            connection.fail_on = 'INSERT'
+            cursor.executemany("INSERT INTO tramites (nombre) VALUES (%s)", [('a',)])
+
+        stats = self.metrics.stats()
+        select = stats['by_statement']['SELECT * FROM tramites WHERE id = ?']
+        self.assertEqual(select['count'], 4)
+        self.assertEqual(sum(select['histogram'].values()), 4)
+        for fase in ('connect_ms', 'execute_ms', 'fetch_ms', 'p50_ms', 'p95_ms', 'p99_ms'):
+            self.assertIn(fase, select)
+        self.assertEqual(stats['by_statement']['UPDATE tramites SET estado = ? WHERE id = ?']['count'], 1)
+        self.assertEqual(stats['by_statement']['INSERT INTO tramites (nombre) VALUES (?+)']['errors'], 1)
+        self.assertEqual(stats['by_statement']['BEGIN']['count'], 1)
+        self.assertNotIn('COMMIT', stats['by_statement'])
+        self.assertEqual(stats['errors'], 1)
+        print("✓ Latencia por fase e histograma por sentencia")
+
+    def test_slow_query_logs_controller_method(self):
+        """Verifica que la consulta lenta se registre con el método del controlador."""
+        from unittest import mock
+        from controllers.tramite_controller import TramiteController
+
+        self.metrics.slow_seconds = 1e-9
+        with self.pool.connection() as connection:
+            connection.rows = []
+        with mock.patch('controllers.tramite_controller.connectToMySQL', return_value=self.db), \
+                self.assertLogs('services.db_metrics', 'WARNING') as logs:
+            TramiteController.obtener_tramite(99)
+
+        self.assertIn('TramiteController.obtener_tramite', logs.output[0])
+        serie = self.metrics.stats()['by_statement']['SELECT * FROM tramites WHERE id = ?']
+        self.assertEqual(serie['slow_callers'], {'TramiteController.obtener_tramite': 1})
+        print("✓ Consulta lenta registrada con el método del controlador")
+
+    def test_metrics_endpoint(self):
+        """Verifica que GET /metrics/db exponga latencias, registro y pools."""
+        from app import app
+
+        self.db.query_db("DELETE FROM tramites WHERE id = %s", (1,))
+        response = app.test_client().get('/metrics/db')
+        self.assertEqual(response.status_code, 200)
+        datos = response.get_json()
+        self.assertEqual(datos['queries']['by_statement']['DELETE FROM tramites WHERE id = ?']['count'], 1)
+        self.assertIn('statement_registry', datos)
+        self.assertIn('pools', datos)
+        print("✓ GET /metrics/db")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
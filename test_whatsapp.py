@@ -128,6 +128,138 @@ class TestAssistant(unittest.TestCase):
             self.assertGreater(len(response), 0)
         
         print(f"✓ Probadas {len(test_messages)} tipos de mensaje")
+    
+    def test_model_registry_reuses_models(self):
+        """Verifica que el modelo se construye una vez por configuración."""
+        from unittest import mock
+        from model.assistant import ModelRegistry
+        
+        registry = ModelRegistry()
+        with mock.patch('model.assistant.genai') as fake_genai:
+            first = registry.get('key-1', 'gemini-pro')
+            second = registry.get('key-1', 'gemini-pro')
+            other = registry.get('key-2', 'gemini-pro')
+        
+        self.assertIs(first, second)
+        self.assertEqual(fake_genai.GenerativeModel.call_count, 2)
+        self.assertEqual(fake_genai.configure.call_count, 2)
+        self.assertEqual(registry.stats()['hits'], 1)
+        self.assertEqual(registry.stats()['misses'], 2)
+        print("✓ Registro de modelos reutiliza instancias")
+    
+    def test_response_cache_skips_repeated_questions(self):
+        """Verifica que una pregunta repetida no vuelve a llamar al modelo."""
+        from unittest import mock
+        from model import assistant
+        
+        fake_model = mock.Mock()
+        fake_model.generate_content.return_value = mock.Mock(text="Sí, en negro y plata")
+        assistant.response_cache.clear()
+        assistant.semantic_cache.clear()
+        
+        with mock.patch.object(assistant.model_registry, 'get', return_value=fake_model):
+            first = assistant.generate_response("¿Tienen el Pulse Pro en color negro?", api_key='test-key')
+            second = assistant.generate_response("tienen el PULSE pro en   color negro", api_key='test-key')
+            assistant.generate_response("tienen el pulse pro en color negro", api_key='test-key', use_cache=False)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(fake_model.generate_content.call_count, 2)
+        self.assertEqual(assistant.normalize_message("  ¿Envío  RÁPIDO? "), "envio rapido")
+        assistant.response_cache.clear()
+        assistant.semantic_cache.clear()
+        print("✓ Cache de respuestas evita llamadas repetidas")
+    
+    def test_intent_router_answers_policies_without_llm(self):
+        """Verifica que las intenciones claras se responden sin llamar al modelo."""
+        from unittest import mock
+        from model import assistant
+        
+        match = assistant.route_intent("¿Cuál es el HORARIO de atención?")
+        self.assertEqual(match.intent, 'horario')
+        self.assertEqual(match.confidence, 1.0)
+        self.assertLess(assistant.route_intent("¿cuánto cuesta el envío?").confidence, 0.75)
+        self.assertIsNone(assistant.route_intent("hola").intent)
+        
+        with mock.patch.object(assistant.model_registry, 'get') as fake_get:
+            response = assistant.generate_response("garantía?", api_key='test-key')
+        
+        fake_get.assert_not_called()
+        self.assertEqual(response, assistant.FALLBACK_RESPONSES['garantia'])
+        print("✓ Enrutador de intenciones responde sin LLM")
+    
+    def test_build_messages_keeps_prompt_bounded(self):
+        """Verifica que el historial largo se compacta en un resumen."""
+        from model.assistant import build_messages, HISTORY_KEEP_TURNS
+        
+        history = []
+        for i in range(50):
+            history.append({'sender': 'Usuario', 'text': f'pregunta {i} sobre la garantía'})
+            history.append({'sender': 'Asistente', 'text': 'respuesta ' * 30})
+        
+        short = build_messages('hola', history[:20])
+        long = build_messages('hola', history)
+        size = lambda msgs: sum(len(m['parts'][0]) for m in msgs)
+        
+        self.assertEqual(len(long), len(short))
+        self.assertLessEqual(len(long), HISTORY_KEEP_TURNS * 2 + 3)
+        self.assertLess(abs(size(long) - size(short)), 100)
+        self.assertIn('garantia', long[0]['parts'][0])
+        self.assertEqual(long[-1], {'role': 'user', 'parts': ['hola']})
+        print(f"✓ Historial compactado: {len(long)} mensajes")
+    
+    def test_semantic_cache_matches_near_duplicates(self):
+        """Verifica que el cache semántico reconoce variantes y respeta el límite."""
+        from model.assistant import normalize_message
+        from model.semantic_cache import SemanticCache
+        
+        cache = SemanticCache(maxsize=2, threshold=0.8)
+        cache.add(normalize_message("hacen envios a medellin"), "Sí, en 2 a 5 días")
+        
+        hit = cache.lookup(normalize_message("¿Hacen envío a Medellín?"))
+        self.assertIsNotNone(hit)
+        self.assertEqual(hit[0], "Sí, en 2 a 5 días")
+        self.assertIsNone(cache.lookup(normalize_message("garantia de los aeropods")))
+        self.assertIsNone(cache.lookup(normalize_message("hacen envios a medellin"), scope="otro"))
+        
+        cache.add("uno", "1")
+        cache.add("dos", "2")
+        self.assertEqual(cache.stats()['size'], 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        print(f"✓ Cache semántico: similitud {hit[1]:.2f}")
+
+    def test_semantic_cache_never_mixes_products(self):
+        """Verifica que preguntas sobre productos distintos no compartan respuesta."""
+        from unittest import mock
+        from model.assistant import PRODUCT_ENTITIES, normalize_message
+        from model.semantic_cache import SemanticCache
+
+        cache = SemanticCache(threshold=0.85, entities=PRODUCT_ENTITIES)
+        cache.add(normalize_message("cual es la garantia del reloj"), "reloj: 12 meses")
+        cache.add(normalize_message("cuanto cuesta el reloj pulse pro"), "reloj: $299,000")
+        cache.add(normalize_message("cuanto cuesta el router wave"), "router: $189,000")
+
+        for pregunta in ("cual es la garantia del router", "cuanto cuestan los audifonos",
+                         "cuanto cuesta el reloj y el router"):
+            self.assertIsNone(cache.lookup(normalize_message(pregunta)), pregunta)
+        self.assertEqual(cache.lookup(normalize_message("precio del Pulse Pro"))[0], "reloj: $299,000")
+        self.assertEqual(cache.lookup(normalize_message("¿Cuánto vale el router?"))[0], "router: $189,000")
+        self.assertGreater(cache.stats()['entity_mismatches'], 0)
+
+        # Una pregunta negada no reutiliza la respuesta de su afirmativa (ni al revés)
+        cache.add(normalize_message("puedo pagar con pse"), "Sí, aceptamos PSE")
+        for pregunta in ("no puedo pagar con pse", "nunca puedo pagar con pse", "puedo pagar sin pse"):
+            self.assertIsNone(cache.lookup(normalize_message(pregunta)), pregunta)
+        cache.add(normalize_message("no puedo pagar con pse"), "Revisa el límite de tu banco")
+        self.assertEqual(cache.lookup(normalize_message("¿Puedo pagar con PSE?"))[0], "Sí, aceptamos PSE")
+        self.assertEqual(cache.lookup(normalize_message("No puedo pagar con PSE"))[0], "Revisa el límite de tu banco")
+
+        # Los pesos de las entradas se calculan una vez mientras el índice no cambie
+        cache.lookup(normalize_message("precio del Pulse Pro"))
+        with mock.patch.object(cache, '_weights', wraps=cache._weights) as pesos:
+            cache.lookup(normalize_message("precio del Pulse Pro"))
+            cache.lookup(normalize_message("precio del Pulse Pro"))
+        self.assertEqual(pesos.call_count, 2)
+        print("✓ Cache semántico separado por producto y por negación")
 
 
 class TestFlaskApp(unittest.TestCase):
@@ -150,6 +282,93 @@ class TestFlaskApp(unittest.TestCase):
         self.assertIn(response.status_code, [200, 404])  # 404 es OK si no hay template
         print(f"✓ Ruta index: {response.status_code}")
     
+    def test_chat_stream_emits_chunks(self):
+        """Verifica que /api/chat/stream envía fragmentos SSE y un evento final."""
+        from unittest import mock
+        from model import assistant
+        
+        fake_model = mock.Mock()
+        fake_model.generate_content.return_value = iter([mock.Mock(text="Hola, "), mock.Mock(text="¿en qué te ayudo?")])
+        
+        with mock.patch.object(assistant, 'GEMINI_API_KEY', 'test-key'), \
+                mock.patch.object(assistant.model_registry, 'get', return_value=fake_model):
+            response = self.client.post(
+                '/api/chat/stream',
+                json={'message': 'Hola, tienen el reloj en azul', 'history': []}
+            )
+            body = response.get_data(as_text=True)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.mimetype.startswith('text/event-stream'))
+        chunks = [json.loads(line[5:]) for line in body.splitlines() if line.startswith('data:')]
+        self.assertEqual(chunks[0], {'text': 'Hola, '})
+        self.assertEqual(chunks[-1]['response'], 'Hola, ¿en qué te ayudo?')
+        self.assertEqual(len(chunks[-1]['history']), 2)
+        assistant.response_cache.clear()
+        assistant.semantic_cache.clear()
+        print("✓ Chat en streaming")
+    
+    def test_chat_endpoint_returns_history(self):
+        """Verifica el contrato {success, response, history} de /api/chat."""
+        response = self.client.post(
+            '/api/chat',
+            json={'message': 'precio', 'history': [{'sender': 'Asistente', 'text': 'Hola'}]}
+        )
+        data = response.get_json()
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertIn('precio', data['response'].lower())
+        self.assertEqual([m['sender'] for m in data['history']], ['Asistente', 'Usuario', 'Asistente'])
+        self.assertEqual(self.client.post('/api/chat', json={}).status_code, 400)
+        print("✓ Endpoint /api/chat")
+    
+    def test_chat_ignores_malformed_history_items(self):
+        """Verifica que turnos del historial que no son objetos se descarten en Flask y ASGI."""
+        import asyncio
+        from asgi import application
+        
+        cuerpo = {'message': 'precio', 'history': ['hola', 3, ['x'], None, {'sender': 'Asistente', 'text': 'Hola'}, 'precio']}
+        response = self.client.post('/api/chat', json=cuerpo)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['sender'] for m in response.get_json()['history']], ['Asistente', 'Usuario', 'Asistente'])
+        self.assertEqual(self.client.post('/api/chat', json=['precio']).status_code, 400)
+        
+        sent = []
+        
+        async def receive():
+            return {'type': 'http.request', 'body': json.dumps(cuerpo).encode(), 'more_body': False}
+        
+        async def send(message):
+            sent.append(message)
+        
+        asyncio.run(application({'type': 'http', 'method': 'POST', 'path': '/api/chat'}, receive, send))
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(len(json.loads(sent[1]['body'])['history']), 3)
+        print("✓ Historial malformado descartado sin error 500")
+    
+    def test_asgi_chat_awaits_async_generation(self):
+        """Verifica que el modo ASGI atiende /api/chat de forma asíncrona."""
+        import asyncio
+        from asgi import application
+        
+        sent = []
+        
+        async def receive():
+            return {'type': 'http.request', 'body': json.dumps({'message': 'precio'}).encode(), 'more_body': False}
+        
+        async def send(message):
+            sent.append(message)
+        
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api/chat'}
+        asyncio.run(application(scope, receive, send))
+        
+        self.assertEqual(sent[0]['status'], 200)
+        data = json.loads(sent[1]['body'])
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['history']), 2)
+        print("✓ Endpoint /api/chat en modo ASGI")
+    
     def test_json_response_format(self):
         """Verifica que se devuelven JSON correctamente."""
         response = self.client.post(
@@ -165,6 +384,919 @@ class TestFlaskApp(unittest.TestCase):
             print("⚠️  Respuesta no es JSON (puede ser OK según el endpoint)")
 
 
+class TestWebhookWorkerPool(unittest.TestCase):
+    """Test suite para el pool de procesamiento asíncrono de webhooks."""
+    
+    def test_pool_rejects_when_full_and_drains(self):
+        """Verifica el backpressure y el drenado ordenado al apagar."""
+        import threading
+        from services.webhook_queue import WebhookWorkerPool
+        
+        gate = threading.Event()
+        processed = []
+        pool = WebhookWorkerPool(workers=1, max_pending=2)
+        
+        def handler(value):
+            gate.wait(5)
+            processed.append(value)
+        
+        self.assertTrue(pool.submit(handler, 1))
+        self.assertTrue(pool.submit(handler, 2))
+        self.assertFalse(pool.submit(handler, 3))
+        self.assertEqual(pool.stats()['rejected'], 1)
+        
+        gate.set()
+        self.assertTrue(pool.shutdown(timeout=5))
+        self.assertEqual(processed, [1, 2])
+        self.assertEqual(pool.stats()['completed'], 2)
+        self.assertFalse(pool.submit(handler, 4))
+        print("✓ Pool de webhooks: backpressure y drenado")
+
+    def test_exit_drain_runs_before_executor_join(self):
+        """Verifica que al salir se aplique WEBHOOK_DRAIN_TIMEOUT antes de esperar a los hilos."""
+        import os
+        import subprocess
+        import sys
+
+        script = (
+            "import time\n"
+            "from services.webhook_queue import get_webhook_pool\n"
+            "pool = get_webhook_pool()\n"
+            "pool.submit(lambda: (time.sleep(0.5), print('primero', flush=True)))\n"
+            "pool.submit(lambda: print('segundo', flush=True))\n"
+        )
+        env = dict(os.environ, WEBHOOK_WORKERS='1', WEBHOOK_DRAIN_TIMEOUT='0.1')
+        salida = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=30,
+                                env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(salida.returncode, 0, salida.stderr)
+        # El trabajo en curso termina; el encolado se cancela al vencer el plazo de drenado
+        self.assertIn('primero', salida.stdout)
+        self.assertNotIn('segundo', salida.stdout)
+        print("✓ Drenado de webhooks antes de la espera del executor")
+
+
+class TestSessionStore(unittest.TestCase):
+    """Test suite para el historial por remitente."""
+    
+    def _check_store(self, store):
+        for i in range(5):
+            store.append_turn('whatsapp:+1', f'pregunta {i}', f'respuesta {i}')
+        store.append_turn('whatsapp:+2', 'hola', 'hola!')
+        
+        history = store.get_history('whatsapp:+1')
+        self.assertEqual(len(history), 4)
+        self.assertEqual(history[0], {'sender': 'Usuario', 'text': 'pregunta 3'})
+        self.assertEqual(history[-1], {'sender': 'Asistente', 'text': 'respuesta 4'})
+        
+        store.clear('whatsapp:+1')
+        self.assertEqual(store.get_history('whatsapp:+1'), [])
+        self.assertEqual(len(store.get_history('whatsapp:+2')), 2)
+    
+    def test_memory_store_keeps_bounded_window(self):
+        """Verifica la ventana acotada y el TTL del backend en memoria."""
+        from services.sessions import MemorySessionStore
+        
+        self._check_store(MemorySessionStore(max_turns=2))
+        
+        expired = MemorySessionStore(max_turns=2, ttl=0)
+        expired.append_turn('whatsapp:+1', 'hola', 'hola!')
+        self.assertEqual(expired.get_history('whatsapp:+1'), [])
+        print("✓ Historial en memoria acotado")
+
+    def test_incomplete_store_fails_on_construction(self):
+        """Verifica que un backend de historial incompleto falle al crearse."""
+        from services.sessions import SessionStore
+        
+        class SinBorrar(SessionStore):
+            def get_history(self, sender):
+                return []
+            
+            def append(self, sender, role, text):
+                pass
+        
+        with self.assertRaises(TypeError):
+            SinBorrar()
+        print("✓ Backend de historial incompleto rechazado al crearse")
+    
+    def test_memory_store_concurrent_appends_keep_every_turn(self):
+        """Verifica que los mensajes simultáneos de un remitente no se pierdan."""
+        import threading
+        from unittest import mock
+        from services.cache import TTLCache
+        from services.sessions import MemorySessionStore
+
+        store = MemorySessionStore(max_turns=50)
+        get_original = TTLCache.get
+
+        def get_lento(cache, key, *args, **kwargs):
+            # Ensancha la ventana entre leer y reinsertar para forzar el cruce
+            window = get_original(cache, key, *args, **kwargs)
+            threading.Event().wait(0.01)
+            return window
+
+        barrera = threading.Barrier(8)
+
+        def escribir(i):
+            barrera.wait()
+            store.append('whatsapp:+1', 'Usuario', f'mensaje {i}')
+
+        with mock.patch.object(TTLCache, 'get', get_lento):
+            hilos = [threading.Thread(target=escribir, args=(i,)) for i in range(8)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+
+        textos = {turno['text'] for turno in store.get_history('whatsapp:+1')}
+        self.assertEqual(textos, {f'mensaje {i}' for i in range(8)})
+        print("✓ Historial en memoria sin turnos perdidos bajo concurrencia")
+    
+    def test_sqlite_store_keeps_bounded_window(self):
+        """Verifica el backend SQLite compartido entre workers."""
+        import tempfile
+        from services.sessions import SQLiteSessionStore
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            self._check_store(SQLiteSessionStore(os.path.join(tmp, 'sesiones.db'), max_turns=2))
+        print("✓ Historial en SQLite acotado")
+
+
+class TestOutboundMessenger(unittest.TestCase):
+    """Test suite para el servicio de envío saliente."""
+    
+    def test_messenger_keeps_order_per_recipient(self):
+        """Verifica el paralelismo acotado y el orden por destinatario."""
+        import threading
+        import time
+        from unittest import mock
+        from services.messaging import OutboundMessenger, QueueFull
+        
+        lock = threading.Lock()
+        gate = threading.Event()
+        sent = []
+        active = [0, 0]
+        
+        def create(**params):
+            gate.wait(5)
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+                sent.append((params['to'], params['body']))
+            return mock.Mock(sid=f"SM{params['body']}")
+        
+        client = mock.Mock()
+        client.messages.create.side_effect = create
+        messenger = OutboundMessenger(client, parallelism=3, max_queue=40)
+        
+        futures = []
+        with self.assertRaises(QueueFull):
+            for i in range(100):
+                futures.append(messenger.submit(f'whatsapp:+{i % 4}', str(i)))
+        self.assertGreaterEqual(len(futures), 40)
+        self.assertLessEqual(len(futures), 43)
+        
+        gate.set()
+        last = len(futures) - 1
+        self.assertEqual(futures[last].result(5).sid, f'SM{last}')
+        messenger.shutdown(5)
+        
+        for recipient in range(4):
+            bodies = [int(b) for to, b in sent if to == f'whatsapp:+{recipient}']
+            self.assertEqual(bodies, sorted(bodies))
+        self.assertEqual(len(sent), len(futures))
+        self.assertLessEqual(active[1], 3)
+        self.assertGreater(active[1], 1)
+        self.assertEqual(messenger.stats()['rejected'], 1)
+        print(f"✓ Envío concurrente ({active[1]} en paralelo) con orden por destinatario")
+    
+    def test_broadcast_renders_and_tracks_progress(self):
+        """Verifica la difusión masiva: plantilla, inválidos y avance."""
+        import time
+        from unittest import mock
+        from services.broadcast import Broadcaster, prepare_recipients
+        from services.messaging import OutboundMessenger
+        
+        client = mock.Mock()
+        client.messages.create.side_effect = lambda **p: mock.Mock(sid='SM1')
+        messenger = OutboundMessenger(client, parallelism=4, max_queue=5)
+        
+        items = [{'phone': f'+5730000{i:02d}', 'vars': {'nombre': f'U{i}'}} for i in range(30)]
+        items.append({'phone': '+573009999', 'message': 'Mensaje propio'})
+        items.append({'vars': {'nombre': 'sin telefono'}})
+        messages, invalid = prepare_recipients(items, 'Hola {nombre}, {estado}')
+        self.assertEqual(len(messages), 31)
+        self.assertEqual(len(invalid), 1)
+        self.assertEqual(messages[0], ('whatsapp:+573000000', 'Hola U0, {estado}'))
+        
+        job = Broadcaster(messenger, rate_per_sec=1000, from_='whatsapp:+1').start(messages, invalid)
+        for _ in range(200):
+            if job.to_dict()['status'] == 'completado':
+                break
+            time.sleep(0.02)
+        messenger.shutdown(5)
+        
+        state = job.to_dict()
+        self.assertEqual(state['status'], 'completado')
+        self.assertEqual((state['total'], state['sent'], state['failed']), (32, 31, 1))
+        self.assertEqual(state['pending'], 0)
+        self.assertEqual(client.messages.create.call_count, 31)
+        print("✓ Difusión con plantilla completada respetando la cola acotada")
+    
+    def test_broadcast_leaves_queue_room_for_webhook_replies(self):
+        """Verifica que una difusión con Twilio lento no llene la cola de las respuestas."""
+        import threading
+        import time
+        from unittest import mock
+        from services.broadcast import Broadcaster
+        from services.messaging import OutboundMessenger
+        
+        lento = threading.Event()
+        client = mock.Mock()
+        client.messages.create.side_effect = lambda **p: (lento.wait(5), mock.Mock(sid='SM1'))[1]
+        messenger = OutboundMessenger(client, parallelism=2, max_queue=6)
+        messages = [(f'whatsapp:+5730000{i:02d}', 'Promo') for i in range(20)]
+        
+        job = Broadcaster(messenger, rate_per_sec=1000, max_queued=3).start(messages, [])
+        for _ in range(50):
+            if job.to_dict()['submitted'] >= 3:
+                break
+            time.sleep(0.01)
+        time.sleep(0.1)
+        self.assertEqual(job.to_dict()['submitted'], 3)
+        
+        # Las respuestas de los webhooks siguen teniendo lugar en la cola
+        respuestas = [messenger.submit(f'whatsapp:+5799{i}', 'Respuesta') for i in range(3)]
+        lento.set()
+        for respuesta in respuestas:
+            self.assertEqual(respuesta.result(5).sid, 'SM1')
+        for _ in range(200):
+            if job.to_dict()['status'] == 'completado':
+                break
+            time.sleep(0.02)
+        messenger.shutdown(5)
+        
+        self.assertEqual(job.to_dict()['sent'], 20)
+        self.assertEqual(messenger.stats()['rejected'], 0)
+        print("✓ Difusión con tope propio en la cola de envío")
+
+
+class TestRateLimit(unittest.TestCase):
+    """Test suite para la regulación de llamadas a Gemini."""
+    
+    def test_governor_limits_concurrency_and_queue_time(self):
+        """Verifica el tope de concurrencia, la espera en cola y el rechazo por plazo."""
+        import threading
+        import time
+        from services.rate_limit import CallGovernor, RateLimited
+        
+        governor = CallGovernor(None, max_concurrent=2, max_wait=1.0)
+        lock = threading.Lock()
+        active = [0, 0]
+        
+        def call():
+            with governor.slot():
+                with lock:
+                    active[0] += 1
+                    active[1] = max(active[1], active[0])
+                time.sleep(0.05)
+                with lock:
+                    active[0] -= 1
+        
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        
+        stats = governor.stats()
+        self.assertEqual(active[1], 2)
+        self.assertEqual(stats['admitted'], 6)
+        self.assertGreater(stats['max_queued_ms'], 30)
+        
+        with governor.slot(), governor.slot():
+            with self.assertRaises(RateLimited):
+                governor.acquire(timeout=0.05)
+        self.assertEqual(governor.stats()['rejected'], 1)
+        self.assertEqual(governor.stats()['in_flight'], 0)
+        print(f"✓ Concurrencia acotada (espera máxima {stats['max_queued_ms']} ms)")
+    
+    def test_shared_bucket_across_instances(self):
+        """Verifica que dos instancias sobre el mismo archivo compartan las fichas."""
+        import asyncio
+        import tempfile
+        from services.rate_limit import CallGovernor, RateLimited, SharedTokenBucket
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'limitador.db')
+            worker_a = SharedTokenBucket(path, rate=0.5, capacity=3, name='gemini')
+            worker_b = SharedTokenBucket(path, rate=0.5, capacity=3, name='gemini')
+            
+            self.assertEqual(worker_a.try_acquire(), 0.0)
+            self.assertEqual(worker_b.try_acquire(), 0.0)
+            self.assertEqual(worker_a.try_acquire(), 0.0)
+            self.assertGreater(worker_b.try_acquire(), 1.0)
+            
+            governor = CallGovernor(worker_b, max_concurrent=1, max_wait=0.1)
+            
+            async def llamar():
+                async with governor.slot_async():
+                    pass
+            
+            with self.assertRaises(RateLimited):
+                asyncio.run(llamar())
+            self.assertEqual(governor.stats()['rejected'], 1)
+        print("✓ Tasa compartida entre workers mediante SQLite")
+    
+    def test_generate_response_degrades_when_saturated(self):
+        """Verifica que sin turno se use el respaldo local en vez de fallar."""
+        from unittest import mock
+        from model import assistant
+        from services.rate_limit import CallGovernor
+        
+        model = mock.Mock()
+        saturated = CallGovernor(None, max_concurrent=1, max_wait=0.05)
+        with mock.patch.object(assistant, 'gemini_limiter', saturated), \
+                mock.patch.object(assistant.model_registry, 'get', return_value=model):
+            with saturated.slot():
+                reply = assistant.generate_response('¿Qué laptop me recomiendas para diseño?', api_key='test-key', use_cache=False)
+        
+        model.generate_content.assert_not_called()
+        self.assertIn('NovaGadgets', reply)
+        print("✓ Respaldo local cuando el proveedor está saturado")
+
+
+class TestResilience(unittest.TestCase):
+    """Test suite para el circuit breaker y las llamadas con plazo."""
+    
+    def test_breaker_opens_and_probes(self):
+        """Verifica apertura por errores y lentitud, corte inmediato y prueba semiabierta."""
+        import time
+        from services.resilience import CircuitBreaker, CircuitOpen
+        
+        breaker = CircuitBreaker('test', window=4, min_calls=4, error_rate=0.5,
+                                 slow_seconds=1.0, slow_rate=0.75, open_seconds=0.1)
+        for ok in (True, False, True, False):
+            breaker.record(ok, 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpen):
+            breaker.allow()
+        
+        time.sleep(0.12)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with breaker.guard():
+            with self.assertRaises(CircuitOpen):
+                breaker.allow()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        
+        for _ in range(4):
+            breaker.record(True, 2.0)
+        stats = breaker.stats()
+        self.assertEqual(stats['state'], CircuitBreaker.OPEN)
+        self.assertEqual(stats['opened'], 2)
+        self.assertEqual(stats['short_circuited'], 2)
+        print("✓ Circuit breaker abre, corta y se recupera con una prueba")
+    
+    def test_call_with_deadline_hedges_and_retries(self):
+        """Verifica el plazo total, el intento paralelo y el reintento tras un fallo."""
+        import asyncio
+        import itertools
+        import time
+        from services.resilience import DeadlineExceeded, call_with_deadline, call_with_deadline_async
+        
+        with self.assertRaises(DeadlineExceeded):
+            call_with_deadline(lambda: time.sleep(0.5), timeout=0.05)
+        
+        delays = iter([0.5, 0.01])
+        started = time.monotonic()
+        winner = call_with_deadline(lambda: (lambda d: (time.sleep(d), d)[1])(next(delays)),
+                                    timeout=1.0, hedge_after=0.05, max_attempts=2)
+        self.assertEqual(winner, 0.01)
+        self.assertLess(time.monotonic() - started, 0.3)
+        
+        calls = itertools.count()
+        
+        def inestable():
+            if next(calls) == 0:
+                raise ConnectionError('fallo transitorio')
+            return 'ok'
+        
+        self.assertEqual(call_with_deadline(inestable, timeout=1.0, max_attempts=2), 'ok')
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(call_with_deadline_async(lambda: asyncio.sleep(0.5), timeout=0.05))
+        print("✓ Llamadas con plazo, intento paralelo y reintento")
+
+    def test_call_with_deadline_holds_limiter_slot_until_attempt_ends(self):
+        """Verifica que un intento abandonado conserve su turno y que cada intento pida el suyo."""
+        import threading
+        import time
+        from services.rate_limit import CallGovernor, RateLimited
+        from services.resilience import DeadlineExceeded, call_with_deadline
+
+        limiter = CallGovernor(None, max_concurrent=2, max_wait=0.05)
+        liberar = threading.Event()
+        llamadas = []
+
+        def lenta():
+            llamadas.append(1)
+            liberar.wait(2)
+
+        with self.assertRaises(DeadlineExceeded):
+            call_with_deadline(lenta, timeout=0.1, hedge_after=0.02, max_attempts=3, limiter=limiter)
+        # Dos intentos (el tercero no tuvo turno) siguen corriendo con su turno tomado
+        self.assertEqual(len(llamadas), 2)
+        self.assertEqual(limiter.stats()['in_flight'], 2)
+        with self.assertRaises(RateLimited):
+            call_with_deadline(lambda: 'ok', timeout=1.0, limiter=limiter)
+
+        liberar.set()
+        for _ in range(100):
+            if limiter.stats()['in_flight'] == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+        self.assertEqual(call_with_deadline(lambda: 'ok', timeout=1.0, limiter=limiter), 'ok')
+        print("✓ Turno del limitador retenido hasta que termina cada intento")
+
+    def test_generate_response_short_circuits_when_open(self):
+        """Verifica que con el circuito abierto no se llame a Gemini."""
+        from unittest import mock
+        from model import assistant
+        from services.resilience import CircuitBreaker
+        
+        model = mock.Mock()
+        breaker = CircuitBreaker('gemini', min_calls=1, open_seconds=60)
+        breaker.record(False, 0.0)
+        with mock.patch.object(assistant, 'gemini_breaker', breaker), \
+                mock.patch.object(assistant.model_registry, 'get', return_value=model):
+            reply = assistant.generate_response('¿Qué laptop me recomiendas para diseño?', api_key='test-key', use_cache=False)
+            chunks = list(assistant.generate_response_stream('¿Y para programar?', api_key='test-key', use_cache=False))
+        
+        model.generate_content.assert_not_called()
+        self.assertIn('NovaGadgets', reply)
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(breaker.stats()['short_circuited'], 2)
+        print("✓ Respaldo local inmediato con el circuito abierto")
+
+    def test_saturated_limiter_does_not_open_breaker(self):
+        """Verifica que el rechazo local por cola llena no abra el circuito ni cuente como lento."""
+        import threading
+        from unittest import mock
+        from model import assistant
+        from services.rate_limit import CallGovernor
+        from services.resilience import CircuitBreaker, call_with_deadline
+
+        model = mock.Mock()
+        limiter = CallGovernor(None, max_concurrent=1, max_wait=0.05)
+        breaker = CircuitBreaker('gemini', min_calls=3, slow_seconds=0.1, open_seconds=60)
+        limiter.acquire()
+        try:
+            with mock.patch.object(assistant, 'gemini_limiter', limiter), \
+                    mock.patch.object(assistant, 'gemini_breaker', breaker), \
+                    mock.patch.object(assistant.model_registry, 'get', return_value=model):
+                for _ in range(4):
+                    assistant.generate_response('¿Qué laptop me recomiendas para diseño?', api_key='test-key', use_cache=False)
+        finally:
+            limiter.release()
+
+        model.generate_content.assert_not_called()
+        self.assertEqual(breaker.stats()['state'], CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()['failures'], 0)
+
+        # La espera en cola no cuenta para la latencia registrada
+        lento = CallGovernor(None, max_concurrent=1, max_wait=1.0)
+        lento.acquire()
+        threading.Timer(0.2, lento.release).start()
+        self.assertEqual(call_with_deadline(lambda: 'ok', timeout=2.0, limiter=lento, breaker=breaker), 'ok')
+        self.assertEqual(breaker.stats()['slow_calls'], 0)
+        print("✓ Cola local saturada sin abrir el circuito")
+
+    def test_stream_closes_provider_stream_after_chunk_timeout(self):
+        """Verifica que un stream detenido se corte por plazo, se cierre y libere su turno."""
+        import threading
+        from unittest import mock
+        from model import assistant
+        from services.rate_limit import CallGovernor
+        from services.resilience import CircuitBreaker
+
+        atascado = threading.Event()
+
+        class StreamLento:
+            def __init__(self):
+                self.close = mock.Mock(side_effect=atascado.set)
+
+            def __iter__(self):
+                yield mock.Mock(text='Hola')
+                atascado.wait(2)
+                yield mock.Mock(text=' tarde')
+
+        stream = StreamLento()
+        model = mock.Mock()
+        model.generate_content.return_value = stream
+        limiter = CallGovernor(None, max_concurrent=1, max_wait=5.0)
+        breaker = CircuitBreaker('gemini', min_calls=10)
+        with mock.patch.object(assistant, 'gemini_limiter', limiter), \
+                mock.patch.object(assistant, 'gemini_breaker', breaker), \
+                mock.patch.object(assistant, 'GEMINI_CALL_TIMEOUT', 0.2), \
+                mock.patch.object(assistant.model_registry, 'get', return_value=model):
+            chunks = list(assistant.generate_response_stream('¿Qué audífonos tienen?', api_key='test-key', use_cache=False))
+
+        self.assertEqual(chunks, ['Hola'])
+        stream.close.assert_called_once()
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+        self.assertEqual(breaker.stats()['failures'], 1)
+        print("✓ Stream cortado por plazo por fragmento")
+
+    def test_stream_slot_wait_respects_active_deadline(self):
+        """Verifica que la espera de turno del stream no pase del plazo activo."""
+        import time
+        from unittest import mock
+        from model import assistant
+        from services.deadline import Deadline, deadline_scope
+        from services.rate_limit import CallGovernor
+
+        model = mock.Mock()
+        limiter = CallGovernor(None, max_concurrent=1, max_wait=5.0)
+        limiter.acquire()
+        try:
+            with mock.patch.object(assistant, 'gemini_limiter', limiter), \
+                    mock.patch.object(assistant.model_registry, 'get', return_value=model):
+                started = time.monotonic()
+                with deadline_scope(Deadline(1.3)):
+                    chunks = list(assistant.generate_response_stream('¿Y para programar?', api_key='test-key', use_cache=False))
+                elapsed = time.monotonic() - started
+        finally:
+            limiter.release()
+
+        model.generate_content.assert_not_called()
+        self.assertEqual(len(chunks), 1)
+        self.assertLess(elapsed, 2.0)
+        print("✓ Espera de turno del stream acotada por el plazo")
+
+
+class TestDeadline(unittest.TestCase):
+    """Test suite para el plazo por petición."""
+    
+    def test_deadline_scope_and_remaining_timeout(self):
+        """Verifica el plazo activo, la reserva y el error al estar vencido."""
+        import time
+        from services.deadline import Deadline, deadline_scope, remaining_timeout, reserving, run_with_deadline
+        from services.resilience import DeadlineExceeded
+        
+        self.assertEqual(remaining_timeout(10), 10)
+        with deadline_scope(Deadline(5)):
+            self.assertLessEqual(remaining_timeout(10), 5)
+            self.assertEqual(remaining_timeout(1), 1)
+            with reserving(2):
+                self.assertLessEqual(remaining_timeout(), 3)
+        self.assertIsNone(remaining_timeout())
+        
+        expired = Deadline(0.01)
+        time.sleep(0.02)
+        with deadline_scope(expired), self.assertRaises(DeadlineExceeded):
+            remaining_timeout(10)
+        self.assertIsNone(run_with_deadline(expired, self.fail, 'no debe ejecutarse'))
+        print("✓ Plazo por petición con reserva")
+
+    def test_expired_webhook_job_releases_message_sid(self):
+        """Verifica que un webhook vencido en cola libere su MessageSid para el reintento."""
+        import time
+        from unittest import mock
+        from app import app
+        import routes.whatsapp as whatsapp
+        from services.deadline import Deadline
+        from services.dedup import NEW, MemoryWebhookDedup
+
+        dedup = MemoryWebhookDedup()
+        vencido = Deadline(0.01)
+        time.sleep(0.02)
+        pool = mock.Mock()
+        # El pool corre el trabajo recién cuando el plazo ya venció
+        pool.submit.side_effect = lambda fn, *args: (fn(*args), True)[1]
+        responder = mock.Mock()
+        with mock.patch.object(whatsapp, 'WEBHOOK_ASYNC', True), \
+                mock.patch.object(whatsapp, 'messenger', mock.Mock()), \
+                mock.patch.object(whatsapp, 'get_webhook_dedup', return_value=dedup), \
+                mock.patch.object(whatsapp, 'get_webhook_pool', return_value=pool), \
+                mock.patch.object(whatsapp, 'Deadline', return_value=vencido), \
+                mock.patch.object(whatsapp, '_responder_por_whatsapp', responder):
+            response = app.test_client().post('/api/whatsapp/webhook', data={
+                'Body': 'hola', 'From': 'whatsapp:+570001', 'MessageSid': 'SMvencido'})
+
+        self.assertEqual(response.status_code, 200)
+        responder.assert_not_called()
+        self.assertEqual(dedup.begin('SMvencido')[0], NEW)
+        print("✓ Trabajo vencido en cola libera el MessageSid")
+    
+    def test_messenger_skips_expired_messages(self):
+        """Verifica que no se envíen mensajes cuyo plazo venció en la cola."""
+        import threading
+        import time
+        from unittest import mock
+        from services.deadline import Deadline, deadline_scope
+        from services.messaging import OutboundMessenger
+        from services.resilience import DeadlineExceeded
+        
+        gate = threading.Event()
+        client = mock.Mock()
+        client.messages.create.side_effect = lambda **p: (gate.wait(5), mock.Mock(sid='SM1'))[1]
+        messenger = OutboundMessenger(client, parallelism=1, max_queue=10)
+        
+        first = messenger.submit('whatsapp:+1', 'primero')
+        with deadline_scope(Deadline(0.05)):
+            late = messenger.submit('whatsapp:+1', 'tarde')
+        time.sleep(0.1)
+        gate.set()
+        
+        self.assertEqual(first.result(5).sid, 'SM1')
+        with self.assertRaises(DeadlineExceeded):
+            late.result(5)
+        messenger.shutdown(5)
+        self.assertEqual(client.messages.create.call_count, 1)
+        self.assertEqual(messenger.stats()['expired'], 1)
+        print("✓ Mensajes con plazo vencido no se envían")
+    
+    def test_generate_response_skips_provider_without_budget(self):
+        """Verifica que sin plazo suficiente se responda localmente."""
+        from unittest import mock
+        from model import assistant
+        from services.deadline import Deadline, deadline_scope
+        
+        model = mock.Mock()
+        with mock.patch.object(assistant.model_registry, 'get', return_value=model), \
+                deadline_scope(Deadline(0.5)):
+            reply = assistant.generate_response('¿Qué laptop me recomiendas para diseño?', api_key='test-key', use_cache=False)
+        
+        model.generate_content.assert_not_called()
+        self.assertIn('NovaGadgets', reply)
+        print("✓ Sin llamada al proveedor cuando el plazo no alcanza")
+
+
+class TestWebhookDedup(unittest.TestCase):
+    """Test suite para la deduplicación de webhooks por MessageSid."""
+    
+    def _check_backend(self, dedup):
+        import threading
+        from services.dedup import DONE, IN_FLIGHT, NEW
+        
+        self.assertEqual(dedup.begin('SM1'), (NEW, None))
+        self.assertEqual(dedup.begin('SM1'), (IN_FLIGHT, None))
+        dedup.fail('SM1')
+        self.assertEqual(dedup.begin('SM1')[0], NEW)
+        
+        threading.Timer(0.05, dedup.complete, args=('SM1', 'Respuesta')).start()
+        self.assertEqual(dedup.wait_for('SM1', 2), 'Respuesta')
+        self.assertEqual(dedup.begin('SM1'), (DONE, 'Respuesta'))
+        self.assertEqual(dedup.begin(''), (NEW, None))
+        self.assertEqual(dedup.stats()['duplicates'], 1)
+    
+    def test_incomplete_backend_fails_on_construction(self):
+        """Verifica que un backend sin todas las operaciones falle al crearse, no en el primer webhook."""
+        from services.dedup import SQLWebhookDedup, WebhookDedup
+        
+        class SinLiberar(WebhookDedup):
+            def _claim(self, sid, now):
+                return 'nuevo', None
+            
+            def _lookup(self, sid):
+                return None, None
+            
+            def _store(self, sid, reply):
+                pass
+        
+        with self.assertRaises(TypeError):
+            SinLiberar()
+        with self.assertRaises(TypeError):
+            SQLWebhookDedup()
+        print("✓ Backend de deduplicación incompleto rechazado al crearse")
+    
+    def test_memory_and_sqlite_backends(self):
+        """Verifica reclamo, en curso, liberación y respuesta guardada."""
+        import tempfile
+        import time
+        from services.dedup import DONE, NEW, MemoryWebhookDedup, SQLiteWebhookDedup
+        
+        self._check_backend(MemoryWebhookDedup(ttl=60, inflight_timeout=10))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'dedup.db')
+            self._check_backend(SQLiteWebhookDedup(path, ttl=60, inflight_timeout=10))
+            
+            # Otro worker ve la respuesta y retoma reclamos abandonados
+            worker_a = SQLiteWebhookDedup(path, ttl=60, inflight_timeout=0.05)
+            worker_b = SQLiteWebhookDedup(path, ttl=60, inflight_timeout=0.05)
+            self.assertEqual(worker_b.begin('SM1'), (DONE, 'Respuesta'))
+            self.assertEqual(worker_a.begin('SM2')[0], NEW)
+            time.sleep(0.1)
+            self.assertEqual(worker_b.begin('SM2')[0], NEW)
+            self.assertEqual(worker_b.stats()['reclaimed'], 1)
+        print("✓ Deduplicación en memoria y SQLite")
+    
+    def test_webhook_retry_reuses_reply(self):
+        """Verifica que un reintento de Twilio no vuelva a generar la respuesta."""
+        from unittest import mock
+        from app import app
+        import routes.whatsapp as whatsapp
+        from services.dedup import MemoryWebhookDedup
+        
+        client = app.test_client()
+        data = {'Body': '¿Tienen el Pulse Pro en negro?', 'From': 'whatsapp:+570001', 'MessageSid': 'SMretry1'}
+        with mock.patch.object(whatsapp, 'get_webhook_dedup', return_value=MemoryWebhookDedup()), \
+                mock.patch.object(whatsapp, 'WEBHOOK_ASYNC', False), \
+                mock.patch.object(whatsapp, 'generate_response', return_value='Sí, hay stock') as generate:
+            first = client.post('/api/whatsapp/webhook', data=data)
+            retry = client.post('/api/whatsapp/webhook', data=data)
+        
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.data, retry.data)
+        self.assertIn('Sí, hay stock', retry.get_data(as_text=True))
+        print("✓ Reintento del webhook responde desde la deduplicación")
+
+
+class TestStatusCallbacks(unittest.TestCase):
+    """Test suite para el registro por lotes de los callbacks de estado."""
+    
+    def test_buffer_flushes_by_size_time_and_shutdown(self):
+        """Verifica los lotes por tamaño, por tiempo, el reintento y el vaciado al apagar."""
+        import time
+        from services.delivery_status import StatusBuffer
+        
+        batches = []
+        fail = [True]
+        
+        def writer(rows):
+            if fail[0]:
+                fail[0] = False
+                raise ConnectionError('base de datos caída')
+            batches.append(list(rows))
+        
+        buffer = StatusBuffer(writer, batch_size=3, flush_interval=0.05, max_buffer=10)
+        for i in range(7):
+            buffer.add(f'SM{i}', 'delivered', 'whatsapp:+57300')
+        for _ in range(100):
+            if buffer.stats()['written'] >= 6:
+                break
+            time.sleep(0.01)
+        self.assertEqual([len(b) for b in batches][:2], [3, 3])
+        self.assertEqual(buffer.stats()['errors'], 1)
+        
+        buffer.flush_interval = 60
+        buffer.add('SM7', 'read')
+        buffer.shutdown(2)
+        stats = buffer.stats()
+        self.assertEqual(stats['written'], 8)
+        self.assertEqual(stats['buffered'], 0)
+        self.assertEqual([row[0] for b in batches for row in b], [f'SM{i}' for i in range(8)])
+        print(f"✓ Estados escritos en {stats['batches']} lotes")
+    
+    def test_status_route_persists_to_sqlite(self):
+        """Verifica que /api/whatsapp/status termine en la tabla indexada."""
+        import sqlite3
+        import tempfile
+        from unittest import mock
+        from app import app
+        import routes.whatsapp as whatsapp
+        from services.delivery_status import SQLiteStatusWriter, StatusBuffer
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'estados.db')
+            buffer = StatusBuffer(SQLiteStatusWriter(path), batch_size=50, flush_interval=60)
+            client = app.test_client()
+            with mock.patch.object(whatsapp, 'get_status_buffer', return_value=buffer):
+                for status in ('sent', 'delivered', 'read'):
+                    response = client.post('/api/whatsapp/status', data={
+                        'MessageSid': 'SMabc', 'MessageStatus': status, 'To': 'whatsapp:+57300'})
+                    self.assertEqual(response.status_code, 200)
+            buffer.shutdown(2)
+            
+            conn = sqlite3.connect(path)
+            rows = conn.execute(
+                "SELECT estado FROM estados_mensajes WHERE message_sid = ? ORDER BY id", ('SMabc',)).fetchall()
+            plan = ' '.join(r[-1] for r in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT estado FROM estados_mensajes WHERE message_sid = ?", ('SMabc',)))
+            conn.close()
+        self.assertEqual([r[0] for r in rows], ['sent', 'delivered', 'read'])
+        self.assertIn('idx_estado_sid', plan)
+        self.assertEqual(buffer.stats()['batches'], 1)
+        print("✓ Callbacks de estado persistidos en un solo lote")
+
+    def test_health_check_does_not_create_status_storage(self):
+        """Verifica que GET /test no cree el buffer de estados ni su archivo."""
+        from unittest import mock
+        from app import app
+        from services import delivery_status
+
+        with mock.patch.object(delivery_status, '_buffer', None), \
+                mock.patch.object(delivery_status, 'SQLiteStatusWriter') as writer:
+            response = app.test_client().get('/test')
+            self.assertIsNone(delivery_status._buffer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status_callbacks'], 'sin uso')
+        writer.assert_not_called()
+        print("✓ /test no crea almacenamiento de estados")
+
+
+class TestTramiteStatus(unittest.TestCase):
+    """Test suite para la consulta de estado de trámites sin LLM."""
+    
+    def _lookup(self, filas):
+        from unittest import mock
+        from services.tramite_status import TramiteStatusLookup
+        
+        db = mock.Mock()
+        db.query_rows.return_value = filas
+        lookup = TramiteStatusLookup(limit=2, ttl=60)
+        patcher = mock.patch('config.mysqlconnections.connectToMySQL', return_value=db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return lookup, db
+    
+    def test_detects_status_intent(self):
+        """Verifica qué mensajes se consideran consultas de estado."""
+        from services.tramite_status import es_consulta_estado
+        
+        for mensaje in ('¿Cómo va mi trámite?', 'estado de mis tramites', 'Mi TRÁMITE ya está listo?'):
+            self.assertTrue(es_consulta_estado(mensaje), mensaje)
+        for mensaje in ('Quiero iniciar un trámite', 'hola', '¿cuál es el estado del envío?', ''):
+            self.assertFalse(es_consulta_estado(mensaje), mensaje)
+        print("✓ Detección de consultas de estado")
+    
+    def test_lookup_uses_index_query_and_caches_per_sender(self):
+        """Verifica la consulta indexada con LIMIT y el cache por remitente."""
+        from datetime import datetime
+        
+        lookup, db = self._lookup([(12, 'Licencia', 'en revisión', datetime(2024, 5, 2, 9, 0))])
+        primera = lookup.answer('whatsapp:+573001112233', '¿Cómo va mi trámite?')
+        segunda = lookup.answer('whatsapp:+573001112233', 'y el estado de mi trámite?')
+        
+        self.assertEqual(primera, segunda)
+        self.assertIn('#12 Licencia: en revisión (actualizado 02/05/2024)', primera)
+        self.assertEqual(db.query_rows.call_count, 1)
+        query, data = db.query_rows.call_args[0]
+        self.assertIn('WHERE usuario_whatsapp = %s ORDER BY fecha_creacion DESC, id DESC LIMIT %s', query)
+        self.assertEqual(data, ('+573001112233', 2))
+        
+        lookup.invalidate('+573001112233')
+        lookup.answer('whatsapp:+573001112233', '¿Cómo va mi trámite?')
+        self.assertEqual(db.query_rows.call_count, 2)
+        self.assertIsNone(lookup.answer('whatsapp:+573001112233', '¿Tienen stock?'))
+        
+        db.query_rows.return_value = False
+        self.assertIsNone(lookup.answer('whatsapp:+570009', 'estado de mi tramite'))
+        self.assertEqual(lookup.stats()['errors'], 1)
+        print("✓ Consulta por remitente con cache")
+    
+    def test_webhook_answers_status_without_llm(self):
+        """Verifica que el webhook responda el estado sin llamar a Gemini."""
+        from unittest import mock
+        from app import app
+        import routes.whatsapp as whatsapp
+        from services.dedup import MemoryWebhookDedup
+        
+        from twilio.request_validator import RequestValidator
+        import services.messaging as messaging
+        
+        lookup, _ = self._lookup([])
+        data = {'Body': '¿cómo van mis trámites?', 'From': 'whatsapp:+570002', 'MessageSid': 'SMestado1'}
+        firma = RequestValidator('token-test').compute_signature('http://localhost/api/whatsapp/webhook', data)
+        with mock.patch.object(messaging, 'TWILIO_AUTH_TOKEN', 'token-test'), \
+                mock.patch.object(whatsapp, 'get_tramite_status', return_value=lookup), \
+                mock.patch.object(whatsapp, 'get_webhook_dedup', return_value=MemoryWebhookDedup()), \
+                mock.patch.object(whatsapp, 'WEBHOOK_ASYNC', False), \
+                mock.patch.object(whatsapp, 'generate_response') as generate:
+            response = app.test_client().post('/api/whatsapp/webhook', data=data,
+                                              headers={'X-Twilio-Signature': firma})
+        
+        generate.assert_not_called()
+        self.assertIn('No encontramos trámites', response.get_data(as_text=True))
+        print("✓ Webhook responde el estado sin LLM")
+    
+    def test_webhook_skips_status_lookup_without_twilio_signature(self):
+        """Verifica que sin firma válida de Twilio no se consulte el estado por ``From``."""
+        from unittest import mock
+        from app import app
+        import routes.whatsapp as whatsapp
+        import services.messaging as messaging
+        from services.dedup import MemoryWebhookDedup
+        
+        lookup = mock.Mock()
+        with mock.patch.object(messaging, 'TWILIO_AUTH_TOKEN', 'token-test'), \
+                mock.patch.object(whatsapp, 'get_tramite_status', return_value=lookup), \
+                mock.patch.object(whatsapp, 'get_webhook_dedup', return_value=MemoryWebhookDedup()), \
+                mock.patch.object(whatsapp, 'WEBHOOK_ASYNC', False), \
+                mock.patch.object(whatsapp, 'generate_response', return_value='respuesta del LLM') as generate:
+            for i, firma in enumerate([None, 'firma-falsa']):
+                headers = {'X-Twilio-Signature': firma} if firma else {}
+                response = app.test_client().post('/api/whatsapp/webhook', headers=headers, data={
+                    'Body': '¿cómo van mis trámites?', 'From': 'whatsapp:+570002', 'MessageSid': f'SMfalso{i}'})
+                self.assertIn('respuesta del LLM', response.get_data(as_text=True))
+        
+        lookup.answer.assert_not_called()
+        self.assertEqual(generate.call_count, 2)
+        print("✓ Sin firma de Twilio no se consulta el estado de trámites")
+
+
 if __name__ == '__main__':
     print("\n" + "="*70)
     print("EJECUTANDO TESTS DE CHABOX WHATSAPP")
@@ -178,6 +1310,15 @@ if __name__ == '__main__':
     suite.addTests(loader.loadTestsFromTestCase(TestFlaskApp))
     suite.addTests(loader.loadTestsFromTestCase(TestAssistant))
     suite.addTests(loader.loadTestsFromTestCase(TestWhatsAppIntegration))
+    suite.addTests(loader.loadTestsFromTestCase(TestWebhookWorkerPool))
+    suite.addTests(loader.loadTestsFromTestCase(TestSessionStore))
+    suite.addTests(loader.loadTestsFromTestCase(TestOutboundMessenger))
+    suite.addTests(loader.loadTestsFromTestCase(TestRateLimit))
+    suite.addTests(loader.loadTestsFromTestCase(TestResilience))
+    suite.addTests(loader.loadTestsFromTestCase(TestDeadline))
+    suite.addTests(loader.loadTestsFromTestCase(TestWebhookDedup))
+    suite.addTests(loader.loadTestsFromTestCase(TestStatusCallbacks))
+    suite.addTests(loader.loadTestsFromTestCase(TestTramiteStatus))
     
     # Ejecutar
     runner = unittest.TextTestRunner(verbosity=2)